@@ -2,7 +2,8 @@ from threading import Thread, Semaphore
 from multiprocessing import Process, cpu_count
 from sys import exit as sysexit, version_info as sys_version_info
 from os import _exit as osexit
-from time import sleep, time
+
+import clock
 
 # =============================================
 # check min, python version
@@ -158,14 +159,14 @@ class RecurringTask(Thread):
     def run(self):
         """Start the recurring task."""
         if self.init_sec:
-            sleep(self.init_sec)
-        self._functime = time()
+            clock.sleep(self.init_sec)
+        self._functime = clock.time()
         while self._running:
-            start = time()
+            start = clock.time()
             self._func()
             self._functime += self.interval_sec
             if self._functime - start > 0:
-                sleep(self._functime - start)
+                clock.sleep(self._functime - start)
 
     def stop(self):
         """Stop the recurring task."""
@@ -0,0 +1,180 @@
+"""
+Day-long Kite session shared by every script on the machine.
+
+A Kite access token is good until 06:00 IST the next morning, but each
+script used to log in on every start (request token prompt, or the whole
+login + TOTP + redirect flow in buy_options). SessionCache keeps the
+day's token in a file readable only by the owner:
+
+    start       token file present, not expired and validated with a
+                profile() call (skipped when another process validated it
+                within the last `trust` seconds) -> no login
+    login       under an exclusive lock on <file>.lock, so processes
+                started together log in once: the first one runs `login`,
+                the rest wait on the lock and pick up the token it wrote
+    invalidate  kite.set_session_expiry_hook: a TokenException drops the
+                cached token so the next start logs in again
+
+An access token in the environment is used as is and never cached.
+Sharded workers get the parent's token with their kite_args and never
+log in themselves.
+
+    KITETRADE_SESSION_FILE=~/.kitetrade/session.json   token file (one per api key: the key is appended)
+"""
+import datetime as dt
+import fcntl
+import json
+import logging
+import os
+import time
+
+from kiteconnect.exceptions import TokenException
+
+IST = dt.timezone(dt.timedelta(hours=5, minutes=30))
+EXPIRY = dt.time(6, 0)  # tokens lapse at 06:00 IST
+
+
+def expiry(login_time):
+    """Epoch seconds at which a token issued at `login_time` (epoch seconds) expires."""
+    issued = dt.datetime.fromtimestamp(login_time, IST)
+    expires = dt.datetime.combine(issued.date(), EXPIRY, tzinfo=IST)
+    if issued >= expires:
+        expires += dt.timedelta(days=1)
+    return expires.timestamp()
+
+
+def prompt_login(api_secret):
+    """Login callable for SessionCache: prints the login url and reads the request token from stdin."""
+    def login(kite):
+        print(kite.login_url())
+        request_token = input("Enter request token: ")
+        return kite.generate_session(request_token, api_secret)["access_token"]
+    return login
+
+
+class SessionCache():
+    """
+    Access token of the day for one api key, on disk.
+
+    :Parameters:
+        kite : KiteConnect
+            session to authenticate; its api_key names the token file
+        login : callable
+            kite -> access token, run when there is no usable cached token
+        path : str
+            token file, defaults to KITETRADE_SESSION_FILE or ~/.kitetrade/session.json
+            with the api key appended
+        trust : float
+            seconds a validation by any process is taken on trust
+    """
+
+    def __init__(self, kite, login, path=None, trust=60, logger=None):
+        self.kite = kite
+        self.login = login
+        if path is None:
+            root, ext = os.path.splitext(os.path.expanduser(os.getenv("KITETRADE_SESSION_FILE", "~/.kitetrade/session.json")))
+            path = f"{root}-{kite.api_key}{ext}"
+        self.path = path
+        self.trust = trust
+        self.log = logger or logging.getLogger(__name__)
+
+    # ---------------------------------------------
+    def _read(self):
+        """Cached record when it belongs to this api key and has not expired, else None."""
+        try:
+            with open(self.path) as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.log.warning(f"session file {self.path} unreadable: {e}")
+            return None
+        if record.get("api_key") != self.kite.api_key or record.get("expires", 0) <= time.time():
+            return None
+        return record
+
+    def _write(self, record):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        tmp = self.path + ".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(record, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _valid(self, record):
+        """True when the token still works: trusted when recently validated, else asks profile()."""
+        if time.time() - record.get("validated", 0) < self.trust:
+            return True
+        self.kite.set_access_token(record["access_token"])
+        try:
+            self.kite.profile()
+        except TokenException as e:
+            self.log.info(f"cached session rejected: {e}")
+            return False
+        except Exception as e:
+            # a network error or rate limit is not worth a fresh login
+            self.log.warning(f"could not validate the cached session, using it anyway: {e}")
+            return True
+        record["validated"] = time.time()
+        try:
+            self._write(record)
+        except OSError as e:
+            self.log.warning(f"could not update {self.path}: {e}")
+        return True
+
+    # ---------------------------------------------
+    def token(self):
+        """Access token for kite, logging in only when the cached one is missing, expired or revoked."""
+        record = self._read()
+        if record and self._valid(record):
+            return record["access_token"]
+        stale = record["access_token"] if record else None
+        os.makedirs(os.path.dirname(self.path) or ".", mode=0o700, exist_ok=True)
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # whoever held the lock before us may have logged in already
+                record = self._read()
+                if record and record["access_token"] != stale and self._valid(record):
+                    return record["access_token"]
+                started = time.perf_counter()
+                access_token = self.login(self.kite)
+                now = time.time()
+                self._write({"api_key": self.kite.api_key, "access_token": access_token, "login": now,
+                             "validated": now, "expires": expiry(now)})
+                self.log.info(f"logged in in {time.perf_counter() - started:.1f}s, session cached in {self.path}")
+                return access_token
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def invalidate(self, access_token=None):
+        """Forget the cached token (only if it is still `access_token`, when given)."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                record = self._read()
+                if record and (access_token is None or record["access_token"] == access_token):
+                    os.remove(self.path)
+                    self.log.warning(f"cached session {self.path} invalidated")
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def authenticate(self):
+        """Set kite's access token from the cache (or a login) and drop the cache when Kite rejects it later."""
+        access_token = self.token()
+        self.kite.set_access_token(access_token)
+        self.kite.set_session_expiry_hook(lambda: self.invalidate(access_token))
+        return access_token
+
+
+def authenticate(kite, login, access_token=None, logger=None):
+    """Access token from the environment when given, else from the session cache; sets it on kite."""
+    if access_token:
+        kite.set_access_token(access_token)
+        return access_token
+    return SessionCache(kite, login, logger=logger).authenticate()
@@ -0,0 +1,130 @@
+"""
+Shared pieces of the strategy backtesters.
+
+The strategy scripts all run the same order logic through signals.evaluate():
+a flat instrument enters at the bar close when its long/short rule holds,
+with a stop at long_stop/short_stop, and an open position trails its stop to
+the current value every bar. simulate() replays that over precomputed
+per-bar signal arrays, so a backtester only has to turn candles into those
+arrays (vectorized where it can) and hand them over.
+
+  * stops fill at the trigger, or at the bar open when it gaps through
+  * no entries at or after the square off time, open positions are closed
+    at the close of that bar (or the last bar of the session)
+"""
+import numpy as np
+import pandas as pd
+
+import kpi
+from bars import aggregate
+
+TRADE_COLUMNS = ["entry_time", "exit_time", "side", "quantity", "entry", "exit", "pnl", "reason"]
+
+
+def load_history(path):
+    """Kite historical_data style candles (date, open, high, low, close, volume) or ticks (date, last_price)."""
+    df = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path, parse_dates=["date"])
+    if "date" in df.columns:
+        df = df.set_index("date")
+    df.index = pd.DatetimeIndex(df.index).tz_localize(None)
+    return df.sort_index()
+
+
+def session_bars(bars, minutes):
+    """Resample candles to `minutes` bars aligned to the 09:15 session open, labelled by bar start."""
+    return aggregate(bars[["open", "high", "low", "close"]].dropna(), minutes)
+
+
+def simulate(bars, long_ok, short_ok, long_stop, short_stop, minutes=5, capital=6000,
+             square_off="15:20", cost_bps=0.0, ready=None):
+    """
+    Replay the entry/trail rules over one instrument.
+
+    :Parameters:
+        bars : DataFrame
+            `minutes` candles (open, high, low, close) with a DatetimeIndex of bar starts
+        long_ok, short_ok : array of bool
+            entry rule per bar, evaluated at the bar close
+        long_stop, short_stop : array of float
+            stop for each side per bar; NaN leaves the stop where it is
+        ready : array of bool
+            bars on which the strategy has state at all; other bars only check stops
+    Returns (trades, pnl): trades as tuples in TRADE_COLUMNS order with bar
+    positions for the times, pnl as an array of realised P&L per bar.
+    """
+    n = len(bars)
+    opens, highs, lows, closes = (bars[c].to_numpy(dtype=float).tolist() for c in ("open", "high", "low", "close"))
+    day = bars.index.normalize()
+    tod = (bars.index + pd.Timedelta(minutes=minutes) - day).to_numpy()
+    flatten = ((tod >= pd.Timedelta(square_off + ":00").to_timedelta64())
+               | np.append(day[1:] != day[:-1], True)).tolist()
+    long_ok, short_ok = np.asarray(long_ok, dtype=bool).tolist(), np.asarray(short_ok, dtype=bool).tolist()
+    long_stop, short_stop = np.asarray(long_stop, dtype=float).tolist(), np.asarray(short_stop, dtype=float).tolist()
+    ready = [True] * n if ready is None else np.asarray(ready, dtype=bool).tolist()
+    cost = cost_bps / 1e4
+
+    trades = []
+    pnl = [0.0] * n
+    side, qty, entry, entry_k, stop = 0, 0, 0.0, 0, np.nan
+    for k in range(n):
+        if side:
+            fill = None
+            if side > 0 and lows[k] <= stop:
+                fill, reason = min(opens[k], stop), "stop"
+            elif side < 0 and highs[k] >= stop:
+                fill, reason = max(opens[k], stop), "stop"
+            elif ready[k] and flatten[k]:
+                fill, reason = closes[k], "session end"
+            if fill is not None:
+                result = side * qty * (fill - entry) - cost * qty * (entry + fill)
+                pnl[k] += result
+                trades.append((entry_k, k, side, qty, entry, fill, result, reason))
+                side = 0
+        if not ready[k] or flatten[k]:
+            continue
+        if side > 0:
+            if long_stop[k] == long_stop[k]:
+                stop = long_stop[k]
+        elif side < 0:
+            if short_stop[k] == short_stop[k]:
+                stop = short_stop[k]
+        else:
+            size = int(capital / closes[k])
+            if size and long_ok[k] and long_stop[k] == long_stop[k]:
+                side, stop = 1, long_stop[k]
+            elif size and short_ok[k] and short_stop[k] == short_stop[k]:
+                side, stop = -1, short_stop[k]
+            if side:
+                qty, entry, entry_k = size, closes[k], k
+    return trades, np.array(pnl)
+
+
+def trade_frame(trades, bars, minutes=5):
+    """simulate() trades as a DataFrame with bar close timestamps."""
+    if not trades:
+        return pd.DataFrame(columns=TRADE_COLUMNS)
+    df = pd.DataFrame(trades, columns=TRADE_COLUMNS)
+    bar_end = bars.index + pd.Timedelta(minutes=minutes)
+    df["entry_time"] = bar_end[df["entry_time"].to_numpy()]
+    df["exit_time"] = bar_end[df["exit_time"].to_numpy()]
+    df["side"] = np.where(df["side"] > 0, "buy", "sell")
+    return df
+
+
+def daily_pnl(pnl, bars):
+    """Per bar P&L summed per session."""
+    return pd.Series(pnl, index=bars.index.normalize()).groupby(level=0).sum()
+
+
+def report(trades, daily, capital):
+    """Per-ticker trade stats plus portfolio KPIs on daily returns."""
+    per_ticker = pd.DataFrame(index=daily.columns)
+    if len(trades):
+        grouped = trades.groupby("ticker")["pnl"]
+        per_ticker["trades"] = grouped.count()
+        per_ticker["win_rate"] = grouped.apply(lambda p: (p > 0).mean())
+        per_ticker["pnl"] = grouped.sum()
+    per_ticker = per_ticker.fillna(0)
+    per_ticker = per_ticker.join(kpi.summary(daily / capital, "daily"))
+    portfolio = kpi.summary(daily.sum(axis=1) / (capital * daily.shape[1]), "daily")
+    return per_ticker, portfolio
@@ -0,0 +1,210 @@
+"""
+Backtester and parameter search for the three_sup_trend strategy.
+
+Replays 5-minute candles per instrument with the live rules:
+  * three Supertrend lines, each turning red/green when the close crosses
+    it (st_dir_refresh); the direction persists until the next crossing
+  * flat instruments buy when all three are green and sell when all are red,
+    with a stop at sl_price, open positions trail their stop to sl_price
+    every bar; sl_price blends the two nearest lines by `weight` (0.6 live)
+  * stops fill at the trigger, or at the bar open when it gaps through, and
+    open positions are squared off at the end of the session
+
+A parameter set is three (n, m) Supertrend pairs plus the sl_price weight;
+the live one is (7,3), (10,3), (11,2), 0.6. For every instrument the True
+Range is computed once, the ATR once per n and each Supertrend line once per
+(n, m) however many triples use it. Instruments (and slices of a large
+grid) run in parallel on a process pool; the per-parameter daily P&L is
+summed over the universe and scored with kpi.summary.
+
+The live script recomputes the lines over the last 4 days every cycle; here
+they run over the whole history, which only differs while a line warms up.
+
+    python backtest_supertrend.py --data ohlc_5min/                     # <dir>/<TICKER>.csv|.parquet
+    python backtest_supertrend.py --synthetic 200 --days 250 --n 7 10 11 14 --m 1.5 2 3
+    python backtest_supertrend.py --data ohlc_5min/ --triple 7,3 10,3 11,2
+"""
+import argparse
+import itertools
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import indicators
+import kpi
+from backtest import load_history, session_bars, simulate
+
+# =============================================
+# check min, python version
+if sys.version_info < (3, 8):
+    raise SystemError("Python version >= 3.8")
+
+# =============================================
+
+SUMMARY_FILE = "backtest_supertrend_summary.csv"
+LIVE_WEIGHT = 0.6
+
+
+def make_grid(ns, ms, weights):
+    """Every set of three distinct (n, m) pairs, with every weight: [((p1, p2, p3), weight), ...]"""
+    pairs = list(itertools.product(sorted(set(ns)), sorted(set(ms))))
+    return [(triple, w) for triple in itertools.combinations(pairs, 3) for w in weights]
+
+
+def st_directions(st, close):
+    """st_dir_refresh over all bars: +1 green, -1 red, 0 before the first crossing."""
+    red = (st[1:] > close[1:]) & (st[:-1] < close[:-1])
+    green = (st[1:] < close[1:]) & (st[:-1] > close[:-1])
+    event = np.concatenate(([0], np.where(green, 1, np.where(red, -1, 0))))
+    last = np.maximum.accumulate(np.where(event != 0, np.arange(len(event)), 0))
+    return event[last]
+
+
+def load_bars(source, days=250, seed=0):
+    """5-minute session candles from a candle/tick file (resampled when finer) or a synthetic random walk."""
+    if source == "synthetic":
+        import benchmarks
+        return benchmarks.synthetic_session_ohlc(days, minutes=5, seed=seed, start_price=100 + seed % 900)
+    data = load_history(source)
+    if "last_price" in data.columns:
+        data = data["last_price"].resample("1min").ohlc().dropna()
+    if len(data) > 1 and data.index.to_series().diff().median() < pd.Timedelta(minutes=5):
+        data = session_bars(data, 5)
+    return data
+
+
+def backtest(bars, grid, capital=5000, square_off="15:20", cost_bps=0.0):
+    """
+    Run every parameter set of `grid` on one instrument.
+
+    :Parameters:
+        bars : DataFrame
+            5-minute candles with a DatetimeIndex of bar starts
+        grid : list
+            [((n, m), (n, m), (n, m)), weight), ...] as from make_grid()
+    Returns (stats, sessions, daily): stats has trades/wins/pnl per parameter
+    set, daily is a (sessions x parameter sets) P&L array.
+    """
+    high, low, close = (bars[c].to_numpy(dtype=float) for c in ("high", "low", "close"))
+    tr = indicators.true_range(high, low, close)
+    atrs, lines, dirs = {}, {}, {}
+    for triple, _ in grid:
+        for n, m in triple:
+            if (n, m) in lines:
+                continue
+            if n not in atrs:
+                atrs[n] = indicators.atr_array(tr, n)
+            lines[n, m] = indicators.supertrend_array(high, low, close, atrs[n], n, m)
+            dirs[n, m] = st_directions(lines[n, m], close)
+
+    days, day_index = np.unique(bars.index.normalize(), return_inverse=True)
+    daily = np.zeros((len(days), len(grid)))
+    stats = np.zeros((len(grid), 3))
+    for j, (triple, weight) in enumerate(grid):
+        st = np.column_stack([lines[p] for p in triple])
+        d = np.column_stack([dirs[p] for p in triple])
+        stop = indicators.sl_prices(st, close, weight)
+        trades, pnl = simulate(bars, (d == 1).all(axis=1), (d == -1).all(axis=1), stop, stop, 5, capital,
+                               square_off, cost_bps, ready=~np.isnan(st).any(axis=1))
+        daily[:, j] = np.bincount(day_index, weights=pnl, minlength=len(days))
+        results = np.array([t[6] for t in trades])
+        stats[j] = len(results), (results > 0).sum(), results.sum()
+    return pd.DataFrame(stats, columns=["trades", "wins", "pnl"]), pd.DatetimeIndex(days), daily
+
+
+# =============================================
+
+def _run_one(job):
+    ticker, source, seed, lo, hi, grid, capital, days, square_off, cost_bps = job
+    bars = load_bars(source, days, seed)
+    stats, index, daily = backtest(bars, grid, capital, square_off, cost_bps)
+    return ticker, lo, hi, stats, index, daily
+
+
+def run(sources, grid, capital=5000, days=250, square_off="15:20", cost_bps=0.0, workers=None):
+    """
+    Backtest `grid` on every {ticker: source} on a process pool.
+    Returns (per-parameter trade stats, sessions x parameter sets P&L summed over tickers).
+    """
+    workers = workers or os.cpu_count()
+    # split the grid when there are too few instruments to keep every core busy
+    slices = max(1, min(len(grid), math.ceil(2 * workers / max(1, len(sources)))))
+    bounds = np.linspace(0, len(grid), slices + 1).astype(int)
+    jobs = [(ticker, source, i, lo, hi, grid[lo:hi], capital, days, square_off, cost_bps)
+            for i, (ticker, source) in enumerate(sources.items()) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+    stats = np.zeros((len(grid), 3))
+    daily = pd.DataFrame(0.0, index=pd.DatetimeIndex([]), columns=range(len(grid)))
+    with ProcessPoolExecutor(workers) as pool:
+        for ticker, lo, hi, s, index, pnl in pool.map(_run_one, jobs, chunksize=1):
+            stats[lo:hi] += s.to_numpy()
+            daily = daily.reindex(daily.index.union(index), fill_value=0.0)
+            daily.loc[index, list(range(lo, hi))] += pnl
+    return pd.DataFrame(stats, columns=["trades", "wins", "pnl"]), daily
+
+
+def report(grid, stats, daily, capital, tickers):
+    """One row per parameter set: trade stats plus KPIs of the equal-capital portfolio."""
+    table = pd.DataFrame([dict({f"st{i + 1}": "{},{:g}".format(*p) for i, p in enumerate(triple)}, weight=w)
+                          for triple, w in grid])
+    table["trades"] = stats["trades"].astype(int)
+    with np.errstate(invalid="ignore"):
+        table["win_rate"] = stats["wins"] / stats["trades"]
+    table["pnl"] = stats["pnl"]
+    metrics = kpi.summary(daily.to_numpy() / (capital * tickers), "daily")
+    return table.join(metrics.reset_index(drop=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest and tune the triple Supertrend strategy.')
+    parser.add_argument('--data', default=None, help='Directory of <TICKER>.csv/.parquet 5-minute (or finer) candles.')
+    parser.add_argument('--tickers', nargs='*', default=None, help='Subset of tickers in --data.')
+    parser.add_argument('--synthetic', type=int, default=0, help='Backtest this many random-walk instruments.')
+    parser.add_argument('--days', type=int, default=250, help='Sessions per synthetic instrument. Default is 250.')
+    parser.add_argument('--n', nargs='*', type=int, default=[7, 10, 11], help='ATR periods. Default is 7 10 11.')
+    parser.add_argument('--m', nargs='*', type=float, default=[2, 3], help='ATR multipliers. Default is 2 3.')
+    parser.add_argument('--weight', nargs='*', type=float, default=[LIVE_WEIGHT],
+                        help=f'sl_price weight of the nearest line. Default is {LIVE_WEIGHT}.')
+    parser.add_argument('--triple', nargs=3, default=None, metavar='N,M',
+                        help='Only run this Supertrend triple (with each --weight), e.g. 7,3 10,3 11,2.')
+    parser.add_argument('--capital', type=float, default=5000, help='Position size. Default is 5000.')
+    parser.add_argument('--square-off', default="15:20", help='Session square off time. Default is 15:20.')
+    parser.add_argument('--cost-bps', type=float, default=0.0, help='Round trip cost per side in bps.')
+    parser.add_argument('--metric', default="sharpe", choices=kpi.METRICS, help='Sort metric. Default is sharpe.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes. Default is the CPU count.')
+    parser.add_argument('--output', default=SUMMARY_FILE, help=f'Results table. Default is {SUMMARY_FILE}.')
+    args = parser.parse_args()
+
+    if args.data:
+        sources = {os.path.splitext(f)[0]: os.path.join(args.data, f) for f in sorted(os.listdir(args.data))
+                   if f.endswith((".csv", ".parquet"))}
+        if args.tickers:
+            sources = {t: sources[t] for t in args.tickers if t in sources}
+    elif args.synthetic:
+        sources = {f"S{i}": "synthetic" for i in range(args.synthetic)}
+    else:
+        parser.error("give --data or --synthetic")
+
+    if args.triple:
+        triple = tuple((int(n), float(m)) for n, m in (p.split(",") for p in args.triple))
+        grid = [(triple, w) for w in args.weight]
+    else:
+        grid = make_grid(args.n, args.m, args.weight)
+    print(f"{len(grid)} parameter sets on {len(sources)} instruments")
+
+    started = time.perf_counter()
+    stats, daily = run(sources, grid, args.capital, args.days, args.square_off, args.cost_bps, args.workers)
+    results = report(grid, stats, daily, args.capital, len(sources))
+    results = results.sort_values(args.metric, ascending=args.metric in ("max_dd", "volatility"))
+    results.to_csv(args.output, index=False)
+    print(results.head(20).to_string(index=False))
+    print(f"done in {time.perf_counter() - started:.1f}s, results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+One 1-minute bar store per instrument, every other timeframe derived from it.
+
+The scripts used to download each timeframe separately: 60-minute bars
+for the brick size, 5-minute bars again every cycle, weekly bars for the
+rebalance. BarStore keeps only 1-minute candles per instrument (numpy
+arrays, epoch minutes of naive local time) and serves
+
+    minute, 3minute, 5minute, 10minute, 15minute, 30minute, 60minute
+                    buckets aligned to the 09:15 session open, like Kite's
+    day, week       calendar day, week starting Monday
+
+as views aggregated with reduceat over the bucket boundaries. A view is
+cached and only its last bucket onwards is recomputed when minutes are
+added, so a cycle costs a tail download of the minutes since the last
+bar plus aggregation of those minutes.
+
+aggregate() applies the same bucketing to any OHLCV DataFrame (the
+backtests' candles, Yahoo daily bars).
+
+    KITETRADE_BAR_DIR=bars    where BarStore keeps the 1-minute history between runs
+"""
+import datetime as dt
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import clock
+
+SESSION_OPEN = 9 * 60 + 15  # minute of the day buckets are aligned to
+INTERVALS = {"minute": 1, "3minute": 3, "5minute": 5, "10minute": 10, "15minute": 15, "30minute": 30,
+             "60minute": 60, "day": "day", "week": "week"}
+MAX_DAYS = 60  # Kite serves at most 60 days of minute candles per request
+COLUMNS = ("open", "high", "low", "close", "volume")
+# how a column is aggregated, by lower-cased name; other columns are dropped
+RULES = {"open": "first", "high": "max", "low": "min", "close": "last", "adj close": "last",
+         "volume": "sum", "oi": "last"}
+
+
+def epoch_minutes(index):
+    """DatetimeIndex (naive) -> int64 minutes since 1970-01-01 of the same wall time"""
+    return pd.DatetimeIndex(index).values.astype("datetime64[m]").astype(np.int64)
+
+
+def _index(minutes, name="date"):
+    return pd.DatetimeIndex(minutes.astype("datetime64[m]").astype("datetime64[ns]"), name=name)
+
+
+def bucket_keys(minutes, interval):
+    """Start (epoch minutes) of the `interval` (name, or a number of minutes) bucket of each epoch minute."""
+    size = INTERVALS.get(interval, interval)
+    day = minutes - minutes % 1440
+    if size == "day":
+        return day
+    if size == "week":
+        days = minutes // 1440
+        return (days - (days + 3) % 7) * 1440  # 1970-01-01 was a Thursday
+    return day + SESSION_OPEN + (minutes - day - SESSION_OPEN) // size * size
+
+
+def _reduce(keys, columns):
+    """Aggregate sorted rows by equal consecutive `keys`: {name: (rule, array)} -> (bucket keys, {name: array})"""
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.append(starts[1:], len(keys)) - 1
+    out = {}
+    for name, (rule, values) in columns.items():
+        if rule == "first":
+            out[name] = values[starts]
+        elif rule == "last":
+            out[name] = values[ends]
+        elif rule == "max":
+            out[name] = np.maximum.reduceat(values, starts)
+        elif rule == "min":
+            out[name] = np.minimum.reduceat(values, starts)
+        else:
+            out[name] = np.add.reduceat(values, starts)
+    return keys[starts], starts, out
+
+
+def aggregate(df, interval):
+    """
+    Candles of `df` (DatetimeIndex of bar starts, any of open/high/low/close/
+    adj close/volume/oi in any case) rolled up to `interval`, labelled by
+    bucket start. Rows must be sorted; empty buckets are left out.
+    """
+    if interval == "minute" or df.empty:
+        return df
+    keys = bucket_keys(epoch_minutes(df.index), interval)
+    columns = {c: (RULES[c.lower()], df[c].to_numpy(dtype=float)) for c in df.columns if c.lower() in RULES}
+    starts, _, out = _reduce(keys, columns)
+    return pd.DataFrame(out, index=_index(starts, df.index.name))
+
+
+class _View():
+    """Derived bars of one interval, with the minute row each bucket starts at."""
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.int64)
+        self.first = np.empty(0, dtype=np.int64)
+        self.columns = {c: np.empty(0) for c in COLUMNS}
+        self.dirty = 0  # lowest minute row changed since the last refresh
+
+
+class BarStore():
+    """
+    1-minute candles per instrument token and the timeframes derived from them.
+
+    :Parameters:
+        kite : KiteConnect
+            session for historical_data, not needed when only extend() feeds the store
+        bucket : tools.TokenBucket
+            historical API rate limit, acquired once per request
+        directory : str
+            1-minute history kept between runs, defaults to KITETRADE_BAR_DIR or "bars";
+            False keeps it in memory only
+    """
+
+    def __init__(self, kite=None, bucket=None, directory=None, logger=None):
+        self.kite = kite
+        self.bucket = bucket
+        if directory is None:
+            directory = os.getenv("KITETRADE_BAR_DIR", "bars")
+        self.directory = directory or None
+        self.log = logger or logging.getLogger(__name__)
+        self._minutes = {}  # token -> {"time": int64 epoch minutes, COLUMNS...}
+        self._since = {}    # token -> epoch minute the stored history is complete from
+        self._views = {}    # token -> {interval: _View}
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    # ---------------------------------------------
+    def _path(self, token):
+        return os.path.join(self.directory, f"{token}.npz")
+
+    def _store(self, token):
+        store = self._minutes.get(token)
+        if store is None:
+            store = {"time": np.empty(0, dtype=np.int64), **{c: np.empty(0) for c in COLUMNS}}
+            if self.directory and os.path.exists(self._path(token)):
+                try:
+                    with np.load(self._path(token)) as saved:
+                        store = {name: saved[name] for name in store}
+                        self._since[token] = int(saved["since"])
+                except (OSError, ValueError, KeyError) as e:
+                    self.log.error(f"bar file {self._path(token)} unreadable, fetching again: {e}")
+            self._minutes[token] = store
+        return store
+
+    def _save(self, token):
+        if not self.directory:
+            return
+        tmp = self._path(token) + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, since=self._since.get(token, 0), **self._minutes[token])
+        os.replace(tmp, self._path(token))
+
+    def extend(self, token, candles):
+        """
+        Merge 1-minute candles (historical_data rows or a DataFrame with a
+        date column/index) into the store; they replace stored minutes of the
+        same span, so a re-fetched partial last minute is overwritten.
+        """
+        df = pd.DataFrame(candles)
+        if df.empty:
+            return
+        if "date" in df.columns:
+            df = df.set_index("date")
+        index = pd.DatetimeIndex(df.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        time = epoch_minutes(index)
+        order = np.argsort(time, kind="stable")
+        time = time[order]
+        store = self._store(token)
+        lo = np.searchsorted(store["time"], time[0], side="left")
+        hi = np.searchsorted(store["time"], time[-1], side="right")
+        for name in store:
+            new = time if name == "time" else df[name].to_numpy(dtype=float)[order] if name in df else np.zeros(len(time))
+            store[name] = np.concatenate((store[name][:lo], new, store[name][hi:]))
+        for view in self._views.get(token, {}).values():
+            view.dirty = min(view.dirty, lo)
+
+    def sync(self, token, days):
+        """Download what the store lacks of the last `days` days of 1-minute candles, up to now."""
+        now = clock.now()
+        start = dt.datetime.combine(clock.today() - dt.timedelta(days), dt.time())
+        since = epoch_minutes([start])[0]
+        store = self._store(token)
+        if not len(store["time"]):
+            spans = [(start, now)]
+        else:
+            spans = []
+            if self._since.get(token, since) > since:
+                spans.append((start, _index(store["time"][:1])[0].to_pydatetime()))  # older history asked for
+            # from the last stored minute on, it may have been partial
+            spans.append((_index(store["time"][-1:])[0].to_pydatetime(), now))
+        self._since[token] = min(self._since.get(token, since), since)
+        fetched = 0
+        for begin, end in spans:
+            while begin < end:
+                stop = min(end, begin + dt.timedelta(days=MAX_DAYS))
+                if self.bucket:
+                    self.bucket.acquire()
+                candles = self.kite.historical_data(token, begin, stop, "minute")
+                self.extend(token, candles)
+                fetched += len(candles)
+                begin = stop
+        if fetched:
+            self._save(token)
+        return fetched
+
+    # ---------------------------------------------
+    def _view(self, token, interval):
+        views = self._views.setdefault(token, {})
+        view = views.get(interval)
+        if view is None:
+            view = views[interval] = _View()
+        store = self._store(token)
+        n = len(store["time"])
+        if view.dirty >= n:
+            return view
+        # recompute from the bucket holding the first changed minute
+        j = max(np.searchsorted(view.first, view.dirty, side="right") - 1, 0)
+        row = int(view.first[j]) if j < len(view.first) else view.dirty
+        keys, starts, out = _reduce(bucket_keys(store["time"][row:], interval),
+                                    {c: (RULES[c], store[c][row:]) for c in COLUMNS})
+        view.keys = np.concatenate((view.keys[:j], keys))
+        view.first = np.concatenate((view.first[:j], starts + row))
+        for c in COLUMNS:
+            view.columns[c] = np.concatenate((view.columns[c][:j], out[c]))
+        view.dirty = n
+        return view
+
+    def bars(self, token, interval, days=None):
+        """`interval` candles of the stored minutes (the last `days` days), as a DataFrame indexed by date."""
+        if interval not in INTERVALS:
+            raise ValueError(f"unknown interval {interval}")
+        view = self._view(token, interval)
+        k = 0
+        if days is not None:
+            cutoff = epoch_minutes([dt.datetime.combine(clock.today() - dt.timedelta(days), dt.time())])[0]
+            k = np.searchsorted(view.keys, cutoff, side="left")
+        return pd.DataFrame({c: view.columns[c][k:] for c in COLUMNS},
+                            index=_index(view.keys[k:]))
+
+    def history(self, token, interval, days):
+        """Like fetchOHLC: `interval` candles of the last `days` days, after bringing the minutes up to date."""
+        self.sync(token, days)
+        return self.bars(token, interval, days)
@@ -0,0 +1,267 @@
+"""
+Micro-benchmarks for the indicator and portfolio kernels.
+
+Times each kernel on synthetic data at several sizes, records wall time and
+peak traced memory to a JSON results file and compares against a stored
+baseline so regressions are flagged.
+
+    python benchmarks.py                                   # run, write bench_results.json
+    python benchmarks.py --save-baseline                   # also store as bench_baseline.json
+    python benchmarks.py --kernels supertrend MACD --bars 1000 10000
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import warnings
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+import indicators
+import kpi
+import signals
+
+# =============================================
+# check min, python version
+if sys.version_info < (3, 4):
+    raise SystemError("Python version >= 3.4")
+
+# =============================================
+
+DEFAULT_BARS = [1000, 10000, 100000, 1000000]
+DEFAULT_TICKERS = [10, 100, 1000]
+RESULTS_FILE = "bench_results.json"
+BASELINE_FILE = "bench_baseline.json"
+
+
+# =============================================
+# synthetic data generators
+
+def synthetic_ohlc(n_bars, seed=0, start_price=500.0, freq="5min"):
+    """Random-walk OHLCV candles with a DatetimeIndex, shaped like fetchOHLC output."""
+    rng = np.random.default_rng(seed)
+    close = start_price * np.exp(np.cumsum(rng.normal(0, 0.002, n_bars)))
+    open_ = np.concatenate(([start_price], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.001, n_bars)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    index = pd.date_range("2020-01-01 09:15", periods=n_bars, freq=freq, name="date")
+    return pd.DataFrame({"open": open_, "high": high, "low": low, "close": close,
+                         "volume": rng.integers(1000, 100000, n_bars)}, index=index)
+
+
+def synthetic_session_ohlc(days, minutes=1, seed=0, start_price=500.0, vol=0.0008):
+    """Random-walk candles on NSE session times (09:15-15:30) for `days` business days."""
+    rng = np.random.default_rng(seed)
+    per_day = 375 // minutes
+    sessions = pd.bdate_range("2023-01-02", periods=days)
+    offsets = pd.to_timedelta(np.arange(per_day) * minutes + 9 * 60 + 15, unit="min")
+    index = pd.DatetimeIndex((sessions.values[:, None] + offsets.values[None, :]).ravel(), name="date")
+    n = len(index)
+    steps = rng.normal(0, vol * np.sqrt(minutes), n)
+    steps[::per_day] += rng.normal(0, vol * 10, days)  # overnight gaps
+    close = start_price * np.exp(np.cumsum(steps))
+    open_ = np.concatenate(([start_price], close[:-1]))
+    spread = np.abs(rng.normal(0, vol / 2, n)) * close * np.sqrt(minutes)
+    return pd.DataFrame({"open": open_, "high": np.maximum(open_, close) + spread,
+                         "low": np.minimum(open_, close) - spread, "close": close,
+                         "volume": rng.integers(100, 10000, n)}, index=index)
+
+
+def synthetic_ticks(n_ticks, n_tickers=10, seed=0, start_price=500.0):
+    """Interleaved (ticker, last_price) stream across `n_tickers` random walks."""
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, 0.0005, (n_ticks // n_tickers + 1, n_tickers))
+    prices = (start_price * np.exp(np.cumsum(steps, axis=0))).ravel()[:n_ticks]
+    names = ["T{}".format(i) for i in range(n_tickers)]
+    return [(names[i % n_tickers], float(p)) for i, p in enumerate(prices)]
+
+
+def synthetic_returns(n_periods, n_tickers, seed=0):
+    """Weekly return matrix shaped like weekly_rebalance.return_df."""
+    rng = np.random.default_rng(seed)
+    data = rng.normal(0.002, 0.04, (n_periods, n_tickers))
+    index = pd.date_range("2010-01-03", periods=n_periods, freq="W")
+    return pd.DataFrame(data, index=index, columns=["S{}".format(i) for i in range(n_tickers)])
+
+
+# =============================================
+# kernels: name -> (size axis, setup(size) -> args, callable)
+
+def _renko_run(ticks, brick_size=1.0):
+    params = {}
+    for ticker, price in ticks:
+        param = params.get(ticker)
+        if param is None:
+            param = params[ticker] = {"brick_size": brick_size, "upper_limit": None,
+                                      "lower_limit": None, "brick": 0}
+        indicators.renkoUpdate(param, price)
+    return params
+
+
+def _sl_price_setup(n):
+    ohlc = synthetic_ohlc(n)
+    for i in range(3):
+        ohlc["st{}".format(i + 1)] = ohlc["close"] * (1 + 0.01 * (i + 1) * (-1) ** i)
+    return (ohlc,)
+
+
+def _signals_setup(n, seed=0):
+    rng = np.random.default_rng(seed)
+    names = ["S{}".format(i) for i in range(n)]
+    close = rng.uniform(50, 5000, n)
+    state = pd.DataFrame({"close": close, "long_ok": rng.random(n) < 0.2, "short_ok": rng.random(n) < 0.2,
+                          "long_stop": close * 0.98, "short_stop": close * 1.02}, index=names)
+    held = names[::3]
+    pos_df = pd.DataFrame({"tradingsymbol": held, "quantity": rng.choice([-10, 0, 10], len(held))})
+    ord_df = pd.DataFrame({"tradingsymbol": held, "status": "TRIGGER PENDING",
+                           "order_id": [str(i) for i in range(len(held))]})
+    return (state, pos_df, ord_df, 100000)
+
+
+def _signals_run(state, pos_df, ord_df, capital):
+    return signals.evaluate(signals.build_table(state, pos_df, ord_df, capital))
+
+
+def _rebalance_module():
+    import weekly_rebalance
+    return weekly_rebalance
+
+
+def kernel_table():
+    kernels = {
+        "atr": ("bars", lambda n: (synthetic_ohlc(n), 14), indicators.atr),
+        "supertrend": ("bars", lambda n: (synthetic_ohlc(n), 7, 3), indicators.supertrend),
+        "sl_price": ("bars", _sl_price_setup, indicators.sl_price),
+        "MACD": ("bars", lambda n: (synthetic_ohlc(n), 12, 26, 9), indicators.MACD),
+        "renkoOperation": ("bars", lambda n: (synthetic_ticks(n),), _renko_run),
+        "signals": ("tickers", _signals_setup, _signals_run),
+        "kpi_summary": ("tickers", lambda n: (synthetic_returns(520, n),), kpi.summary),
+        "kpi_rolling": ("tickers", lambda n: (synthetic_returns(520, n), 52), kpi.rolling),
+    }
+    try:
+        wr = _rebalance_module()
+    except ImportError as e:
+        print(f"skipping weekly_rebalance kernels: {e}")
+        return kernels
+    weekly = lambda n: pd.DataFrame({"mon_ret": np.random.default_rng(0).normal(0.002, 0.04, n)})
+    kernels.update({
+        # the array kernel: pflio itself memoizes, so repeats would only time cache hits
+        "pflio": ("tickers", lambda n: (synthetic_returns(520, n).to_numpy(dtype=float), min(15, n), min(3, n // 2)),
+                  wr.pflio_array),
+        "CAGR": ("bars", lambda n: (weekly(n),), wr.CAGR),
+        "max_dd": ("bars", lambda n: (weekly(n),), wr.max_dd),
+    })
+    return kernels
+
+
+# =============================================
+
+def measure(func, args, repeat):
+    """Return (timings, peak_bytes) for `repeat` calls plus one traced call."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return timings, peak
+
+
+def run(kernels, bars, tickers, repeat, max_seconds):
+    results = []
+    for name, (axis, setup, func) in kernels.items():
+        sizes = bars if axis == "bars" else tickers
+        for size in sizes:
+            args = setup(size)
+            timings, peak = measure(func, args, repeat)
+            row = {"kernel": name, "axis": axis, "size": size,
+                   "median_s": statistics.median(timings), "min_s": min(timings),
+                   "peak_mb": peak / 1e6, "repeat": repeat}
+            results.append(row)
+            print("{:<16} {:>8} {:>9} median {:>10.5f}s  min {:>10.5f}s  peak {:>9.2f}MB".format(
+                name, axis, size, row["median_s"], row["min_s"], row["peak_mb"]))
+            if row["median_s"] > max_seconds:
+                print(f"{name}: {size} took longer than {max_seconds}s, skipping larger sizes")
+                break
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Flag kernels whose median time or peak memory grew more than `tolerance`."""
+    base = {(r["kernel"], r["size"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for row in results:
+        ref = base.get((row["kernel"], row["size"]))
+        if ref is None:
+            continue
+        for metric in ("median_s", "peak_mb"):
+            if ref[metric] > 0 and row[metric] > ref[metric] * (1 + tolerance):
+                regressions.append({"kernel": row["kernel"], "size": row["size"], "metric": metric,
+                                    "baseline": ref[metric], "current": row[metric],
+                                    "change": row[metric] / ref[metric] - 1})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark indicator and portfolio kernels.')
+    parser.add_argument('--kernels', nargs='*', default=None, help='Kernels to run. Default is all.')
+    parser.add_argument('--bars', nargs='*', type=int, default=DEFAULT_BARS, help='Bar/tick counts.')
+    parser.add_argument('--tickers', nargs='*', type=int, default=DEFAULT_TICKERS, help='Universe sizes for the signals, kpi_summary, kpi_rolling and pflio kernels.')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per size. Default is 3.')
+    parser.add_argument('--max-seconds', type=float, default=30.0,
+                        help='Stop growing a kernel once a size takes longer than this. Default is 30.')
+    parser.add_argument('--output', default=RESULTS_FILE, help=f'Results file. Default is {RESULTS_FILE}.')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help=f'Baseline file. Default is {BASELINE_FILE}.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown vs baseline. Default is 0.2.')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline.')
+    args = parser.parse_args()
+
+    # the kernels index Series positionally, which newer pandas warns about on every call
+    warnings.simplefilter("ignore", FutureWarning)
+
+    kernels = kernel_table()
+    if args.kernels:
+        kernels = {k: v for k, v in kernels.items() if k in args.kernels}
+
+    results = run(kernels, args.bars, args.tickers, args.repeat, args.max_seconds)
+    report = {
+        "meta": {"timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+                 "python": platform.python_version(), "platform": platform.platform(),
+                 "numpy": np.__version__, "pandas": pd.__version__},
+        "results": results,
+    }
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+        for r in regressions:
+            print("REGRESSION {kernel} size={size} {metric}: {baseline:.5g} -> {current:.5g} ({change:+.0%})".format(**r))
+        if not regressions:
+            print(f"no regressions against {args.baseline}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
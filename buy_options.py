@@ -13,8 +13,20 @@ import time
 import yfinance as yf
 import sys
 import random
+import uuid
 from asynctools import multitasking, RecurringTask
 import tools
+import clock
+import auth
+from checkpoint import Checkpoint
+from reconnect import ReconnectManager
+import latency
+from squareoff import SquareOff
+from scheduler import SessionScheduler
+from order_gateway import OrderGateway, PRIORITY_EXIT, PRIORITY_SL
+from margins import MarginService
+from portfolio import Portfolio, KillSwitch
+from depth import DepthBook, required_mode
 import logging
 
 load_dotenv()
@@ -25,7 +37,11 @@ if sys.version_info < (3, 4):
 
 # =============================================
 # Configure logging
-tools.createLogger(__name__)
+tools.createLogger(logfile="buy_options.log", json_lines=bool(os.getenv('KITE_LOG_JSON')))
+
+# =============================================
+# tick fields processTick reads, they decide the subscription mode
+TICK_FIELDS = ("last_price", "oi", "volume_traded", "depth")
 
 # =============================================
 # set up threading pool
@@ -48,16 +64,20 @@ class ZerodhaOptionBuyer:
         self.user_id = os.getenv('KITE_USER_ID')
         self.user_password = os.getenv('KITE_USER_PASSWORD')
         self.totp_token = os.getenv('KITE_TOPT_TOKEN')
+        self.kite_root = os.getenv('KITE_ROOT') # set to point at a mock/proxy server
+        self.kite_ws_root = os.getenv('KITE_WS_ROOT')
         
-        self.kite = KiteConnect(api_key=self.api_key)
+        self.kite = KiteConnect(api_key=self.api_key, root=self.kite_root)
         
-        # if access token is not present
-        if not self.access_token:
-            _auto_login = self.auto_login()
-            if not _auto_login:
-                print('Authentication Failed!')
-                exit()
-        self.kite.set_access_token(self.access_token)        
+        # if access token is not present, the day's cached session or a fresh login
+        try:
+            self.access_token = auth.authenticate(self.kite, self.auto_login, self.access_token, logger=self.log)
+        except Exception as e:
+            print(f'Authentication Failed! {e}')
+            exit()
+        latency.instrument(self.kite)
+        self.gateway = OrderGateway(self.kite, logger=self.log)
+        self.margin_service = MarginService(self.kite, logger=self.log)
         print(f"Authentication complete! {self.access_token}")
         
         #get dump of all NSE instruments
@@ -73,6 +93,7 @@ class ZerodhaOptionBuyer:
         parser.add_argument('--lots', type=int, default=2, help='No. of lots. Default is 2.')
         parser.add_argument('--exp_offset', type=int, default=0, help='Expiry offset Default is 0.')
         parser.add_argument('--atm_offset', type=int, default=3, help='OTM/ATM/ITM Default is 3.')
+        parser.add_argument('--max_loss', type=float, default=os.getenv('KITE_MAX_LOSS'), help='Square off and stop buying when the day P&L falls below -max_loss. Default is off.')
 
 
         self.args = parser.parse_args()
@@ -84,15 +105,26 @@ class ZerodhaOptionBuyer:
         self.takeprofit = self.args.takeprofit # points 
         self.lots = self.args.lots # Dont Change this!
         
+        # live P&L of the traded contract from ticks and order updates; the kill switch squares it off
+        # on the day loss limit (seeded once the contract is known, other positions in the account are not counted)
+        self.portfolio = Portfolio(logger=self.log)
+        self.square_off = None  # the SquareOff in progress, confirms its exits from the order updates
+        self.kill_switch = KillSwitch(self.portfolio, self.killSwitch, logger=self.log,
+                                      max_loss=float(self.args.max_loss) if self.args.max_loss else None)
+        
         # Schedule Strategy Callback
         self.interval = 2 # run every 2 secs
-        self.duration = 60 * 60 * 5 # run for 5 hours
-        self.starttime = time.time()
-        self.timeout = self.starttime + self.duration
+        # run for the trading session: no new buys after the entry cut-off, squared off before the broker does
+        self.schedule = SessionScheduler(logger=self.log)
+        self.schedule.on("square_off", self.squareOff)
         
-        # Set this to true when order is already placed
-        # TODO: GET Buy ID if order is already placed
+        # Set this to true when order is already placed; restored from the checkpoint on restart
         self.order_placed = False
+        self.buy_order_id = None
+        self.sell_order_id = None
+        self.buy_tag = None
+        self.checkpoint = Checkpoint(f"buy_options_{self.underlying}_{self.option_type}", logger=self.log)
+        saved = self.checkpoint.load() or {}
         sym_map = {
             "NIFTY": "NSE:NIFTY 50",
             "BANKNIFTY": "NSE:NIFTY BANK",
@@ -104,6 +136,7 @@ class ZerodhaOptionBuyer:
         self.expiry_idx = self.args.exp_offset
         self.atm_offset = self.args.atm_offset
         self.opt_chain = self.get_atm_contract(duration=self.expiry_idx, offset=self.atm_offset) 
+        self.restoreState(saved)
         symbol = self.opt_chain.tradingsymbol.to_list()[0]
         contract_price = self.kite.ltp(f"NFO:{symbol}")[f"NFO:{symbol}"]["last_price"]
         
@@ -111,6 +144,8 @@ class ZerodhaOptionBuyer:
         
         self.tokens = self.opt_chain["instrument_token"].to_list()
         self.symbol_dict = dict(zip(self.opt_chain.instrument_token, self.opt_chain.tradingsymbol))
+        self.contracts = set(self.opt_chain.tradingsymbol)
+        self.portfolio.load_positions([p for p in self.kite.positions()["day"] if p["tradingsymbol"] in self.contracts])
         self.option_data = {self.symbol_dict[i]:{} for i in self.tokens}
         
         for symbol in self.opt_chain.tradingsymbol:
@@ -118,9 +153,10 @@ class ZerodhaOptionBuyer:
             self.option_data[symbol]["type"] = self.opt_chain.loc[self.opt_chain.tradingsymbol == symbol, "instrument_type"].to_list()[0]
             self.option_data[symbol]["time_to_expiry"] = self.opt_chain.loc[self.opt_chain.tradingsymbol == symbol, "time_to_expiry"].to_list()[0]
             self.option_data[symbol]["lot_size"] = self.opt_chain.loc[self.opt_chain.tradingsymbol == symbol, "lot_size"].to_list()[0]
+        self.depth = DepthBook(self.tokens, tick_size=float(self.opt_chain["tick_size"].to_list()[0]), logger=self.log)
         
-    def auto_login(self):
-        
+    def auto_login(self, kite):
+        # login callable for the session cache, returns the access token
         try:
             http_session = requests.Session()
             url = http_session.get(url='https://kite.trade/connect/login?v=3&api_key='+self.api_key).url
@@ -131,43 +167,42 @@ class ZerodhaOptionBuyer:
             response = http_session.get(url=url, allow_redirects=True).url
             request_token = parse_qs(urlparse(response).query)['request_token'][0]
 
-            self.kite_session = self.kite.generate_session(request_token, api_secret=self.api_secret)
-            self.access_token = self.kite_session["access_token"]
-            
-            return True
+            self.kite_session = kite.generate_session(request_token, api_secret=self.api_secret)
+            return self.kite_session["access_token"]
         except Exception as e:
             print(f"Auto Login Failed {e}")
             try:
-                print(self.kite.login_url())
-                request_token = input("Enter request token: ")
-                self.kite_session = self.kite.generate_session(request_token, self.api_secret)
-                self.access_token = self.kite_session["access_token"]
-                self.kite.set_access_token(self.access_token)
-                return True    
+                return auth.prompt_login(self.api_secret)(kite)
             except Exception as e:
                 print(f"Manual Login Failed {e}")
-                return False 
+                raise
             
     
     @multitasking.task
     def start_streaming(self):
-        kws = KiteTicker(self.api_key, self.kite.access_token) 
-        kws.on_ticks = self.on_ticks
-        kws.on_connect = self.on_connect
-        kws.on_close = self.on_close
+        kws = KiteTicker(self.api_key, self.kite.access_token, root=self.kite_ws_root,
+                         reconnect_max_tries=300, reconnect_max_delay=30)
+        # KiteTicker reconnects on its own with backoff; only the latest quote matters here so no backfill
+        self.reconnect = ReconnectManager(kws, self.kite, self.on_ticks, self.on_connect, self.tokens,
+                                          backfill=False, logger=self.log)
+        kws.on_order_update = self.on_order_update
         
         # Connect Web Socket
-        kws.connect(threaded=True)
+        self.reconnect.connect(threaded=True)
     
     def run(self):
-        while time.time() <= self.timeout:
-            try:
-                self.strategy()
-                time_left = self.interval - ((time.time() - self.starttime)%self.interval)
-                time.sleep(time_left)
-            except KeyboardInterrupt:
-                self.at_exit()
-        self.at_exit()
+        try:
+            self.schedule.run(task=self.cycle, interval=self.interval)
+        except KeyboardInterrupt:
+            self.at_exit()
+        print('Session over. Exiting.')
+        exit()
+
+    @multitasking.task
+    def cycle(self):
+        # timed on the worker thread, around the whole strategy pass
+        with latency.span("strategy_cycle"):
+            self.strategy()
         
     def at_exit(self):
         print('\n\nKeyboard exception received. Do you want to square off? [Y/N]: ', end='')
@@ -181,30 +216,46 @@ class ZerodhaOptionBuyer:
             print('Exiting.')
             exit()
     
-    @multitasking.task
     def on_ticks(self, ws, ticks):
+        # on the websocket thread: the depth book and the portfolio are updated by one thread, in tick order
         # print('tick recieved')
-        self.processTick(ticks)
+        latency.mark("tick")
+        with latency.span("tick_handler"):
+            self.processTick(ticks)
         
+    def on_order_update(self, ws, data):
+        self.margin_service.on_order_update(ws, data)
+        if self.square_off:
+            self.square_off.on_order_update(ws, data)
+        if data.get("tradingsymbol") in self.contracts:
+            self.portfolio.on_order_update(ws, data)
+
+    def killSwitch(self, reason):
+        print(f"Kill switch: {reason}. Squaring off, no more orders today.")
+        self.squareOff()
+
     @multitasking.task
     def on_connect(self, ws, response):
         # Callback on successful connect.
         ws.subscribe(self.tokens)
-        ws.set_mode(ws.MODE_FULL, self.tokens)
-    @multitasking.task
-    def on_close(self, ws, code, reason):
-        # On connection close stop the main loop
-        # Reconnection will not happen after executing `ws.stop()`
-        ws.stop()
+        # oi and the order book only come with full ticks
+        ws.set_mode(required_mode(TICK_FIELDS), self.tokens)
     
     def processTick(self, ticks):
+        self.depth.update(ticks)
         for tick in ticks:
-            self.option_data[self.symbol_dict[tick['instrument_token']]]["price"] = float(tick["last_price"])
-            self.option_data[self.symbol_dict[tick['instrument_token']]]["oi"] = int(tick["oi"])
-            self.option_data[self.symbol_dict[tick['instrument_token']]]["volume"] = int(tick["volume_traded"])
-            self.option_data[self.symbol_dict[tick['instrument_token']]]["bid"] = float(tick["depth"]["buy"][0]["price"])
-            self.option_data[self.symbol_dict[tick['instrument_token']]]["ask"] = float(tick["depth"]["sell"][0]["price"])
-            self.option_data[self.symbol_dict[tick['instrument_token']]]["mid_price"] = (float(tick["depth"]["buy"][0]["price"]) + float(tick["depth"]["sell"][0]["price"]))/2
+            token = tick['instrument_token']
+            self.option_data[self.symbol_dict[token]]["price"] = float(tick["last_price"])
+            self.option_data[self.symbol_dict[token]]["oi"] = int(tick["oi"])
+            self.option_data[self.symbol_dict[token]]["volume"] = int(tick["volume_traded"])
+            self.option_data[self.symbol_dict[token]]["bid"] = self.depth.bid_price[self.depth.row[token], 0]
+            self.option_data[self.symbol_dict[token]]["ask"] = self.depth.ask_price[self.depth.row[token], 0]
+            self.option_data[self.symbol_dict[token]]["mid_price"] = self.depth.mid(token)
+        # backfilled minute closes are stale prices: the marks and the kill switch only see live ticks
+        live = [tick for tick in ticks if not tick.get("backfill")]
+        if live:
+            self.portfolio.on_ticks(live)
+            self.kill_switch.check()
             
     def option_contracts(self):
         option_contracts = []
@@ -217,7 +268,7 @@ class ZerodhaOptionBuyer:
     def get_atm_contract(self, duration = 0, offset = 0):
         self.df_opt_contracts = self.option_contracts()
         
-        self.df_opt_contracts["time_to_expiry"] = (pd.to_datetime(self.df_opt_contracts["expiry"]) + dt.timedelta(0,16*3600) - dt.datetime.now()).dt.total_seconds() / dt.timedelta(days=1).total_seconds() + 1 # add 1 to get around the issue of time to expiry becoming 0 for options maturing on trading day   
+        self.df_opt_contracts["time_to_expiry"] = (pd.to_datetime(self.df_opt_contracts["expiry"]) + dt.timedelta(0,16*3600) - clock.now()).dt.total_seconds() / dt.timedelta(days=1).total_seconds() + 1 # add 1 to get around the issue of time to expiry becoming 0 for options maturing on trading day   
         min_day_count = np.sort(self.df_opt_contracts["time_to_expiry"].unique())[duration]
         
         temp = (self.df_opt_contracts[self.df_opt_contracts["time_to_expiry"] == min_day_count]).reset_index(drop=True)
@@ -244,7 +295,7 @@ class ZerodhaOptionBuyer:
     def fetchOHLC(self, ticker, interval, duration):
         """extracts historical data and outputs in the form of dataframe"""
         instrument = self.instrumentLookup(ticker)
-        data = pd.DataFrame(self.kite.historical_data(instrument,dt.date.today()-dt.timedelta(duration), dt.date.today(),interval))
+        data = pd.DataFrame(self.kite.historical_data(instrument,clock.today()-dt.timedelta(duration), clock.today(),interval))
         data.set_index("date",inplace=True)
         return data
     
@@ -278,17 +329,13 @@ class ZerodhaOptionBuyer:
         print(f"Risk/Reward: {risk_to_reward}")
         return round(risk_to_reward,2)
     
-    @multitasking.task
     def check_margin(self, order_param, threshold=0.5):
-        margin = self.kite.margins()   
-        cash_avl = margin["equity"]["net"]
-        bskt_order_margin = self.kite.basket_order_margins(order_param)
-        req_margin = bskt_order_margin["final"]["total"]
+        # long option buys are estimated locally, equity comes from the cached margin view;
+        # order params carry one lot, placeSLOrder buys `lots` of them
+        basket = [dict(order, quantity=order["quantity"] * self.lots) for order in order_param]
+        ok, req_margin, cash_avl = self.margin_service.check(basket, threshold)
         print(f"Required Margin: {req_margin} Available Cash: {cash_avl} Cash Allocated: {threshold * cash_avl}")
-        if float(req_margin) < threshold * cash_avl:
-            return True
-        else:
-            return
+        return ok
     
     @multitasking.task
     def placeSLOrder(self, order_params):
@@ -317,18 +364,21 @@ class ZerodhaOptionBuyer:
             }
             # try:
             print(f"[MARKET] Buy Order {buy_order}")
-            self.buy_order_id = self.kite.place_order(tradingsymbol=buy_order["tradingsymbol"],
+            self.buy_order_id = self.gateway.place_order(tradingsymbol=buy_order["tradingsymbol"],
                     exchange=buy_order["exchange"],
                     transaction_type=buy_order["transaction_type"],
                     quantity=buy_order["quantity"],
                     order_type=buy_order["order_type"],
                     product=buy_order["product"],
-                    variety=buy_order["variety"])
+                    variety=buy_order["variety"],
+                    tag=self.buy_tag).result()
+            self.saveState()
             
             self.order_status_check(self.buy_order_id)
             
             print(f"[SL ORDER] Sell Order {sl_sell_order}")
-            self.sell_order_id = self.kite.place_order(tradingsymbol=sl_sell_order["tradingsymbol"],
+            self.sell_order_id = self.gateway.place_order(priority=PRIORITY_SL,
+                    tradingsymbol=sl_sell_order["tradingsymbol"],
                     exchange=sl_sell_order["exchange"],
                     transaction_type=sl_sell_order["transaction_type"],
                     quantity=sl_sell_order["quantity"],
@@ -336,10 +386,11 @@ class ZerodhaOptionBuyer:
                     price=round(order["price"] - self.stoploss,1),
                     trigger_price=round(order["price"] - self.stoploss,1),
                     product=sl_sell_order["product"],
-                    variety=sl_sell_order["variety"])
+                    variety=sl_sell_order["variety"]).result()
             
             print(f"Order Executed - Buy Order: {self.buy_order_id}, Sell Order: {self.sell_order_id}")
             self.order_placed = True
+            self.saveState()
             # except Exception as e:
                 # print(e)
                 
@@ -352,14 +403,14 @@ class ZerodhaOptionBuyer:
     
     def placeLimitOrder(self, order_params):    
         # Place an intraday limit order on NFO
-        order_id = self.kite.place_order(tradingsymbol=order_params['tradingsymbol'],
+        order_id = self.gateway.place_order(tradingsymbol=order_params['tradingsymbol'],
                                     exchange=order_params['exchange'],
                                     transaction_type=order_params['transaction_type'],
                                     quantity=order_params['quantity'],
                                     price=order_params['price'],
                                     order_type=order_params['order_type'],
                                     product=order_params['product'],
-                                    variety=order_params['variety'])
+                                    variety=order_params['variety']).result()
         return order_id
     
     def modifyOrder(self,order_id,price):    
@@ -372,11 +423,12 @@ class ZerodhaOptionBuyer:
         "variety":self.kite.VARIETY_REGULAR
         }
         print(f"Modifiying order {order_params}")
-        self.kite.modify_order(order_id=order_id,
+        self.gateway.modify_order(priority=PRIORITY_SL,
+                    order_id=order_id,
                     price=round(price,1),
                     trigger_price=price,
                     order_type=self.kite.ORDER_TYPE_SL,
-                    variety=self.kite.VARIETY_REGULAR) 
+                    variety=self.kite.VARIETY_REGULAR).result()
     
     def placeMarketOrder(self, symbol,buy_sell,quantity):    
         print(f"[MARKET ORDER] {symbol}, {buy_sell}, {quantity}")
@@ -385,65 +437,60 @@ class ZerodhaOptionBuyer:
             t_type=self.kite.TRANSACTION_TYPE_BUY
         elif buy_sell == "sell":
             t_type=self.kite.TRANSACTION_TYPE_SELL
-        self.kite.place_order(tradingsymbol=symbol,
+        return self.gateway.place_order(tradingsymbol=symbol,
                         exchange=self.kite.EXCHANGE_NFO,
                         transaction_type=t_type,
                         quantity=quantity,
                         order_type=self.kite.ORDER_TYPE_MARKET,
                         product=self.kite.PRODUCT_MIS,
-                        variety=self.kite.VARIETY_REGULAR)
+                        variety=self.kite.VARIETY_REGULAR).result()
         
     def cancelOrder(self, order_id):   
         print(f"[CANCEL ORDER] {order_id}")
         # Modify order given order id
-        self.kite.cancel_order(order_id=order_id,
-                        variety=self.kite.VARIETY_REGULAR)  
+        self.gateway.cancel_order(priority=PRIORITY_EXIT,
+                        order_id=order_id,
+                        variety=self.kite.VARIETY_REGULAR).result()
     
     def squareOff(self):
-        #fetching orders and position information   
-        a,b = 0,0
-        while a < 10:
-            try:
-                pos_df = pd.DataFrame(self.kite.positions()["day"])
-                break
-            except:
-                print("can't extract position data..retrying")
-                a+=1
-        while b < 10:
-            try:
-                ord_df = pd.DataFrame(self.kite.orders())
-                break
-            except:
-                print("can't extract order data..retrying")
-                b+=1
-
+        #cancel pending orders and close the contract's position within the order rate limit;
+        # other positions in the account are left alone
+        positions = [p for p in self.kite.positions()["day"] if p["tradingsymbol"] in self.contracts]
+        orders = [o for o in self.kite.orders() if o["tradingsymbol"] in self.contracts]
+        self.square_off = SquareOff(self.kite, gateway=self.gateway, logger=self.log)
+        try:
+            report = self.square_off.run(positions, orders)
+        finally:
+            self.square_off = None
+        print(f"Square off complete in {report['time_to_flat']:.3f}s - exits: {report['exits']}")
+        if report["failed"] or report["unconfirmed"]:
+            print(f"Square off failed: {report['failed']} unconfirmed: {report['unconfirmed']}")
+    
+    def saveState(self):
+        self.checkpoint.save({"order_placed":self.order_placed, "buy_order_id":self.buy_order_id,
+                              "sell_order_id":self.sell_order_id, "buy_tag":self.buy_tag,
+                              "tradingsymbol":self.opt_chain.tradingsymbol.to_list()[0]})
 
-        #closing all pending orders
-        if not ord_df.empty and 'status' in ord_df.columns:
-            pending = ord_df[ord_df['status'].isin(["TRIGGER PENDING","OPEN"])]["order_id"].tolist()
-            drop = []
-            attempt = 0
-            while len(pending)>0 and attempt<5:
-                pending = [j for j in pending if j not in drop]
-                for order in pending:
-                    try:
-                        self.cancelOrder(order)
-                        drop.append(order)
-                    except:
-                        print("unable to delete order id : ",order)
-                        attempt+=1   
-                        
+    def restoreState(self, saved):
+        # keep trading the contract bought before the restart even if the ATM strike moved since
+        if not saved.get("order_placed"):
+            return
+        chain = self.df_opt_contracts[self.df_opt_contracts.tradingsymbol == saved["tradingsymbol"]]
+        if not chain.empty:
+            self.opt_chain = chain.reset_index(drop=True)
+        self.order_placed = True
+        self.buy_order_id = saved.get("buy_order_id")
+        self.sell_order_id = saved.get("sell_order_id")
+        self.buy_tag = saved.get("buy_tag")
+        if self.buy_order_id is None:
+            # crashed between sending the buy and recording its id: find it by tag
+            matches = [o["order_id"] for o in self.kite.orders() if self.buy_tag and o.get("tag") == self.buy_tag]
+            if matches:
+                self.buy_order_id = matches[0]
+            else:
+                self.order_placed = False
+        print(f"Restored from checkpoint - order placed: {self.order_placed} buy order: {self.buy_order_id}")
 
-        #closing all open position      
-        for i in range(len(pos_df)):
-            ticker = pos_df["tradingsymbol"].values[i]
-            if pos_df["quantity"].values[i] > 0:
-                quantity = pos_df["quantity"].values[i]
-                self.placeMarketOrder(ticker,"sell", quantity)
-            if pos_df["quantity"].values[i] < 0:
-                quantity = abs(pos_df["quantity"].values[i])
-                self.placeMarketOrder(ticker,"buy", quantity)
-    
     def order_status_check(self, ord_id):
         pending_complete = True
         while pending_complete:
@@ -454,14 +501,13 @@ class ZerodhaOptionBuyer:
                 print(f"Order Executed: {ord_id}")
                 # print(f"Order Details: {orders_df.loc[orders_df.order_id == ord_id]}")
                 break
-            time.sleep(0.5)
+            clock.sleep(0.5)
            
     def is_present(self, df):
         if len(df)>0:
             if len([i for i in df.tradingsymbol if i in self.option_data_df.index]) > 0:
                 return True
     
-    @multitasking.task
     def strategy(self):
         a,b,c = 0,0,0
         while a < 10:
@@ -501,8 +547,8 @@ class ZerodhaOptionBuyer:
                         pending_order_id = filtered_orders["order_id"].values[0]
                         buy_price = ord_df.loc[ord_df.order_id == self.buy_order_id]["average_price"].values[0]
                         ltp = self.option_data_df['price'].to_list()[0] 
-                        # pnl = self.option_data_df['pnl'].to_list()[0] 
-                        ask_price = self.option_data_df['ask'].to_list()[0] 
+                        pnl = self.portfolio.pnl()
+                        token = self.opt_chain.instrument_token.to_list()[0]
                         # mid_price = self.option_data_df['mid_price'].to_list()[0] 
                         # sell_order = ord_df.loc[ord_df.order_id == self.sell_order_id]
                         
@@ -511,18 +557,20 @@ class ZerodhaOptionBuyer:
                         
                         # print(f"{buy_price}/{ltp}/{mid_price}")
                         # print(f"\r{buy_price} | {take_profit_price} | {stop_loss_price} | {ltp}")
-                        print(f"\r{buy_price} | {take_profit_price} | {stop_loss_price} | {ltp}", end='', flush=True)
+                        print(f"\r{buy_price} | {take_profit_price} | {stop_loss_price} | {ltp} | P&L {pnl:.2f}", end='', flush=True)
 
                         # Determine the new price based on LTP
                         try:
+                            # the pending order is the SELL closing the long: the stop loss hits the bid,
+                            # the take profit rests at the microprice so it is not handed over at the ask
                             if ltp <= stop_loss_price:
-                                self.modifyOrder(pending_order_id, ask_price)
+                                self.modifyOrder(pending_order_id, self.depth.exit_price(token, "sell", urgent=True))
                                 print("Stop loss condition met... Exiting")
-                                time.sleep(2)
+                                clock.sleep(2)
                             elif ltp >= take_profit_price:
-                                self.modifyOrder(pending_order_id, ask_price)
+                                self.modifyOrder(pending_order_id, self.depth.exit_price(token, "sell"))
                                 print("Take profit condition met... Exiting")
-                                time.sleep(2)
+                                clock.sleep(2)
                         except Exception as e:
                             pass
                     else:
@@ -536,10 +584,16 @@ class ZerodhaOptionBuyer:
                     
         else:
             # print(f"Creating ORDER")
+            if not self.schedule.entries_allowed() or self.kill_switch.tripped:
+                return
             order_params = self.create_order_params()
+            if not order_params:
+                return  # no price for the contract yet
             
             if self.check_margin(order_params):
                 self.order_placed = True
+                self.buy_tag = "BO" + uuid.uuid4().hex[:10]
+                self.saveState()
                 self.placeSLOrder(order_params)
             else:
                 print(f"insufficient margin to place order {order_params}")
@@ -0,0 +1,140 @@
+"""
+Crash-safe strategy state for warm restarts.
+
+A Checkpoint keeps two files per strategy and trading day:
+
+    <name>-<YYYYMMDD>.json    snapshot: the strategy's state dict, the last
+                              processed tick time per instrument and the
+                              journal offset the state covers; written to a
+                              temp file, fsynced and renamed over the old one
+    <name>-<YYYYMMDD>.ticks   journal: every tick as a fixed 20 byte record
+                              (token, time, price), appended before the tick
+                              is processed
+
+On start the strategy loads the snapshot of the current day (a previous
+day's state is ignored) and replays the journal records written after it.
+A torn record at the end of the journal (crash mid-write) is truncated
+away when the journal is reopened. save() must run on the thread that
+processes the recorded ticks, after processing them.
+
+    KITETRADE_CHECKPOINT_DIR=checkpoints    directory for both files
+"""
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+import clock
+
+TICK_DTYPE = np.dtype([("token", "<u4"), ("time", "<f8"), ("price", "<f8")])
+
+
+class Checkpoint():
+    """
+    Snapshot + tick journal for one strategy.
+
+    :Parameters:
+        name : str
+            file name prefix, one per strategy instance
+        directory : str
+            where the files go, defaults to KITETRADE_CHECKPOINT_DIR or "checkpoints"
+        interval : float
+            seconds between snapshots for due()
+    """
+
+    def __init__(self, name, directory=None, interval=60, logger=None):
+        self.name = name
+        self.directory = directory or os.getenv("KITETRADE_CHECKPOINT_DIR", "checkpoints")
+        self.interval = interval
+        self.log = logger or logging.getLogger(__name__)
+        self.last_tick = {}
+        self.saved_at = None
+        self._day = clock.today().strftime("%Y%m%d")
+        self._lock = threading.Lock()
+        self._offset = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._journal = open(self.journal_path, "ab")
+        self._written = self._journal.tell()
+        torn = self._written % TICK_DTYPE.itemsize
+        if torn:
+            self.log.warning(f"dropping a torn record at the end of {self.journal_path}")
+            self._written -= torn
+            self._journal.truncate(self._written)
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.directory, f"{self.name}-{self._day}.json")
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.directory, f"{self.name}-{self._day}.ticks")
+
+    # ---------------------------------------------
+    def load(self):
+        """State dict of today's last snapshot, or None when there is none (or it is unreadable)."""
+        try:
+            with open(self.snapshot_path) as f:
+                snap = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.log.error(f"checkpoint {self.snapshot_path} unreadable, starting fresh: {e}")
+            return None
+        self._offset = snap.get("offset", 0)
+        self.last_tick = {int(k): v for k, v in snap.get("last_tick", {}).items()}
+        self.saved_at = snap.get("saved")
+        self.log.info(f"checkpoint loaded from {self.snapshot_path} (saved {snap.get('saved')})")
+        return snap.get("state")
+
+    def save(self, state):
+        """Atomically replace the snapshot with `state` (JSON serializable), covering every tick recorded so far."""
+        with self._lock:
+            self._journal.flush()
+            snap = {"saved": clock.time(), "offset": self._written,
+                    "last_tick": {str(k): v for k, v in self.last_tick.items()}, "state": state}
+            tmp = self.snapshot_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(snap, f, separators=(",", ":"), default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_path)
+            self._offset = self._written
+            self.saved_at = snap["saved"]
+
+    def due(self):
+        """True when the last snapshot is older than `interval`."""
+        return self.saved_at is None or clock.time() - self.saved_at >= self.interval
+
+    # ---------------------------------------------
+    def record(self, ticks, token="instrument_token", price="last_price"):
+        """Append kite ticks to the journal before they are processed."""
+        if not ticks:
+            return
+        now = clock.time()
+        rows = np.empty(len(ticks), dtype=TICK_DTYPE)
+        for i, tick in enumerate(ticks):
+            rows[i] = (tick[token], now, tick[price])
+        with self._lock:
+            self._journal.write(rows.tobytes())
+            self._journal.flush()
+            self._written += rows.nbytes
+            for t in rows["token"].tolist():
+                self.last_tick[t] = now
+
+    def replay(self):
+        """Journal records written after the loaded snapshot, as a TICK_DTYPE array in arrival order."""
+        with self._lock:
+            self._journal.flush()
+            with open(self.journal_path, "rb") as f:
+                f.seek(self._offset)
+                raw = f.read()
+        rows = np.frombuffer(raw, dtype=TICK_DTYPE)
+        for t, ts in zip(rows["token"].tolist(), rows["time"].tolist()):
+            self.last_tick[t] = ts
+        return rows
+
+    def close(self):
+        with self._lock:
+            self._journal.close()
@@ -0,0 +1,232 @@
+"""
+Injectable clock for the strategy loops.
+
+Everything that schedules by wall time (RecurringTask, the run loops,
+candle boundaries, market-hour checks, order polling) asks the process
+clock instead of calling time.time()/datetime.now()/time.sleep() directly,
+so the same code can be driven faster than real time:
+
+    RealClock       the system clock (default)
+    SimulatedClock  virtual time from a start instant, either scaled
+                    (`speed` virtual seconds per real second) or stepped,
+                    where sleep() jumps straight to the earliest wake-up
+    ReplayClock     time only moves when a historical data feed calls
+                    advance_to() with its timestamps; sleepers wake once
+                    the replay reaches their wake-up time
+
+Datetimes are naive local time, like datetime.now() in the scripts.
+Transport pacing (rate limits, HTTP retry backoff, latency measurements)
+stays on the real clock since it paces real requests.
+
+    KITETRADE_CLOCK_START=2024-01-05T09:15   run the scripts on a SimulatedClock from this time
+    KITETRADE_CLOCK_SPEED=60                 virtual seconds per real second, "max" to step
+"""
+import datetime as dt
+import os
+import threading
+import time as _time
+
+
+def _epoch(value):
+    """datetime / pandas Timestamp / ISO string / epoch seconds -> epoch seconds"""
+    if value is None:
+        return _time.time()
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = dt.datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+class Clock():
+    """Base clock: subclasses provide time() and sleep()."""
+
+    def time(self):
+        raise NotImplementedError
+
+    def sleep(self, seconds):
+        raise NotImplementedError
+
+    def monotonic(self):
+        return self.time()
+
+    def now(self):
+        return dt.datetime.fromtimestamp(self.time())
+
+    def today(self):
+        return self.now().date()
+
+    def sleep_until(self, when):
+        """Sleep until `when` (datetime or epoch seconds)."""
+        self.sleep(_epoch(when) - self.time())
+
+
+class RealClock(Clock):
+    """The system clock."""
+
+    def time(self):
+        return _time.time()
+
+    def monotonic(self):
+        return _time.monotonic()
+
+    def now(self):
+        return dt.datetime.now()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            _time.sleep(seconds)
+
+
+class SimulatedClock(Clock):
+    """
+    Virtual time starting at `start`.
+
+    :Parameters:
+        start : datetime, str or float
+            first instant, defaults to the current time
+        speed : float
+            virtual seconds per real second; None steps instead: a sleep()
+            returns at once with the clock moved to the earliest pending
+            wake-up, so threads that sleep wake in wake-up order
+        settle : float
+            real seconds a stepped sleep waits for other threads to reach
+            their own sleep() before jumping
+    """
+
+    def __init__(self, start=None, speed=None, settle=0.001):
+        self._cond = threading.Condition()
+        self.settle = settle
+        self._now = _epoch(start)
+        self.speed = speed
+        self._real0 = _time.monotonic()
+        self._sleepers = []
+
+    def time(self):
+        if self.speed:
+            return self._now + (_time.monotonic() - self._real0) * self.speed
+        with self._cond:
+            return self._now
+
+    def advance(self, seconds):
+        """Move the clock forward by `seconds`."""
+        self.advance_to(self.time() + seconds)
+
+    def advance_to(self, when):
+        """Move the clock forward to `when`; never moves it back."""
+        target = _epoch(when)
+        with self._cond:
+            if self.speed:
+                if target > self.time():
+                    self._now, self._real0 = target, _time.monotonic()
+            elif target > self._now:
+                self._now = target
+            self._cond.notify_all()
+
+    def sleep(self, seconds):
+        if seconds <= 0:
+            return
+        if self.speed:
+            _time.sleep(seconds / self.speed)
+            return
+        with self._cond:
+            wake = (self._now + seconds, object())
+            self._sleepers.append(wake)
+            try:
+                while self._now < wake[0]:
+                    if min(self._sleepers, key=lambda s: s[0]) is not wake:
+                        self._cond.wait(0.05)
+                        continue
+                    # give threads that are about to sleep a moment to register an earlier wake-up
+                    self._cond.wait(self.settle)
+                    if self._now < wake[0] and min(self._sleepers, key=lambda s: s[0]) is wake:
+                        self._now = wake[0]
+                        self._cond.notify_all()
+            finally:
+                self._sleepers.remove(wake)
+
+
+class ReplayClock(SimulatedClock):
+    """
+    Time driven by a data replay: the feed calls advance_to() with the
+    timestamp of each tick/bar before delivering it. close() ends the
+    replay and releases every sleeper.
+    """
+
+    def __init__(self, start=None):
+        super().__init__(start, speed=None)
+        self.closed = False
+
+    def sleep(self, seconds):
+        if seconds <= 0:
+            return
+        with self._cond:
+            wake = self._now + seconds
+            while self._now < wake and not self.closed:
+                self._cond.wait(0.5)
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+# =============================================
+
+_clock = None
+_lock = threading.Lock()
+
+
+def from_env():
+    """SimulatedClock when KITETRADE_CLOCK_START is set, otherwise RealClock."""
+    start = os.getenv("KITETRADE_CLOCK_START")
+    if not start:
+        return RealClock()
+    speed = os.getenv("KITETRADE_CLOCK_SPEED", "max")
+    return SimulatedClock(start, None if speed.lower() in ("max", "0", "") else float(speed))
+
+
+def get_clock():
+    global _clock
+    with _lock:
+        if _clock is None:
+            _clock = from_env()
+        return _clock
+
+
+def set_clock(clock):
+    """Install `clock` for the process; returns the previous one."""
+    global _clock
+    with _lock:
+        previous, _clock = _clock, clock
+    return previous
+
+
+def time():
+    return get_clock().time()
+
+
+def monotonic():
+    return get_clock().monotonic()
+
+
+def now():
+    return get_clock().now()
+
+
+def today():
+    return get_clock().today()
+
+
+def sleep(seconds):
+    get_clock().sleep(seconds)
+
+
+def sleep_until(when):
+    get_clock().sleep_until(when)
+
+
+def candle_start(ts, minutes, session_open=dt.time(9, 15)):
+    """Start of the `minutes` candle holding `ts`, candles counted from the session open (09:15 on NSE)."""
+    opened = dt.datetime.combine(ts.date(), session_open, tzinfo=ts.tzinfo)
+    return opened + dt.timedelta(minutes=((ts - opened) // dt.timedelta(minutes=minutes)) * minutes)
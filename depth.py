@@ -0,0 +1,168 @@
+"""
+Five level order book per instrument, kept in numpy arrays.
+
+DepthBook.update() writes MODE_FULL ticks into per-instrument rows of
+(instrument, level) arrays in place; quote and ltp ticks only move the
+last price and volume. From the rows it derives, per instrument:
+
+    spread        best ask - best bid
+    mid           (bid + ask) / 2
+    microprice    level 1 prices weighted by the opposite side's quantity,
+                  leans towards the side about to be taken out
+    imbalance     (bid qty - ask qty) / (bid qty + ask qty) over the levels
+    volume_delta  traded volume over the last `window` ticks, a running sum
+
+Decoding and shipping depth is what makes MODE_FULL expensive, so
+required_mode() maps the tick fields a subscriber reads to the cheapest
+KiteTicker mode that carries them.
+"""
+import logging
+import math
+
+import numpy as np
+import pandas as pd
+
+LEVELS = 5
+
+# tick fields by the cheapest KiteTicker mode that delivers them (tradable instruments)
+MODE_FIELDS = {
+    "ltp": {"instrument_token", "last_price", "tradable", "mode"},
+    "quote": {"last_traded_quantity", "average_traded_price", "volume_traded", "total_buy_quantity",
+              "total_sell_quantity", "ohlc", "change"},
+    "full": {"last_trade_time", "oi", "oi_day_high", "oi_day_low", "exchange_timestamp", "depth"},
+}
+MODES = ("ltp", "quote", "full")
+
+
+def required_mode(fields):
+    """Cheapest KiteTicker mode ("ltp", "quote" or "full") whose ticks carry every one of `fields`."""
+    needed = 0
+    for field in fields:
+        for level, mode in enumerate(MODES):
+            if field in MODE_FIELDS[mode]:
+                needed = max(needed, level)
+                break
+        else:
+            raise ValueError(f"no tick mode carries {field}")
+    return MODES[needed]
+
+
+def round_down(price, tick_size):
+    return round(math.floor(price / tick_size + 1e-9) * tick_size, 2)
+
+
+def round_up(price, tick_size):
+    return round(math.ceil(price / tick_size - 1e-9) * tick_size, 2)
+
+
+class DepthBook():
+    """
+    Order book and microstructure features for a set of instruments.
+
+    :Parameters:
+        tokens : list
+            instrument tokens, one row each
+        window : int
+            ticks in the rolling traded volume
+        tick_size : float
+            price grid for exit_price
+    """
+
+    def __init__(self, tokens, window=20, tick_size=0.05, logger=None):
+        self.tokens = [int(t) for t in tokens]
+        self.row = {t: i for i, t in enumerate(self.tokens)}
+        self.window = window
+        self.tick_size = tick_size
+        self.log = logger or logging.getLogger(__name__)
+        n = len(self.tokens)
+        self.bid_price = np.full((n, LEVELS), np.nan)
+        self.bid_qty = np.zeros((n, LEVELS))
+        self.ask_price = np.full((n, LEVELS), np.nan)
+        self.ask_qty = np.zeros((n, LEVELS))
+        self.last = np.full(n, np.nan)
+        self.volume = np.full(n, -1, dtype=np.int64)  # cumulative day volume, -1 before the first quote tick
+        self._deltas = np.zeros((n, window), dtype=np.int64)
+        self._pos = np.zeros(n, dtype=np.int64)
+        self.volume_window = np.zeros(n, dtype=np.int64)
+
+    # ---------------------------------------------
+    def update(self, ticks):
+        for tick in ticks:
+            i = self.row.get(tick["instrument_token"])
+            if i is None:
+                continue
+            self.last[i] = tick["last_price"]
+            volume = tick.get("volume_traded")
+            if volume is not None:
+                if self.volume[i] >= 0:
+                    # running sum over the last `window` ticks: add the new delta, drop the oldest
+                    delta = max(volume - self.volume[i], 0)
+                    pos = self._pos[i]
+                    self.volume_window[i] += delta - self._deltas[i, pos]
+                    self._deltas[i, pos] = delta
+                    self._pos[i] = (pos + 1) % self.window
+                self.volume[i] = volume
+            depth = tick.get("depth")
+            if depth:
+                for side, prices, qtys in (("buy", self.bid_price, self.bid_qty), ("sell", self.ask_price, self.ask_qty)):
+                    for level, entry in enumerate(depth[side][:LEVELS]):
+                        if entry["quantity"]:
+                            prices[i, level] = entry["price"]
+                            qtys[i, level] = entry["quantity"]
+                        else:
+                            prices[i, level] = np.nan
+                            qtys[i, level] = 0
+
+    # ---------------------------------------------
+    def spread(self, token):
+        i = self.row[token]
+        return self.ask_price[i, 0] - self.bid_price[i, 0]
+
+    def mid(self, token):
+        i = self.row[token]
+        return (self.ask_price[i, 0] + self.bid_price[i, 0]) / 2
+
+    def microprice(self, token):
+        i = self.row[token]
+        bq, aq = self.bid_qty[i, 0], self.ask_qty[i, 0]
+        if bq + aq == 0:
+            return np.nan
+        return (self.bid_price[i, 0] * aq + self.ask_price[i, 0] * bq) / (bq + aq)
+
+    def imbalance(self, token, levels=LEVELS):
+        i = self.row[token]
+        bq, aq = self.bid_qty[i, :levels].sum(), self.ask_qty[i, :levels].sum()
+        return (bq - aq) / (bq + aq) if bq + aq else 0.0
+
+    def volume_delta(self, token):
+        return int(self.volume_window[self.row[token]])
+
+    def features(self):
+        """All instruments at once: last, bid, ask, spread, mid, microprice, imbalance, volume_delta."""
+        bid, ask = self.bid_price[:, 0], self.ask_price[:, 0]
+        bq, aq = self.bid_qty[:, 0], self.ask_qty[:, 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            micro = (bid * aq + ask * bq) / (bq + aq)
+            depth_b, depth_a = self.bid_qty.sum(axis=1), self.ask_qty.sum(axis=1)
+            imbalance = np.where(depth_b + depth_a > 0, (depth_b - depth_a) / (depth_b + depth_a), 0.0)
+        return pd.DataFrame({"last": self.last, "bid": bid, "ask": ask, "spread": ask - bid, "mid": (bid + ask) / 2,
+                             "microprice": micro, "imbalance": imbalance, "volume_delta": self.volume_window},
+                            index=pd.Index(self.tokens, name="instrument_token"))
+
+    def exit_price(self, token, side, urgent=False):
+        """
+        Limit price to exit with: `side` is the exit order's side ("sell" closes a long).
+        urgent exits (stop loss) take the touch on the other side; the rest
+        rest at the microprice, rounded to the tick away from the market and
+        kept inside the spread. Falls back to the last price without depth.
+        """
+        i = self.row[token]
+        bid, ask = self.bid_price[i, 0], self.ask_price[i, 0]
+        if not (bid == bid and ask == ask):
+            return self.last[i]
+        if urgent:
+            return bid if side == "sell" else ask
+        micro = self.microprice(token)
+        if side == "sell":
+            return min(max(round_up(micro, self.tick_size), bid), ask)
+        return max(min(round_down(micro, self.tick_size), ask), bid)
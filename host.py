@@ -0,0 +1,634 @@
+"""
+Strategy host: several strategies in one process on one feed.
+
+The standalone scripts each log in, download the instrument dump, open a
+websocket and a REST session of their own. The host owns all of that once
+and runs strategies as plugins:
+
+    InstrumentRegistry  one instruments() dump per exchange, token <-> symbol maps
+    BarBuilder          OHLC bars of N minutes per token, built from the ticks
+    StrategyHost        authentication, a single KiteTicker (subscribed to the
+                        union of the strategies' instruments, each token in the
+                        richest mode any strategy needs for the tick fields it
+                        reads), reconnect backfill, one OrderGateway +
+                        TrailingStopManager, one 1-minute bar store the
+                        strategies' candles are derived from, one position/order
+                        book fetch per bar shared by all strategies, and a
+                        Portfolio with live P&L per strategy plus a kill switch
+
+Strategies subclass Strategy and implement any of
+
+    on_start(host)          once, before the feed starts
+    on_tick(ticks)          ticks of the strategy's instruments from one websocket message
+    on_bar(minutes, bars)   at every `minutes` boundary the strategy listed in bar_minutes;
+                            bars is a DataFrame of the finished bars indexed by symbol
+    on_order(order)         order updates for orders the strategy placed
+    on_stop()               once, at shutdown
+
+Hooks are scheduled cooperatively: one dispatcher thread calls them one at
+a time in event order, so a strategy needs no locking but must not block
+for long (heavy per-ticker work belongs in a sharded strategy, see
+sharding.py). CPU and wall time are accounted per strategy and hook; a
+hook call over `budget` seconds is logged.
+
+main() runs the host through a SessionScheduler: it starts at warmup on
+trading days only, strategies get no new entries after the entry cut-off,
+the hosted symbols are squared off at the square_off phase and the host
+stops at shutdown.
+
+    python host.py renko_atr three_sup_trend
+    python host.py renko_atr --shards 4
+"""
+import argparse
+import collections
+import datetime as dt
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import auth
+import clock
+import latency
+import signals
+import tools
+import watchlists
+from bars import BarStore
+from depth import MODES, required_mode
+from order_gateway import OrderGateway, PRIORITY_ENTRY, PRIORITY_SL
+from portfolio import Portfolio, KillSwitch
+from reconnect import ReconnectManager
+from scheduler import SessionScheduler
+from squareoff import SquareOff
+from sharding import ShardedUniverse, RenkoMacdShard, SupertrendShard
+from trailing import TrailingStopManager
+
+# check min, python version
+if sys.version_info < (3, 8):
+    raise SystemError("Python version >= 3.8")
+
+HISTORICAL_RATE = 3  # historical API requests per second
+
+# =============================================
+
+
+class InstrumentRegistry():
+    """
+    Instrument dumps fetched once per exchange and shared by every strategy.
+
+    :Parameters:
+        kite : KiteConnect
+            authenticated client
+    """
+
+    def __init__(self, kite):
+        self.kite = kite
+        self._frames = {}
+        self._tokens = {}   # (exchange, tradingsymbol) -> token
+        self._symbols = {}  # token -> tradingsymbol
+        self._lock = threading.Lock()
+
+    def frame(self, exchange="NSE"):
+        with self._lock:
+            if exchange not in self._frames:
+                df = pd.DataFrame(self.kite.instruments(exchange))
+                self._frames[exchange] = df
+                for token, symbol in zip(df["instrument_token"].tolist(), df["tradingsymbol"].tolist()):
+                    self._tokens[(exchange, symbol)] = int(token)
+                    self._symbols[int(token)] = symbol
+            return self._frames[exchange]
+
+    def token(self, symbol, exchange="NSE"):
+        self.frame(exchange)
+        return self._tokens[(exchange, symbol)]
+
+    def tokens(self, symbols, exchange="NSE"):
+        self.frame(exchange)
+        return [self._tokens[(exchange, symbol)] for symbol in symbols]
+
+    def symbol(self, token):
+        return self._symbols.get(int(token))
+
+
+class BarBuilder():
+    """
+    OHLC bars of `minutes` per instrument token, counted from the session open.
+
+    update() feeds a price; flush() hands out the bars that ended by a boundary.
+    """
+
+    def __init__(self, minutes):
+        self.minutes = minutes
+        self._open = {}  # token -> [start, open, high, low, close, ticks]
+        self._done = collections.defaultdict(list)
+
+    def update(self, token, price, ts):
+        start = clock.candle_start(ts, self.minutes)
+        bar = self._open.get(token)
+        if bar is None or start > bar[0]:
+            if bar is not None:
+                self._done[token].append(bar)
+            self._open[token] = [start, price, price, price, price, 1]
+        elif start == bar[0]:
+            bar[2] = max(bar[2], price)
+            bar[3] = min(bar[3], price)
+            bar[4] = price
+            bar[5] += 1
+
+    def flush(self, boundary):
+        """{token: [start, open, high, low, close, ticks]} of the last bar per token that ended by `boundary`."""
+        out = {}
+        for token, done in self._done.items():
+            if done:
+                out[token] = done[-1]
+        self._done.clear()
+        for token, bar in list(self._open.items()):
+            if bar[0] + dt.timedelta(minutes=self.minutes) <= boundary:
+                out[token] = bar
+                del self._open[token]
+        return out
+
+
+class Strategy():
+    """
+    Base class of the host's strategy plugins.
+
+    :Parameters:
+        name : str
+            unique per host, defaults to the class name
+        symbols : list
+            tradingsymbols to subscribe
+        exchange : str
+            exchange of the symbols
+        fields : tuple
+            tick fields the strategy reads; the mode defaults to the cheapest
+            one carrying them (depth.required_mode)
+        mode : str
+            "ltp", "quote" or "full" tick mode, overrides fields
+        bar_minutes : tuple
+            bar sizes on_bar is called for
+    """
+
+    symbols = ()
+    exchange = "NSE"
+    fields = ("last_price",)
+    mode = None
+    bar_minutes = ()
+    backfill = True  # replay missed minutes after a websocket gap
+
+    def __init__(self, name=None, symbols=None, exchange=None, fields=None, mode=None, bar_minutes=None):
+        self.name = name or type(self).__name__
+        self.symbols = list(symbols if symbols is not None else self.symbols)
+        self.exchange = exchange or self.exchange
+        self.fields = tuple(fields if fields is not None else self.fields)
+        self.mode = mode or self.mode or required_mode(self.fields)
+        self.bar_minutes = tuple(bar_minutes if bar_minutes is not None else self.bar_minutes)
+        self.host = None
+        self.log = logging.getLogger(self.name)
+
+    def on_start(self, host):
+        self.host = host
+
+    def on_tick(self, ticks):
+        pass
+
+    def on_bar(self, minutes, bars):
+        pass
+
+    def on_order(self, order):
+        pass
+
+    def on_stop(self):
+        pass
+
+    def place_order(self, priority=PRIORITY_ENTRY, **params):
+        """Place through the host's gateway, tagged so order updates come back to this strategy."""
+        return self.host.place_order(self, priority, **params)
+
+
+class SignalStrategy(Strategy):
+    """
+    Plugin form of the renko_atr / three_sup_trend loop: a sharding.ShardStrategy
+    keeps the indicator state (in process, or over `shards` worker processes),
+    every 5-minute bar its rows go through signals and entries are sent as a
+    market order followed by a stop loss order once the entry is accepted.
+
+    :Parameters:
+        capital : float
+            position size per entry
+        shards : int
+            worker processes for the indicator state, 0 runs it in the host
+    """
+
+    shard_cls = None
+    capital = 5000
+    bar_minutes = (5,)
+
+    def __init__(self, name=None, symbols=None, capital=None, shards=0, saved=None, **kwargs):
+        super().__init__(name, symbols, **kwargs)
+        self.capital = capital or self.capital
+        self.shards = shards
+        self.saved = saved
+        self.universe = None
+        self.local = None
+
+    def on_start(self, host):
+        super().on_start(host)
+        self.slots = {token: i for i, token in enumerate(self.tokens)}
+        if self.shards:
+            self.universe = ShardedUniverse(self.shard_cls, self.symbols, self.tokens, self.shards,
+                                            kite_args=host.kite_args, saved=self.saved, logger=self.log)
+            self.universe.start()
+        else:
+            self.local = self.shard_cls(host.kite, self.symbols, self.tokens, host.historical, self.saved, logger=self.log,
+                                        store=host.bars)
+
+    def on_tick(self, ticks):
+        if self.universe:
+            self.universe.on_ticks(ticks)
+            return
+        slots = [self.slots[tick["instrument_token"]] for tick in ticks]
+        prices = [tick["last_price"] for tick in ticks]
+        self.local.on_ticks(np.array(slots, dtype="int64"), np.array(prices, dtype="float64"))
+
+    def on_bar(self, minutes, bars):
+        if self.universe:
+            state = self.universe.cycle()
+        else:
+            state = pd.DataFrame.from_dict(self.local.cycle(), orient="index", columns=signals.STATE_COLUMNS)
+        if state.empty:
+            return
+        pos_df, ord_df = self.host.book()
+        actions = signals.evaluate(signals.build_table(state, pos_df, ord_df, self.capital))
+        signals.dispatch(actions, self.enter, self.host.trailing.update, self.log,
+                         entries=self.host.entries_allowed())
+
+    def enter(self, symbol, side, quantity, stop):
+        kite = self.host.kite
+        t_type, t_type_sl = ((kite.TRANSACTION_TYPE_BUY, kite.TRANSACTION_TYPE_SELL) if side == "buy"
+                             else (kite.TRANSACTION_TYPE_SELL, kite.TRANSACTION_TYPE_BUY))
+        entry = self.place_order(tradingsymbol=symbol, exchange=self.exchange, transaction_type=t_type,
+                                 quantity=quantity, order_type=kite.ORDER_TYPE_MARKET,
+                                 product=kite.PRODUCT_MIS, variety=kite.VARIETY_REGULAR)
+
+        def protect(future):
+            if future.exception() is not None:
+                return
+            self.place_order(priority=PRIORITY_SL, tradingsymbol=symbol, exchange=self.exchange,
+                             transaction_type=t_type_sl, quantity=quantity, order_type=kite.ORDER_TYPE_SL,
+                             price=round(stop, 1), trigger_price=round(stop, 1),
+                             product=kite.PRODUCT_MIS, variety=kite.VARIETY_REGULAR)
+        entry.add_done_callback(protect)
+
+    def on_stop(self):
+        if self.universe:
+            self.universe.stop()
+
+
+class RenkoMacd(SignalStrategy):
+    """renko_atr as a plugin."""
+    shard_cls = RenkoMacdShard
+    symbols = watchlists.RENKO_ATR
+    capital = 6000
+
+
+class TripleSupertrend(SignalStrategy):
+    """three_sup_trend as a plugin."""
+    shard_cls = SupertrendShard
+    symbols = watchlists.THREE_SUP_TREND
+    capital = 5000
+    backfill = False  # works off historical candles only
+
+
+PLUGINS = {"renko_atr": RenkoMacd, "three_sup_trend": TripleSupertrend}
+
+# =============================================
+
+
+class StrategyHost():
+    """
+    Runs Strategy plugins on shared connections.
+
+    :Parameters:
+        kite : KiteConnect
+            authenticated client
+        kws : KiteTicker
+            created with reconnect enabled; the host takes over its callbacks
+        kite_args : tuple
+            (api_key, access_token, root) for sharded strategies' workers
+        budget : float
+            seconds a single hook call may take before it is logged
+        max_loss : float
+            day loss (all hosted strategies) that squares off and stops new entries
+        schedule : SessionScheduler
+            session whose entry window gates new entries, None allows them any time
+    """
+
+    def __init__(self, kite, kws, kite_args=None, budget=0.05, max_loss=None, schedule=None, logger=None):
+        self.kite = kite
+        self.kws = kws
+        self.kite_args = kite_args
+        self.budget = budget
+        self.log = logger or logging.getLogger(__name__)
+        self.instruments = InstrumentRegistry(kite)
+        self.gateway = OrderGateway(kite, logger=self.log)
+        self.trailing = TrailingStopManager(self.gateway, logger=self.log)
+        self.historical = tools.TokenBucket(HISTORICAL_RATE)
+        self.bars = BarStore(kite, self.historical, logger=self.log)  # one 1-minute history per instrument for all strategies
+        self.portfolio = Portfolio(logger=self.log)
+        self.kill_switch = KillSwitch(self.portfolio, self._kill, max_loss=max_loss, logger=self.log)
+        self.schedule = schedule
+        self.square_off = None  # the SquareOff in progress, confirms its exits from the order updates
+        self._flattening = threading.Lock()  # the kill switch and the session square-off never overlap
+        self.strategies = []
+        self.stats = collections.defaultdict(lambda: {"calls": 0, "cpu": 0.0, "wall": 0.0, "max": 0.0, "errors": 0})
+        self._by_token = collections.defaultdict(list)
+        self._by_symbol = collections.defaultdict(list)  # tradingsymbol -> strategies trading it
+        self._builders = {}
+        self._tags = {}       # order tag prefix -> strategy
+        self._order_ids = {}  # order id -> strategy
+        self._book = (None, None)
+        self._events = queue.Queue()
+        self._running = False
+        self._dispatcher = None
+        self._stopped = False
+
+    def add(self, strategy):
+        if any(s.name == strategy.name for s in self.strategies):
+            raise ValueError(f"a strategy named {strategy.name} is already hosted")
+        if strategy.mode not in MODES:
+            raise ValueError(f"unknown tick mode {strategy.mode}")
+        strategy.tag = f"S{len(self.strategies)}"
+        self._tags[strategy.tag] = strategy
+        self.strategies.append(strategy)
+        return strategy
+
+    # ---------------------------------------------
+    def place_order(self, strategy, priority=PRIORITY_ENTRY, **params):
+        params.setdefault("tag", strategy.tag + "X" + uuid.uuid4().hex[:10])
+        future = self.gateway.place_order(priority, **params)
+
+        def remember(future):
+            if future.exception() is None:
+                self._order_ids[str(future.result())] = strategy
+        future.add_done_callback(remember)
+        return future
+
+    def entries_allowed(self):
+        """New entries only inside the session's entry window and while the kill switch is armed."""
+        if self.kill_switch.tripped:
+            return False
+        return self.schedule is None or self.schedule.entries_allowed()
+
+    def book(self):
+        """(positions, orders) frames, fetched at most once per bar for all strategies."""
+        pos_df, ord_df = self._book
+        if pos_df is None:
+            for attempt in range(10):
+                try:
+                    pos_df = pd.DataFrame(self.kite.positions()["day"])
+                    ord_df = pd.DataFrame(self.kite.orders())
+                    break
+                except Exception as e:
+                    self.log.error(f"can't extract position/order data ({e})..retrying")
+            else:
+                pos_df, ord_df = pd.DataFrame(), pd.DataFrame()
+            self.trailing.sync(ord_df)
+            self._book = (pos_df, ord_df)
+        return pos_df, ord_df
+
+    def report(self):
+        """Per strategy and hook: calls, CPU and wall seconds, slowest call, errors."""
+        rows = [{"strategy": name, "hook": hook, **values} for (name, hook), values in self.stats.items()]
+        return pd.DataFrame(rows, columns=["strategy", "hook", "calls", "cpu", "wall", "max", "errors"])
+
+    # ---------------------------------------------
+    def _call(self, strategy, hook, *args):
+        cpu, wall = time.thread_time(), time.perf_counter()
+        stats = self.stats[(strategy.name, hook)]
+        try:
+            getattr(strategy, hook)(*args)
+        except Exception as e:
+            stats["errors"] += 1
+            self.log.exception(f"{strategy.name}.{hook} failed: {e}")
+        wall = time.perf_counter() - wall
+        stats["calls"] += 1
+        stats["cpu"] += time.thread_time() - cpu
+        stats["wall"] += wall
+        stats["max"] = max(stats["max"], wall)
+        if latency.enabled():
+            latency.record(f"host.{strategy.name}.{hook}", wall)
+        if wall > self.budget and hook in ("on_tick", "on_order"):
+            self.log.warning(f"{strategy.name}.{hook} took {wall * 1000:.0f}ms, the feed waits meanwhile")
+
+    def _on_ticks(self, ws, ticks):
+        self._events.put(("tick", ticks))
+
+    def _on_connect(self, ws, response):
+        modes = {}
+        for strategy in self.strategies:
+            for token in strategy.tokens:
+                modes[token] = max(modes.get(token, 0), MODES.index(strategy.mode))
+        ws.subscribe(list(modes))
+        for level, mode in enumerate(MODES):
+            tokens = [token for token, m in modes.items() if m == level]
+            if tokens:
+                ws.set_mode(mode, tokens)
+
+    def _on_order_update(self, ws, order):
+        # straight from the websocket thread: a square-off may be running on the dispatcher
+        square_off = self.square_off
+        if square_off:
+            square_off.on_order_update(ws, order)
+        self._events.put(("order", order))
+
+    def _dispatch_ticks(self, ticks):
+        now = clock.now()
+        batches = collections.defaultdict(list)
+        for tick in ticks:
+            token = tick["instrument_token"]
+            ts = tick.get("exchange_timestamp") or now
+            for builder in self._builders.values():
+                builder.update(token, tick["last_price"], ts)
+            for strategy in self._by_token.get(token, ()):
+                batches[strategy].append(tick)
+        for strategy, batch in batches.items():
+            self._call(strategy, "on_tick", batch)
+        # backfilled minute closes are stale prices: the marks and the kill switch only see live ticks
+        live = [tick for tick in ticks if not tick.get("backfill")]
+        if live:
+            self.portfolio.on_ticks(live)
+            self.kill_switch.check()
+
+    def _dispatch_bar(self, minutes, boundary):
+        bars = self._builders[minutes].flush(boundary)
+        self._book = (None, None)  # one fresh position/order fetch per bar
+        for strategy in self.strategies:
+            if minutes not in strategy.bar_minutes:
+                continue
+            mine = {self.instruments.symbol(t): bars[t][:5] for t in strategy.tokens if t in bars}
+            frame = pd.DataFrame.from_dict(mine, orient="index", columns=["date", "open", "high", "low", "close"])
+            self._call(strategy, "on_bar", minutes, frame)
+
+    def _dispatch_order(self, order):
+        strategy = self._order_ids.get(str(order.get("order_id")))
+        tag = order.get("tag") or ""
+        if strategy is None and tag[:1] == "S":
+            strategy = self._tags.get(tag.split("X", 1)[0])
+        if strategy is not None:
+            self._order_ids[str(order.get("order_id"))] = strategy
+            self.portfolio.apply_order(order, strategy=strategy.name)
+            self._call(strategy, "on_order", order)
+            return
+        # SquareOff ("SQ..." tags), broker and manual exits: close the rows holding the symbol
+        owners = self._by_symbol.get(order.get("tradingsymbol"))
+        if owners:
+            self.portfolio.apply_exit(order, fallback=owners[0].name)
+
+    def flatten(self, reason):
+        """Square off the positions and pending orders of every hosted symbol."""
+        with self._flattening:
+            symbols = {symbol for strategy in self.strategies for symbol in strategy.symbols}
+            positions = [p for p in self.kite.positions()["day"] if p["tradingsymbol"] in symbols]
+            orders = [o for o in self.kite.orders() if o["tradingsymbol"] in symbols]
+            self.square_off = SquareOff(self.kite, gateway=self.gateway, logger=self.log)
+            try:
+                report = self.square_off.run(positions, orders)
+            finally:
+                self.square_off = None
+        log = self.log.error if report["failed"] else self.log.info
+        log(f"{reason}: squared off {sorted(report['exits'])}, failed {report['failed']}")
+        return report
+
+    def _kill(self, reason):
+        self.flatten(f"kill switch ({reason})")
+
+    def _bar_clock(self):
+        starts = {m: clock.candle_start(clock.now(), m) for m in self._builders}
+        while self._running:
+            clock.sleep(1)
+            now = clock.now()
+            for minutes, last in starts.items():
+                start = clock.candle_start(now, minutes)
+                if start != last:
+                    starts[minutes] = start
+                    self._events.put(("bar", minutes, start))
+
+    # ---------------------------------------------
+    def start(self):
+        """Start every strategy, connect the feed and begin dispatching (returns at once)."""
+        for strategy in list(self.strategies):
+            strategy.tokens = self.instruments.tokens(strategy.symbols, strategy.exchange)
+            self._call(strategy, "on_start", self)
+            if self.stats[(strategy.name, "on_start")]["errors"]:
+                self.log.error(f"{strategy.name} failed to start and is not hosted")
+                self.strategies.remove(strategy)
+                continue
+            for token in strategy.tokens:
+                self._by_token[token].append(strategy)
+            for symbol in strategy.symbols:
+                self._by_symbol[symbol].append(strategy)
+            for minutes in strategy.bar_minutes:
+                self._builders.setdefault(minutes, BarBuilder(minutes))
+        symbols = {symbol for strategy in self.strategies for symbol in strategy.symbols}
+        self.portfolio.load_positions([p for p in self.kite.positions()["day"] if p["tradingsymbol"] in symbols])
+        backfill = sorted({t for s in self.strategies if s.backfill for t in s.tokens})
+        self.reconnect = ReconnectManager(self.kws, self.kite, self._on_ticks, self._on_connect, backfill,
+                                          backfill=bool(backfill), bucket=self.historical, logger=self.log)
+        self.kws.on_order_update = self._on_order_update
+        self._running = True
+        self._dispatcher = threading.Thread(target=self.run, name="host-dispatch", daemon=True)
+        self._dispatcher.start()
+        threading.Thread(target=self._bar_clock, name="host-bars", daemon=True).start()
+        self.reconnect.connect(threaded=True)
+        self.log.info(f"hosting {', '.join(s.name for s in self.strategies)} on {len(self._by_token)} instruments")
+
+    def run(self):
+        while self._running:
+            try:
+                event = self._events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if event[0] == "tick":
+                self._dispatch_ticks(event[1])
+            elif event[0] == "bar":
+                self._dispatch_bar(event[1], event[2])
+            elif event[0] == "order":
+                self._dispatch_order(event[1])
+            elif event[0] == "stop":
+                break
+
+    def stop(self):
+        """Stop the feed, the dispatcher and the strategies; safe to call more than once or before start()."""
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._dispatcher is not None:
+            self._running = False
+            self._events.put(("stop",))
+            self._dispatcher.join(30)
+            try:
+                self.kws.close()
+            except Exception:
+                pass
+            for strategy in self.strategies:
+                self._call(strategy, "on_stop")
+        self.gateway.stop()
+        report = self.report()
+        if len(report):
+            self.log.info("strategy time (s):\n" + report.to_string(index=False))
+        positions = self.portfolio.frame()
+        if len(positions):
+            self.log.info(f"P&L {self.portfolio.pnl():.2f}:\n" + positions.to_string(index=False))
+
+
+def main():
+    from kiteconnect import KiteConnect, KiteTicker
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description='Run several strategies on one login, feed and order gateway.')
+    parser.add_argument('strategies', nargs='+', choices=sorted(PLUGINS), help='Strategies to host.')
+    parser.add_argument('--shards', type=int, default=int(os.getenv("KITETRADE_SHARDS", "0")),
+                        help='Worker processes per strategy for the indicator state (0 = in the host).')
+    parser.add_argument('--max-loss', type=float, default=os.getenv("KITETRADE_MAX_LOSS"),
+                        help='Day loss that squares off every hosted strategy and stops new entries.')
+    parser.add_argument('--budget', type=float, default=0.05, help='Log tick/order hook calls slower than this (s).')
+    args = parser.parse_args()
+
+    load_dotenv()
+    logger = tools.createLogger(logfile="host.log", json_lines=bool(os.getenv('KITETRADE_LOG_JSON')))
+    api_key = os.getenv('KITETRADE_API_KEY')
+    access_token = os.getenv('KITETRADE_ACCESS_TOKEN')
+    kite_root = os.getenv('KITETRADE_ROOT')
+    kite = KiteConnect(api_key=api_key, root=kite_root)
+    access_token = auth.authenticate(kite, auth.prompt_login(os.getenv('KITETRADE_API_SECRET')), access_token,
+                                     logger=logger)
+    latency.instrument(kite)
+    kws = KiteTicker(api_key, access_token, root=os.getenv('KITETRADE_WS_ROOT'),
+                     reconnect_max_tries=300, reconnect_max_delay=30)
+
+    schedule = SessionScheduler(logger=logger)
+    host = StrategyHost(kite, kws, kite_args=(api_key, access_token, kite_root), budget=args.budget,
+                         max_loss=float(args.max_loss) if args.max_loss else None, schedule=schedule,
+                         logger=logger)
+    for name in args.strategies:
+        host.add(PLUGINS[name](name=name, shards=args.shards))
+    schedule.on("warmup", host.start)
+    schedule.on("square_off", lambda: host.flatten("session square-off"))
+    schedule.on("shutdown", host.stop)
+    try:
+        schedule.run()
+    except KeyboardInterrupt:
+        logger.error('Keyboard exception received. Exiting.')
+    finally:
+        host.stop()
+
+
+if __name__ == "__main__":
+    main()
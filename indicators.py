@@ -0,0 +1,124 @@
+"""
+Indicator kernels shared by the strategy scripts.
+
+Kept free of any Kite session or module level state so they can be
+imported by backtests and benchmarks without logging in.
+"""
+import numpy as np
+import pandas as pd
+
+
+def atr(DF,n):
+    "function to calculate True Range and Average True Range"
+    df = DF.copy()
+    df['H-L']=abs(df['high']-df['low'])
+    df['H-PC']=abs(df['high']-df['close'].shift(1))
+    df['L-PC']=abs(df['low']-df['close'].shift(1))
+    df['TR']=df[['H-L','H-PC','L-PC']].max(axis=1,skipna=False)
+    df['ATR'] = df['TR'].ewm(com=n,min_periods=n).mean()
+    return df['ATR']
+
+def true_range(high,low,close):
+    "True Range of high/low/close arrays; NaN on the first bar like atr()"
+    prev = np.concatenate(([np.nan], close[:-1]))
+    return np.max([high-low, np.abs(high-prev), np.abs(low-prev)], axis=0)
+
+def atr_array(tr,n):
+    "Average True Range of a True Range array, same smoothing as atr()"
+    return pd.Series(tr).ewm(com=n,min_periods=n).mean().to_numpy()
+
+def supertrend_array(high,low,close,atr,n,m):
+    """Supertrend line from high/low/close/ATR arrays, bar for bar the same as supertrend()
+        n = ATR period the atr array was built with
+        m = multiplier"""
+    hl2 = (high+low)/2
+    BU = (hl2 + m*atr).tolist()
+    BL = (hl2 - m*atr).tolist()
+    c = close.tolist()
+    ub, lb = BU[:], BL[:]
+    size = len(c)
+    for i in range(n,size):
+        ub[i] = min(BU[i],ub[i-1]) if c[i-1]<=ub[i-1] else BU[i]
+        lb[i] = max(BL[i],lb[i-1]) if c[i-1]>=lb[i-1] else BL[i]
+    st = [np.nan]*size
+    test = None
+    for test in range(n,size):
+        if c[test-1]<=ub[test-1] and c[test]>ub[test]:
+            st[test] = lb[test]
+            break
+        if c[test-1]>=lb[test-1] and c[test]<lb[test]:
+            st[test] = ub[test]
+            break
+    if test is None:
+        return np.array(st)
+    for i in range(test+1,size):
+        if st[i-1]==ub[i-1] and c[i]<=ub[i]:
+            st[i] = ub[i]
+        elif st[i-1]==ub[i-1] and c[i]>=ub[i]:
+            st[i] = lb[i]
+        elif st[i-1]==lb[i-1] and c[i]>=lb[i]:
+            st[i] = lb[i]
+        elif st[i-1]==lb[i-1] and c[i]<=lb[i]:
+            st[i] = ub[i]
+    return np.array(st)
+
+def supertrend(DF,n,m):
+    """function to calculate Supertrend given historical candle data
+        n = n day ATR - usually 7 day ATR is used
+        m = multiplier - usually 2 or 3 is used"""
+    high, low, close = (DF[c].to_numpy(dtype=float) for c in ("high","low","close"))
+    atr_n = atr_array(true_range(high,low,close),n)
+    return pd.Series(supertrend_array(high,low,close,atr_n,n,m), index=DF.index, name="Strend")
+
+def sl_price(ohlc):
+    """function to calculate stop loss based on supertrends"""
+    st = ohlc.iloc[-1,[-3,-2,-1]]
+    if st.min() > ohlc["close"][-1]:
+        sl = (0.6*st.sort_values(ascending = True)[0]) + (0.4*st.sort_values(ascending = True)[1])
+    elif st.max() < ohlc["close"][-1]:
+        sl = (0.6*st.sort_values(ascending = False)[0]) + (0.4*st.sort_values(ascending = False)[1])
+    else:
+        sl = st.mean()
+    return round(sl,1)
+
+def sl_prices(st,close,weight=0.6):
+    """sl_price for every bar: st is a (bars, 3) array of supertrend lines"""
+    ordered = np.sort(st,axis=1)
+    above = np.fmin.reduce(st,axis=1) > close
+    below = np.fmax.reduce(st,axis=1) < close
+    valid = ~np.isnan(st)
+    with np.errstate(invalid="ignore"):
+        mean = np.where(valid,st,0).sum(axis=1) / valid.sum(axis=1)
+    sl = np.where(above, weight*ordered[:,0] + (1-weight)*ordered[:,1],
+                  np.where(below, weight*ordered[:,-1] + (1-weight)*ordered[:,-2], mean))
+    return np.round(sl,1)
+
+def MACD(DF,a,b,c):
+    """function to calculate MACD
+       typical values a(fast moving average) = 12;
+                      b(slow moving average) =26;
+                      c(signal line ma window) =9"""
+    df = DF.copy()
+    df["MA_Fast"]=df["close"].ewm(span=a,min_periods=a).mean()
+    df["MA_Slow"]=df["close"].ewm(span=b,min_periods=b).mean()
+    df["MACD"]=df["MA_Fast"]-df["MA_Slow"]
+    df["Signal"]=df["MACD"].ewm(span=c,min_periods=c).mean()
+    df.dropna(inplace=True)
+    return df
+
+def renkoUpdate(param,price):
+    """updates one ticker's renko state {"brick_size","upper_limit","lower_limit","brick"} in place for a new price"""
+    if param["upper_limit"] == None:
+        param["upper_limit"] = price + param["brick_size"]
+        param["lower_limit"] = price - param["brick_size"]
+    if price > param["upper_limit"]:
+        gap = (price - param["upper_limit"])//param["brick_size"]
+        param["lower_limit"] = param["upper_limit"] + (gap*param["brick_size"]) - param["brick_size"]
+        param["upper_limit"] = param["upper_limit"] + ((1+gap)*param["brick_size"])
+        param["brick"] = max(1,param["brick"]+(1+gap))
+    if price < param["lower_limit"]:
+        gap = (param["lower_limit"] - price)//param["brick_size"]
+        param["upper_limit"] = param["lower_limit"] - (gap*param["brick_size"]) + param["brick_size"]
+        param["lower_limit"] = param["lower_limit"] - ((1+gap)*param["brick_size"])
+        param["brick"] = min(-1,param["brick"]-(1+gap))
+    return param
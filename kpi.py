@@ -0,0 +1,167 @@
+"""
+Performance KPIs over many return series at once.
+
+Every function takes period returns as a 1-D array/Series (one strategy)
+or a 2-D array/DataFrame (time x strategies). summary() computes CAGR,
+volatility, Sharpe and max drawdown in one pass sharing the cumulative
+growth series; rolling() gives the same metrics over a sliding window.
+Periodicity is a name from PERIODS_PER_YEAR or a number of periods per year.
+
+Missing returns count as flat periods for growth and drawdown and are
+skipped for volatility, like the pandas versions in weekly_rebalance.
+"""
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+SESSION_MINUTES = 375  # NSE 09:15 - 15:30
+
+PERIODS_PER_YEAR = {
+    "daily": TRADING_DAYS, "day": TRADING_DAYS,
+    "weekly": 52, "week": 52,
+    "monthly": 12, "month": 12,
+    "minute": TRADING_DAYS * SESSION_MINUTES,
+    "3minute": TRADING_DAYS * SESSION_MINUTES / 3,
+    "5minute": TRADING_DAYS * SESSION_MINUTES / 5,
+    "10minute": TRADING_DAYS * SESSION_MINUTES / 10,
+    "15minute": TRADING_DAYS * SESSION_MINUTES / 15,
+    "30minute": TRADING_DAYS * SESSION_MINUTES / 30,
+    "60minute": TRADING_DAYS * SESSION_MINUTES / 60,
+}
+METRICS = ["cagr", "volatility", "sharpe", "max_dd"]
+
+# rolling drawdown works on (windows, strategies, window) blocks of at most this many values
+_BLOCK_VALUES = 4000000
+
+
+def periods_per_year(periodicity):
+    if isinstance(periodicity, str):
+        return float(PERIODS_PER_YEAR[periodicity])
+    return float(periodicity)
+
+
+def _as_2d(returns):
+    """(values as float 2-D array, index, columns, was_1d)"""
+    if isinstance(returns, pd.DataFrame):
+        return returns.to_numpy(dtype=float), returns.index, returns.columns, False
+    if isinstance(returns, pd.Series):
+        return returns.to_numpy(dtype=float)[:, None], returns.index, [returns.name], True
+    arr = np.asarray(returns, dtype=float)
+    if arr.ndim == 1:
+        return arr[:, None], None, None, True
+    return arr, None, None, False
+
+
+def _growth(r):
+    return np.cumprod(1 + np.nan_to_num(r), axis=0)
+
+
+def _cagr(growth, n, ppy):
+    return growth[-1] ** (ppy / n) - 1
+
+
+def _volatility(r, ppy):
+    return np.nanstd(r, axis=0, ddof=1) * np.sqrt(ppy)
+
+
+def _max_dd(growth):
+    peak = np.maximum.accumulate(growth, axis=0)
+    return ((peak - growth) / peak).max(axis=0)
+
+
+def _sharpe(cagr, vol, rf):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(vol > 0, (cagr - rf) / vol, np.nan)
+
+
+def _shape(values, columns, one):
+    if one:
+        return float(values[0])
+    return pd.Series(values, index=columns) if columns is not None else values
+
+
+# =============================================
+
+def cagr(returns, periodicity="weekly"):
+    r, _, columns, one = _as_2d(returns)
+    return _shape(_cagr(_growth(r), len(r), periods_per_year(periodicity)), columns, one)
+
+
+def volatility(returns, periodicity="weekly"):
+    r, _, columns, one = _as_2d(returns)
+    return _shape(_volatility(r, periods_per_year(periodicity)), columns, one)
+
+
+def sharpe(returns, rf=0.0, periodicity="weekly"):
+    r, _, columns, one = _as_2d(returns)
+    ppy = periods_per_year(periodicity)
+    return _shape(_sharpe(_cagr(_growth(r), len(r), ppy), _volatility(r, ppy), rf), columns, one)
+
+
+def max_drawdown(returns):
+    r, _, columns, one = _as_2d(returns)
+    return _shape(_max_dd(_growth(r)), columns, one)
+
+
+def summary(returns, periodicity="weekly", rf=0.0):
+    """
+    CAGR, volatility, Sharpe and max drawdown in one pass.
+
+    Returns a dict of floats for a single series, otherwise a DataFrame
+    with one row per strategy and METRICS as columns.
+    """
+    r, _, columns, one = _as_2d(returns)
+    ppy = periods_per_year(periodicity)
+    growth = _growth(r)
+    g = _cagr(growth, len(r), ppy)
+    vol = _volatility(r, ppy)
+    values = {"cagr": g, "volatility": vol, "sharpe": _sharpe(g, vol, rf), "max_dd": _max_dd(growth)}
+    if one:
+        return {k: float(v[0]) for k, v in values.items()}
+    return pd.DataFrame(values, index=columns)
+
+
+def rolling(returns, window, periodicity="weekly", rf=0.0):
+    """
+    METRICS over every trailing `window` periods, labelled by the window's last period.
+
+    Returns a DataFrame (metrics as columns) for a single series, otherwise a
+    dict of DataFrames (time x strategies) keyed by metric.
+    """
+    r, index, columns, one = _as_2d(returns)
+    periods, n = r.shape
+    if window < 2 or window > periods:
+        raise ValueError(f"window must be between 2 and {periods}")
+    ppy = periods_per_year(periodicity)
+    filled = np.nan_to_num(r)
+
+    log_growth = np.vstack([np.zeros((1, n)), np.cumsum(np.log1p(filled), axis=0)])
+    window_growth = np.exp(log_growth[window:] - log_growth[:-window])
+    roll_cagr = window_growth ** (ppy / window) - 1
+
+    valid = ~np.isnan(r)
+    count = np.vstack([np.zeros((1, n)), np.cumsum(valid, axis=0)])
+    s1 = np.vstack([np.zeros((1, n)), np.cumsum(filled, axis=0)])
+    s2 = np.vstack([np.zeros((1, n)), np.cumsum(filled ** 2, axis=0)])
+    k = count[window:] - count[:-window]
+    w1 = s1[window:] - s1[:-window]
+    w2 = s2[window:] - s2[:-window]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = np.where(k > 1, (w2 - w1 ** 2 / k) / (k - 1), np.nan)
+    roll_vol = np.sqrt(np.maximum(var, 0)) * np.sqrt(ppy)
+
+    # drawdown inside each window: 1 - exp(min(log growth - running peak of log growth))
+    level = log_growth[1:]
+    windows = np.lib.stride_tricks.sliding_window_view(level, window, axis=0)  # (windows, n, window), no copy
+    roll_dd = np.empty((len(windows), n))
+    step = max(1, _BLOCK_VALUES // (n * window))
+    for start in range(0, len(windows), step):
+        block = windows[start:start + step]
+        roll_dd[start:start + step] = 1 - np.exp((block - np.maximum.accumulate(block, axis=2)).min(axis=2))
+
+    values = {"cagr": roll_cagr, "volatility": roll_vol,
+              "sharpe": _sharpe(roll_cagr, roll_vol, rf), "max_dd": roll_dd}
+    labels = index[window - 1:] if index is not None else None
+    if one:
+        return pd.DataFrame({k: v[:, 0] for k, v in values.items()}, index=labels)
+    return {k: pd.DataFrame(v, index=labels, columns=columns) for k, v in values.items()}
@@ -0,0 +1,297 @@
+"""
+Lightweight latency instrumentation for the tick -> signal -> order path.
+
+Spans are timed with the monotonic clock and recorded into log-linear
+(HDR-style) histograms; Kite API calls are wrapped to feed per-endpoint
+histograms and call/error counters. Everything is a no-op unless enabled,
+either with KITE_LATENCY=1 in the environment or by calling enable()
+before the strategy module is imported.
+
+    KITE_LATENCY=1                  turn instrumentation on
+    KITE_LATENCY_FILE=latency.json  dump a snapshot there at exit
+    KITE_LATENCY_PORT=9108          serve Prometheus text on /metrics
+"""
+import atexit
+import json
+import os
+import threading
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+_enabled = os.getenv("KITE_LATENCY", "").lower() in ("1", "true", "yes")
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_marks = {}
+
+# Kite endpoints wrapped by instrument(); order endpoints also feed tick_to_order
+API_METHODS = ["instruments", "historical_data", "ltp", "quote", "positions", "orders",
+               "order_history", "margins", "basket_order_margins", "profile",
+               "place_order", "modify_order", "cancel_order"]
+ORDER_METHODS = ("place_order", "modify_order", "cancel_order")
+
+
+class Histogram():
+    """
+    Log-linear histogram of microsecond values (about 1.5% relative error).
+
+    Values below 128us get exact buckets, above that each power of two is
+    split into 64 sub-buckets, so memory stays a few KB regardless of range.
+    """
+
+    SUB_BUCKETS = 64
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @classmethod
+    def _index(cls, value):
+        if value < 2 * cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - 7
+        return 2 * cls.SUB_BUCKETS + (shift - 1) * cls.SUB_BUCKETS + ((value >> shift) - cls.SUB_BUCKETS)
+
+    @classmethod
+    def _value(cls, index):
+        """Highest value that falls into bucket `index`."""
+        if index < 2 * cls.SUB_BUCKETS:
+            return index
+        shift = (index - 2 * cls.SUB_BUCKETS) // cls.SUB_BUCKETS + 1
+        sub = (index - 2 * cls.SUB_BUCKETS) % cls.SUB_BUCKETS + cls.SUB_BUCKETS
+        return ((sub + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1e6))
+        idx = self._index(value)
+        if idx >= len(self.counts):
+            self.counts.extend([0] * (idx + 1 - len(self.counts)))
+        self.counts[idx] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def percentile(self, q):
+        """Value in seconds at percentile `q` (0-100)."""
+        if self.count == 0:
+            return 0.0
+        target = max(1, int(round(q / 100.0 * self.count)))
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(self._value(idx), self.max) / 1e6
+        return self.max / 1e6
+
+    def summary(self):
+        return {"count": self.count,
+                "mean": (self.total / self.count / 1e6) if self.count else 0.0,
+                "min": (self.min or 0) / 1e6, "max": self.max / 1e6,
+                "p50": self.percentile(50), "p99": self.percentile(99),
+                "p99.9": self.percentile(99.9)}
+
+
+class _NoopSpan():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class Span():
+    """Times the enclosed block into histogram `name`."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, perf_counter() - self.start)
+        return False
+
+
+# =============================================
+
+def enable(flag=True):
+    """Turn instrumentation on/off. Call before importing a strategy module."""
+    global _enabled
+    _enabled = flag
+
+
+def enabled():
+    return _enabled
+
+
+def record(name, seconds):
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = _histograms[name] = Histogram()
+        hist.record(seconds)
+
+
+def incr(name, value=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def span(name):
+    """Context manager timing a block; a shared no-op object when disabled."""
+    if not _enabled:
+        return _NOOP
+    return Span(name)
+
+
+def timed(name=None):
+    """Decorator version of span(); returns the function untouched when disabled."""
+    def decorator(func):
+        if not _enabled:
+            return func
+        label = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(label, perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def mark(name="tick"):
+    """Remember when an event (e.g. tick arrival) happened on the monotonic clock."""
+    if _enabled:
+        _marks[name] = perf_counter()
+
+
+def since(name, mark_name="tick"):
+    """Record the time elapsed since mark `mark_name` into histogram `name`."""
+    if _enabled and mark_name in _marks:
+        record(name, perf_counter() - _marks[mark_name])
+
+
+def instrument(kite, methods=None):
+    """
+    Wrap Kite API methods on `kite` in place with per-endpoint timing and counters.
+
+    Order endpoints additionally record tick_to_order, the time from the last
+    mark("tick") to the order call returning.
+    """
+    if not _enabled:
+        return kite
+    for method in (methods or API_METHODS):
+        original = getattr(kite, method, None)
+        if original is None or getattr(original, "_latency_wrapped", False):
+            continue
+        setattr(kite, method, _wrap_api(method, original))
+    return kite
+
+
+def _wrap_api(method, original):
+    hist_name = "kite_api." + method
+    is_order = method in ORDER_METHODS
+
+    @wraps(original)
+    def wrapper(*args, **kwargs):
+        incr("api_calls_total." + method)
+        start = perf_counter()
+        try:
+            return original(*args, **kwargs)
+        except Exception:
+            incr("api_errors_total." + method)
+            raise
+        finally:
+            end = perf_counter()
+            record(hist_name, end - start)
+            if is_order and "tick" in _marks:
+                record("tick_to_order", end - _marks["tick"])
+    wrapper._latency_wrapped = True
+    return wrapper
+
+
+# =============================================
+
+def snapshot():
+    with _lock:
+        return {"spans": {k: h.summary() for k, h in _histograms.items()},
+                "counters": dict(_counters)}
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _marks.clear()
+
+
+def dump(path):
+    """Write the current snapshot as JSON to `path`."""
+    with open(path, "w") as f:
+        json.dump(snapshot(), f, indent=2)
+
+
+def prometheus_text():
+    """Current snapshot in the Prometheus text exposition format."""
+    snap = snapshot()
+    lines = ["# TYPE kite_latency_seconds summary"]
+    for name, s in sorted(snap["spans"].items()):
+        for q, key in (("0.5", "p50"), ("0.99", "p99"), ("0.999", "p99.9")):
+            lines.append('kite_latency_seconds{{span="{}",quantile="{}"}} {:.6f}'.format(name, q, s[key]))
+        lines.append('kite_latency_seconds_sum{{span="{}"}} {:.6f}'.format(name, s["mean"] * s["count"]))
+        lines.append('kite_latency_seconds_count{{span="{}"}} {}'.format(name, s["count"]))
+    families = {}
+    for name, value in snap["counters"].items():
+        family, _, label = name.partition(".")
+        families.setdefault(family, []).append((label, value))
+    for family, values in sorted(families.items()):
+        lines.append("# TYPE kite_{} counter".format(family))
+        for label, value in sorted(values):
+            lines.append('kite_{}{{endpoint="{}"}} {}'.format(family, label, value))
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = prometheus_text().encode()
+        self.send_response(200 if self.path.startswith("/metrics") else 404)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host="127.0.0.1"):
+    """Serve prometheus_text() on http://host:port/metrics from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if _enabled:
+    if os.getenv("KITE_LATENCY_FILE"):
+        atexit.register(dump, os.getenv("KITE_LATENCY_FILE"))
+    if os.getenv("KITE_LATENCY_PORT"):
+        serve(int(os.getenv("KITE_LATENCY_PORT")))
@@ -0,0 +1,99 @@
+"""
+Cached margin view for pre-trade checks.
+
+Available equity is fetched once and cached until it goes stale or an
+order update reports a fill (or a cancel/reject that releases blocked
+margin). Required margin for plain long option buys is premium x
+quantity, computed locally; anything else (writes, futures, market
+orders without a price) falls back to the basket margin API.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import clock
+
+OPTION_SUFFIXES = ("CE", "PE")
+RELEASE_STATUSES = ("COMPLETE", "CANCELLED", "REJECTED")
+
+
+class MarginService():
+    """
+    Margin checks with a cached equity balance.
+
+    :Parameters:
+        kite : KiteConnect
+            authenticated client
+        ttl : float
+            seconds a fetched balance is trusted without an order update
+        segment : str
+            margin segment to read ("equity" or "commodity")
+    """
+
+    def __init__(self, kite, ttl=30, segment="equity", logger=None):
+        self.kite = kite
+        self.ttl = ttl
+        self.segment = segment
+        self.log = logger or logging.getLogger(__name__)
+        self.stats = {"fetches": 0, "cache_hits": 0, "local_estimates": 0, "basket_calls": 0}
+
+        self._lock = threading.Lock()
+        self._available = None
+        self._fetched = 0.0
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="margins")
+
+    # ---------------------------------------------
+    def invalidate(self):
+        with self._lock:
+            self._available = None
+
+    def on_order_update(self, ws, data):
+        """KiteTicker.on_order_update callback; drops the cached balance when margin moves."""
+        if data.get("status") in RELEASE_STATUSES or data.get("filled_quantity"):
+            self.invalidate()
+
+    def available(self, refresh=False):
+        """Net available margin of the segment, from cache when fresh."""
+        with self._lock:
+            if not refresh and self._available is not None and clock.monotonic() - self._fetched < self.ttl:
+                self.stats["cache_hits"] += 1
+                return self._available
+        net = float(self.kite.margins()[self.segment]["net"])
+        with self._lock:
+            self._available = net
+            self._fetched = clock.monotonic()
+            self.stats["fetches"] += 1
+        return net
+
+    # ---------------------------------------------
+    @staticmethod
+    def _is_long_option(order):
+        return (order.get("exchange") == "NFO"
+                and str(order.get("tradingsymbol", "")).endswith(OPTION_SUFFIXES)
+                and order.get("transaction_type") == "BUY"
+                and float(order.get("price") or 0) > 0)
+
+    def required(self, orders):
+        """Margin needed for the basket `orders` (list of order param dicts)."""
+        if not orders:
+            return 0.0
+        if all(self._is_long_option(o) for o in orders):
+            self.stats["local_estimates"] += 1
+            return sum(float(o["price"]) * int(o["quantity"]) for o in orders)
+        self.stats["basket_calls"] += 1
+        return float(self.kite.basket_order_margins(orders)["final"]["total"])
+
+    def check(self, orders, threshold=1.0):
+        """
+        Whether `orders` need less than `threshold` x available margin.
+        Returns (ok, required, available); an empty basket is never ok.
+        """
+        if not orders:
+            return False, 0.0, self.available()
+        req = self.required(orders)
+        avl = self.available()
+        return req < threshold * avl, req, avl
+
+    def check_async(self, orders, threshold=1.0):
+        """check() on a worker thread; returns a concurrent.futures.Future."""
+        return self._executor.submit(self.check, orders, threshold)
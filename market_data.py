@@ -0,0 +1,193 @@
+"""
+Bulk, cached daily/weekly price loader built on yfinance.
+
+Prices are fetched for many tickers per yf.download call and stored one
+file per (ticker, interval) under a local cache directory, as parquet
+when pyarrow/fastparquet is installed and as pickle otherwise. Later
+loads only fetch the tail since the last cached bar (re-fetching the whole
+history of a ticker whose adjusted prices changed, e.g. after a dividend).
+Weekly bars are not downloaded separately: they are rolled up from the
+daily cache (bars.aggregate), so daily and weekly users share one file per
+ticker. In offline mode nothing is downloaded.
+
+    KITETRADE_MARKET_DATA_DIR=market_data   cache directory
+    KITETRADE_MARKET_DATA_OFFLINE=1         read the cache only
+"""
+import datetime as dt
+import importlib.util
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from bars import aggregate
+
+FIELDS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+INTERVAL_DAYS = {"1d": 1, "5d": 5, "1wk": 7, "1mo": 31}
+DERIVED = {"1wk": ("1d", "week")}  # interval -> (interval cached and downloaded, bars.aggregate interval)
+PARQUET = any(importlib.util.find_spec(m) is not None for m in ("pyarrow", "fastparquet"))
+
+
+def _yf_download(symbols, start, end, interval):
+    import yfinance as yf
+    return yf.download(symbols, start=start, end=end, interval=interval, group_by="ticker",
+                       auto_adjust=False, threads=True, progress=False)
+
+
+class MarketData():
+    """
+    Cached OHLCV loader.
+
+    :Parameters:
+        cache_dir : str
+            directory holding one file per ticker and interval
+        interval : str
+            yfinance interval ("1d", "1wk", "1mo")
+        suffix : str
+            appended to tickers to form the Yahoo symbol (".NS" for NSE); tickers
+            starting with "^" (indices) are used as-is
+        offline : bool
+            only read the cache
+        download : callable
+            download(symbols, start, end, interval) -> DataFrame like yf.download
+    """
+
+    def __init__(self, cache_dir=None, interval="1wk", suffix=".NS", offline=None,
+                 download=None, logger=None):
+        self.cache_dir = cache_dir or os.getenv("KITETRADE_MARKET_DATA_DIR", "market_data")
+        self.interval = interval
+        self.fetch_interval, self.rollup = DERIVED.get(interval, (interval, None))
+        self.suffix = suffix
+        if offline is None:
+            offline = os.getenv("KITETRADE_MARKET_DATA_OFFLINE", "").lower() in ("1", "true", "yes")
+        self.offline = offline
+        self.download = download or _yf_download
+        self.log = logger or logging.getLogger(__name__)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # ---------------------------------------------
+    def symbol(self, ticker):
+        return ticker if ticker.startswith("^") or "." in ticker else ticker + self.suffix
+
+    def _path(self, ticker):
+        name = "".join(c if c.isalnum() or c in "-_." else "_" for c in ticker)
+        return os.path.join(self.cache_dir, f"{name}_{self.fetch_interval}.{'parquet' if PARQUET else 'pkl'}")
+
+    def _read(self, ticker):
+        path = self._path(ticker)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path) if PARQUET else pd.read_pickle(path)
+
+    def _write(self, ticker, df):
+        path = self._path(ticker)
+        tmp = path + ".tmp"
+        df.to_parquet(tmp) if PARQUET else df.to_pickle(tmp)
+        os.replace(tmp, path)
+
+    # ---------------------------------------------
+    def _split(self, raw, symbols):
+        """yf.download output -> {symbol: OHLCV frame}"""
+        frames = {}
+        if raw is None or raw.empty:
+            return frames
+        if isinstance(raw.columns, pd.MultiIndex):
+            level = 0 if set(symbols) & set(raw.columns.get_level_values(0)) else 1
+            for sym in symbols:
+                if sym in raw.columns.get_level_values(level):
+                    frames[sym] = raw.xs(sym, axis=1, level=level)
+        elif len(symbols) == 1:
+            frames[symbols[0]] = raw
+        out = {}
+        for sym, df in frames.items():
+            df = df.reindex(columns=FIELDS).dropna(how="all")
+            if not df.empty:
+                df.index = pd.DatetimeIndex(df.index).tz_localize(None)
+                out[sym] = df[~df.index.duplicated(keep="last")].sort_index()
+        return out
+
+    def _fetch(self, requests, end):
+        """requests: {ticker: start}. One bulk download per distinct start date."""
+        by_start = {}
+        for ticker, start in requests.items():
+            by_start.setdefault(start, []).append(ticker)
+        fetched = {}
+        for start, tickers in by_start.items():
+            symbols = [self.symbol(t) for t in tickers]
+            self.log.info(f"downloading {len(symbols)} symbols from {start:%Y-%m-%d} ({self.fetch_interval})")
+            frames = self._split(self.download(symbols if len(symbols) > 1 else symbols[0],
+                                               start, end, self.fetch_interval), symbols)
+            for ticker, sym in zip(tickers, symbols):
+                if sym in frames:
+                    fetched[ticker] = frames[sym]
+        return fetched
+
+    def history(self, tickers, start, end=None, refresh=False):
+        """
+        OHLCV frames for `tickers` covering [start, end], from cache where possible.
+        Returns {ticker: DataFrame}; tickers with no data are left out.
+        """
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end or dt.datetime.today()).normalize()
+        step = pd.Timedelta(days=INTERVAL_DAYS.get(self.fetch_interval, 1))
+        cached = {t: (None if refresh else self._read(t)) for t in tickers}
+        if self.offline:
+            missing = [t for t, df in cached.items() if df is None]
+            if missing:
+                self.log.warning(f"offline: no cached data for {missing}")
+            return {t: self._window(df, start, end) for t, df in cached.items() if df is not None}
+
+        requests = {}
+        for ticker, df in cached.items():
+            if df is None or df.empty or df.index[0] > start + step:
+                requests[ticker] = start
+            elif df.index[-1] + step <= end:
+                requests[ticker] = df.index[-1]  # re-fetch the last (possibly partial) bar
+        fetched = self._fetch(requests, end + pd.Timedelta(days=1)) if requests else {}
+
+        # a tail whose overlapping bar has a different adjustment factor means the history was re-adjusted
+        stale = {}
+        for ticker, new in fetched.items():
+            old = cached.get(ticker)
+            if old is None or old.empty or requests[ticker] == start:
+                continue
+            ts = old.index[-1]
+            if ts in new.index:
+                before = old.at[ts, "Adj Close"] / old.at[ts, "Close"]
+                after = new.at[ts, "Adj Close"] / new.at[ts, "Close"]
+                if not np.isclose(before, after, rtol=1e-6, equal_nan=True):
+                    stale[ticker] = min(start, old.index[0])
+        if stale:
+            fetched.update(self._fetch(stale, end + pd.Timedelta(days=1)))
+
+        out = {}
+        for ticker in tickers:
+            df, new = cached.get(ticker), fetched.get(ticker)
+            if new is not None:
+                if df is not None and ticker not in stale:
+                    df = pd.concat([df[df.index < new.index[0]], new, df[df.index > new.index[-1]]])
+                else:
+                    df = new
+                self._write(ticker, df)
+            if df is not None:
+                out[ticker] = self._window(df, start, end)
+        return out
+
+    def _window(self, df, start, end):
+        """Cached bars within [start, end], rolled up when the interval is derived."""
+        df = df[(df.index >= start) & (df.index <= end)]
+        return aggregate(df, self.rollup) if self.rollup else df
+
+    def prices(self, tickers, start, end=None, field="Adj Close", refresh=False):
+        """Aligned (date x ticker) matrix of `field`."""
+        frames = self.history(tickers, start, end, refresh)
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat({t: df[field] for t, df in frames.items()}, axis=1)
+
+    def returns(self, tickers, start, end=None, field="Adj Close", dropna="any", refresh=False):
+        """Period returns of `field` for all tickers, built in one step from the price matrix."""
+        px = self.prices(tickers, start, end, field, refresh)
+        ret = px.pct_change(fill_method=None).iloc[1:]
+        return ret.dropna(how=dropna) if dropna else ret
@@ -0,0 +1,882 @@
+"""
+Local stand-in for the Kite Connect REST API and the KiteTicker websocket.
+
+Implements the endpoints used by the strategy scripts (instruments,
+historical_data, ltp, positions, orders, place/modify/cancel_order, margins,
+basket_order_margins, session/profile) plus the binary ticker feed, so the
+scripts can be run, load tested and timed without a live account.
+
+Point a script at it through the environment:
+
+    KITETRADE_ROOT=http://127.0.0.1:8765
+    KITETRADE_WS_ROOT=ws://127.0.0.1:8766
+    KITETRADE_ACCESS_TOKEN=mock
+
+(buy_options.py reads the same values with the KITE_ prefix.)
+
+Run with:
+
+    python mock_kite.py --latency 0.05 --jitter 0.02 --error-rate 0.01
+
+Counters and tick-to-order latency are served as JSON from /_mock/stats.
+"""
+import argparse
+import base64
+import csv
+import datetime as dt
+import hashlib
+import io
+import json
+import math
+import random
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from tools import TokenBucket
+
+# =============================================
+# check min, python version
+if sys.version_info < (3, 7):
+    raise SystemError("Python version >= 3.7")
+
+# =============================================
+
+SEGMENTS = {"NSE": 1, "NFO": 2, "INDICES": 9}
+TICK_SIZE = 0.05
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Kite API limits per endpoint group (requests per second)
+DEFAULT_RATE_LIMITS = {
+    "quote": 1,
+    "historical": 3,
+    "order": 10,
+    "default": 10,
+}
+
+DEFAULT_SYMBOLS = ["ABB", "ADANIENSOL", "ADANIENT", "ADANIGREEN", "ADANIPORTS", "ATGL", "AWL",
+                   "AMBUJACEM", "APOLLOHOSP", "ASIANPAINT", "DMART", "AXISBANK", "BAJAJ-AUTO",
+                   "BAJFINANCE", "BAJAJFINSV", "BAJAJHLDNG", "BANKBARODA", "BERGEPAINT", "BEL",
+                   "BPCL", "BHARTIARTL", "BOSCHLTD", "BRITANNIA", "CANBK", "CHOLAFIN", "CIPLA",
+                   "COALINDIA", "COLPAL", "DLF", "DABUR", "DIVISLAB", "DRREDDY", "EICHERMOT",
+                   "GAIL", "GODREJCP", "GRASIM", "HCLTECH", "HDFCBANK", "HDFCLIFE", "HAVELLS",
+                   "HEROMOTOCO", "HINDALCO", "HAL", "HINDUNILVR", "ICICIBANK", "ICICIGI",
+                   "ICICIPRULI", "ITC", "IOC", "IRCTC", "INDUSINDBK", "NAUKRI", "INFY", "INDIGO",
+                   "JSWSTEEL", "JINDALSTEL", "KOTAKBANK", "LTIM", "LT", "LICI", "M&M", "MARICO",
+                   "MARUTI", "MUTHOOTFIN", "NTPC", "NESTLEIND", "ONGC", "PIIND", "PIDILITIND",
+                   "POWERGRID", "PGHH", "PNB", "RELIANCE", "SBICARD", "SBILIFE", "SRF",
+                   "MOTHERSON", "SHREECEM", "SHRIRAMFIN", "SIEMENS", "SBIN", "SUNPHARMA",
+                   "TVSMOTOR", "TCS", "TATACONSUM", "TATAMTRDVR", "TATAMOTORS", "TATAPOWER",
+                   "TATASTEEL", "TECHM", "TITAN", "TORNTPHARM", "TRENT", "UPL", "ULTRACEMCO",
+                   "MCDOWELL-N", "VBL", "VEDL", "WIPRO", "ZOMATO", "ZYDUSLIFE", "IRFC", "RVNL",
+                   "HUDCO", "SUZLON", "IREDA", "NBCC", "IRCON", "BHEL"]
+
+INDICES = {
+    "NIFTY 50": {"token": 256265, "name": "NIFTY", "price": 22500.0, "step": 50, "lot_size": 50},
+    "NIFTY BANK": {"token": 260105, "name": "BANKNIFTY", "price": 48000.0, "step": 100, "lot_size": 15},
+}
+
+INTERVALS = {
+    "minute": 1, "3minute": 3, "5minute": 5, "10minute": 10,
+    "15minute": 15, "30minute": 30, "60minute": 60, "day": 375,
+}
+
+
+def round_tick(price):
+    return round(round(price / TICK_SIZE) * TICK_SIZE, 2)
+
+
+def stable_seed(*parts):
+    digest = hashlib.md5("|".join(str(p) for p in parts).encode()).hexdigest()
+    return int(digest[:8], 16)
+
+
+class LatencyStats():
+    """Collects raw samples and reports simple percentiles."""
+
+    def __init__(self):
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def count(self, key):
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def add(self, key, value):
+        with self._lock:
+            self._samples.setdefault(key, []).append(value)
+
+    def snapshot(self):
+        with self._lock:
+            out = {"counts": dict(self._counts), "latency_ms": {}}
+            for key, values in self._samples.items():
+                values = sorted(values)
+                n = len(values)
+                out["latency_ms"][key] = {
+                    "n": n,
+                    "p50": values[int(0.5 * (n - 1))] * 1000,
+                    "p99": values[int(0.99 * (n - 1))] * 1000,
+                    "max": values[-1] * 1000,
+                }
+            return out
+
+
+class MockExchange():
+    """
+    Simulated exchange state: instruments, synthetic prices, orders and positions.
+
+    :Parameters:
+        symbols : list
+            NSE equity trading symbols to list
+        seed : int
+            seed for the synthetic price paths
+        volatility : float
+            annualised volatility of the random walk
+        cash : float
+            starting equity margin
+    """
+
+    def __init__(self, symbols=None, seed=42, volatility=0.3, cash=1000000.0):
+        self.seed = seed
+        self.volatility = volatility
+        self.cash = cash
+        self.rng = random.Random(seed)
+        self.lock = threading.RLock()
+        self.instruments = []
+        self.by_token = {}
+        self.by_key = {}
+        self.prices = {}
+        self.base = {}      # token -> price at the open of start_day, what historical() is anchored on
+        self.anchors = {}   # token -> {days from start_day: log price at that day's open}
+        self.start_day = dt.date.today()
+        self.day_ohlc = {}
+        self.volume = {}
+        self.orders = {}
+        self.order_seq = 0
+        self.positions = {}
+        self.last_tick_sent = {}
+        self.order_listeners = []
+        self.stats = LatencyStats()
+        self._build_instruments(symbols or DEFAULT_SYMBOLS)
+
+    # ---------------------------------------------
+    def _add_instrument(self, row, price):
+        self.instruments.append(row)
+        token = row["instrument_token"]
+        self.by_token[token] = row
+        self.by_key["{}:{}".format(row["exchange"], row["tradingsymbol"])] = row
+        self.prices[token] = price
+        self.base[token] = price
+        self.day_ohlc[token] = [price, price, price, price]
+        self.volume[token] = 0
+
+    def _build_instruments(self, symbols):
+        for i, symbol in enumerate(symbols):
+            rnd = random.Random(stable_seed(self.seed, symbol))
+            token = ((1000 + i) << 8) | SEGMENTS["NSE"]
+            price = round_tick(rnd.uniform(20, 3000))
+            self._add_instrument({
+                "instrument_token": token, "exchange_token": 1000 + i,
+                "tradingsymbol": symbol, "name": symbol, "last_price": 0.0,
+                "expiry": "", "strike": 0.0, "tick_size": TICK_SIZE, "lot_size": 1,
+                "instrument_type": "EQ", "segment": "NSE", "exchange": "NSE"}, price)
+
+        today = dt.date.today()
+        expiries = []
+        day = today
+        while len(expiries) < 4:
+            if day.weekday() == 3:
+                expiries.append(day)
+            day += dt.timedelta(days=1)
+
+        seq = 0
+        for symbol, meta in INDICES.items():
+            self._add_instrument({
+                "instrument_token": meta["token"], "exchange_token": meta["token"] >> 8,
+                "tradingsymbol": symbol, "name": symbol, "last_price": 0.0,
+                "expiry": "", "strike": 0.0, "tick_size": 0.0, "lot_size": 0,
+                "instrument_type": "EQ", "segment": "INDICES", "exchange": "NSE"}, meta["price"])
+            atm = round(meta["price"] / meta["step"]) * meta["step"]
+            for expiry in expiries:
+                for k in range(-10, 11):
+                    strike = atm + k * meta["step"]
+                    for opt in ("CE", "PE"):
+                        seq += 1
+                        token = ((50000 + seq) << 8) | SEGMENTS["NFO"]
+                        moneyness = (meta["price"] - strike) if opt == "CE" else (strike - meta["price"])
+                        days = max(1, (expiry - today).days)
+                        premium = max(0.0, moneyness) + meta["price"] * 0.004 * math.sqrt(days)
+                        symbol_name = "{}{}{}{}".format(meta["name"], expiry.strftime("%y%b").upper(), int(strike), opt)
+                        self._add_instrument({
+                            "instrument_token": token, "exchange_token": 50000 + seq,
+                            "tradingsymbol": symbol_name, "name": meta["name"], "last_price": 0.0,
+                            "expiry": expiry.isoformat(), "strike": float(strike), "tick_size": TICK_SIZE,
+                            "lot_size": meta["lot_size"], "instrument_type": opt,
+                            "segment": "NFO-OPT", "exchange": "NFO"}, round_tick(max(premium, 0.05)))
+
+    # ---------------------------------------------
+    def instruments_csv(self, exchange=None):
+        fields = ["instrument_token", "exchange_token", "tradingsymbol", "name", "last_price",
+                  "expiry", "strike", "tick_size", "lot_size", "instrument_type", "segment", "exchange"]
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=fields, lineterminator="\n")
+        writer.writeheader()
+        for row in self.instruments:
+            if exchange is None or row["exchange"] == exchange:
+                writer.writerow(row)
+        return out.getvalue().encode()
+
+    def step(self, dt_sec):
+        """Advance every price path by `dt_sec` seconds of simulated time."""
+        sigma = self.volatility * math.sqrt(dt_sec / (252 * 6.25 * 3600))
+        with self.lock:
+            for token in self.prices:
+                price = self.prices[token]
+                price = max(TICK_SIZE, price * math.exp(sigma * self.rng.gauss(0, 1)))
+                price = round_tick(price)
+                self.prices[token] = price
+                ohlc = self.day_ohlc[token]
+                ohlc[1] = max(ohlc[1], price)
+                ohlc[2] = min(ohlc[2], price)
+                self.volume[token] += self.rng.randint(1, 50) * 10
+            self._match_pending()
+
+    def _anchor(self, token, day):
+        """Log price of `token` at the open of `day`, relative to its price at the open of the start day."""
+        anchors = self.anchors.setdefault(token, {0: 0.0})
+        n = (day - self.start_day).days
+        step = 1 if n > 0 else -1
+        k = n
+        while k not in anchors:
+            k -= step
+        sigma = self.volatility / math.sqrt(252)
+        while k != n:
+            # the move over day d (zero on weekends) links the opens of d and d + 1
+            d = k if step > 0 else k - 1
+            date = self.start_day + dt.timedelta(d)
+            move = sigma * random.Random(stable_seed(self.seed, token, date)).gauss(0, 1) if date.weekday() < 5 else 0.0
+            anchors[k + step] = anchors[k] + step * move
+            k += step
+        return anchors[n]
+
+    def _minutes(self, token, day):
+        """The 375 one-minute candles of a session as (opens, highs, lows, closes, volumes) lists."""
+        with self.lock:
+            a0, a1 = self._anchor(token, day), self._anchor(token, day + dt.timedelta(1))
+        rnd = random.Random(stable_seed(self.seed, token, day, "minutes"))
+        sigma = self.volatility * math.sqrt(1 / (252 * 375.0))
+        walk = [0.0]
+        for _ in range(375):
+            walk.append(walk[-1] + sigma * rnd.gauss(0, 1))
+        # bridge the walk onto the day's move, so consecutive sessions join up
+        base = math.log(self.base[token])
+        path = [math.exp(base + a0 + w - i / 375.0 * (walk[-1] - (a1 - a0))) for i, w in enumerate(walk)]
+        opens, closes = path[:-1], path[1:]
+        highs = [max(o, c) * (1 + abs(rnd.gauss(0, sigma / 2))) for o, c in zip(opens, closes)]
+        lows = [min(o, c) * (1 - abs(rnd.gauss(0, sigma / 2))) for o, c in zip(opens, closes)]
+        volumes = [rnd.randint(100, 2000) for _ in opens]
+        return opens, highs, lows, closes, volumes
+
+    def historical(self, token, interval, from_date, to_date):
+        """
+        Deterministic synthetic candles: each session's minutes are derived
+        from (token, date) alone, and longer intervals aggregate them, so
+        overlapping requests of any interval agree. Nothing past the last
+        completed minute is served, whatever `to_date` asks for.
+        """
+        minutes = INTERVALS.get(interval)
+        if minutes is None or token not in self.by_token:
+            raise KeyError("invalid interval or token")
+        to_date = min(to_date, dt.datetime.now().replace(second=0, microsecond=0) - dt.timedelta(minutes=1))
+        candles = []
+        day = from_date.date()
+        while day <= to_date.date():
+            if day.weekday() < 5:
+                opens, highs, lows, closes, volumes = self._minutes(token, day)
+                # minutes after to_date are left out: a longer interval's last candle may be partial
+                end = 375
+                if day == to_date.date():
+                    open_ = dt.datetime.combine(day, dt.time(9, 15))
+                    end = max(0, min(375, int((to_date - open_).total_seconds() // 60) + 1))
+                for i in range(0, end, minutes):
+                    if interval == "day":
+                        stamp = dt.datetime.combine(day, dt.time(0, 0))
+                    else:
+                        stamp = dt.datetime.combine(day, dt.time(9, 15)) + dt.timedelta(minutes=i)
+                        if not from_date <= stamp <= to_date:
+                            continue
+                    j = min(i + minutes, end)
+                    candles.append([stamp.strftime("%Y-%m-%dT%H:%M:%S+0530"), round_tick(opens[i]),
+                                    round_tick(max(highs[i:j])), round_tick(min(lows[i:j])),
+                                    round_tick(closes[j - 1]), sum(volumes[i:j])])
+            day += dt.timedelta(days=1)
+        return {"candles": candles}
+
+    # ---------------------------------------------
+    def _new_order_id(self):
+        self.order_seq += 1
+        return "{}{:06d}".format(dt.date.today().strftime("%y%m%d"), self.order_seq)
+
+    def place_order(self, variety, params):
+        key = "{}:{}".format(params.get("exchange"), params.get("tradingsymbol"))
+        row = self.by_key.get(key)
+        if row is None:
+            raise ValueError("Invalid `tradingsymbol`.")
+        token = row["instrument_token"]
+        with self.lock:
+            sent = self.last_tick_sent.get(token)
+            if sent is not None:
+                self.stats.add("tick_to_order", time.time() - sent)
+            order_id = self._new_order_id()
+            order_type = params.get("order_type")
+            order = {
+                "order_id": order_id, "exchange_order_id": order_id, "parent_order_id": None,
+                "placed_by": "MOCK", "variety": variety, "status": "OPEN",
+                "tradingsymbol": row["tradingsymbol"], "exchange": row["exchange"],
+                "instrument_token": token, "transaction_type": params.get("transaction_type"),
+                "order_type": order_type, "product": params.get("product"),
+                "validity": params.get("validity", "DAY"),
+                "quantity": int(params.get("quantity", 0)), "disclosed_quantity": 0,
+                "price": float(params.get("price") or 0), "trigger_price": float(params.get("trigger_price") or 0),
+                "average_price": 0.0, "filled_quantity": 0, "pending_quantity": int(params.get("quantity", 0)),
+                "cancelled_quantity": 0, "tag": params.get("tag"), "status_message": None,
+                "order_timestamp": dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "exchange_timestamp": None,
+            }
+            if order_type in ("SL", "SL-M"):
+                order["status"] = "TRIGGER PENDING"
+            self.orders[order_id] = order
+            self._try_fill(order)
+            self._notify(order)
+        return order_id
+
+    def modify_order(self, order_id, params):
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None or order["status"] not in ("OPEN", "TRIGGER PENDING"):
+                raise ValueError("Order cannot be modified.")
+            for field in ("quantity", "price", "trigger_price", "order_type"):
+                if params.get(field) not in (None, ""):
+                    value = params[field]
+                    order[field] = value if field == "order_type" else (int(value) if field == "quantity" else float(value))
+            order["pending_quantity"] = order["quantity"] - order["filled_quantity"]
+            self._try_fill(order)
+            self._notify(order)
+        return order_id
+
+    def cancel_order(self, order_id):
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None or order["status"] not in ("OPEN", "TRIGGER PENDING"):
+                raise ValueError("Order cannot be cancelled.")
+            order["status"] = "CANCELLED"
+            order["cancelled_quantity"] = order["pending_quantity"]
+            order["pending_quantity"] = 0
+            self._notify(order)
+        return order_id
+
+    def _try_fill(self, order):
+        ltp = self.prices[order["instrument_token"]]
+        buy = order["transaction_type"] == "BUY"
+        order_type = order["order_type"]
+        if order["status"] == "TRIGGER PENDING":
+            trigger = order["trigger_price"]
+            if (buy and ltp >= trigger) or (not buy and ltp <= trigger):
+                order["status"] = "OPEN"
+                order_type = "MARKET" if order_type == "SL-M" else "LIMIT"
+            else:
+                return False
+        if order_type == "LIMIT" or order_type == "SL":
+            if (buy and ltp > order["price"]) or (not buy and ltp < order["price"]):
+                return False
+        self._fill(order, ltp)
+        return True
+
+    def _fill(self, order, price):
+        qty = order["pending_quantity"]
+        order.update(status="COMPLETE", average_price=price, filled_quantity=order["quantity"],
+                     pending_quantity=0, exchange_timestamp=dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        signed = qty if order["transaction_type"] == "BUY" else -qty
+        key = (order["instrument_token"], order["product"])
+        pos = self.positions.setdefault(key, {
+            "tradingsymbol": order["tradingsymbol"], "exchange": order["exchange"],
+            "instrument_token": order["instrument_token"], "product": order["product"],
+            "quantity": 0, "buy_quantity": 0, "sell_quantity": 0, "buy_value": 0.0,
+            "sell_value": 0.0, "multiplier": 1})
+        pos["quantity"] += signed
+        if signed > 0:
+            pos["buy_quantity"] += qty
+            pos["buy_value"] += qty * price
+        else:
+            pos["sell_quantity"] += qty
+            pos["sell_value"] += qty * price
+        self.cash -= signed * price
+
+    def _match_pending(self):
+        for order in list(self.orders.values()):
+            if order["status"] in ("OPEN", "TRIGGER PENDING"):
+                if self._try_fill(order):
+                    self._notify(order)
+
+    def _notify(self, order):
+        message = json.dumps({"type": "order", "data": order})
+        for listener in list(self.order_listeners):
+            listener(message)
+
+    def positions_view(self):
+        with self.lock:
+            day = []
+            for pos in self.positions.values():
+                ltp = self.prices[pos["instrument_token"]]
+                p = dict(pos)
+                p["last_price"] = ltp
+                p["buy_price"] = pos["buy_value"] / pos["buy_quantity"] if pos["buy_quantity"] else 0.0
+                p["sell_price"] = pos["sell_value"] / pos["sell_quantity"] if pos["sell_quantity"] else 0.0
+                p["average_price"] = p["buy_price"] if pos["quantity"] > 0 else p["sell_price"]
+                p["pnl"] = p["m2m"] = pos["sell_value"] - pos["buy_value"] + pos["quantity"] * ltp
+                day.append(p)
+            return {"net": day, "day": day}
+
+    def margins(self):
+        with self.lock:
+            used = sum(abs(p["quantity"]) * self.prices[p["instrument_token"]] * 0.2
+                       for p in self.positions.values())
+            net = self.cash - used
+        return {"equity": {"enabled": True, "net": net,
+                           "available": {"cash": self.cash, "live_balance": net, "opening_balance": self.cash},
+                           "utilised": {"debits": used, "span": used, "exposure": 0.0}},
+                "commodity": {"enabled": False, "net": 0.0, "available": {}, "utilised": {}}}
+
+    def basket_margins(self, orders):
+        total = 0.0
+        details = []
+        for order in orders:
+            row = self.by_key.get("{}:{}".format(order.get("exchange"), order.get("tradingsymbol")))
+            price = float(order.get("price") or 0) or (self.prices[row["instrument_token"]] if row else 0.0)
+            qty = int(order.get("quantity", 0))
+            if row and row["segment"] == "NFO-OPT" and order.get("transaction_type") == "BUY":
+                required = price * qty
+            else:
+                required = price * qty * 0.2
+            total += required
+            details.append({"type": "equity", "tradingsymbol": order.get("tradingsymbol"),
+                            "exchange": order.get("exchange"), "total": required})
+        summary = {"total": total, "span": 0.0, "exposure": 0.0, "option_premium": total}
+        return {"initial": summary, "final": summary, "orders": details}
+
+    # ---------------------------------------------
+    def tick_packet(self, token, mode):
+        """Encode one instrument in the KiteTicker binary format."""
+        segment = token & 0xff
+        price = int(round(self.prices[token] * 100))
+        if mode == "ltp":
+            return struct.pack(">II", token, price)
+        o, h, l, c = [int(round(x * 100)) for x in self.day_ohlc[token]]
+        if segment == SEGMENTS["INDICES"]:
+            packet = struct.pack(">IIIIIII", token, price, h, l, o, c, 0)
+            if mode == "full":
+                packet += struct.pack(">I", int(time.time()))
+            return packet
+        volume = self.volume[token]
+        packet = struct.pack(">IIIIIIIIIII", token, price, 10, price, volume, volume // 2,
+                             volume // 2, o, h, l, c)
+        if mode == "full":
+            now = int(time.time())
+            packet += struct.pack(">IIIII", now, 0, 0, 0, now)
+            for side in (-1, 1):
+                for level in range(5):
+                    level_price = max(0, price + side * (level + 1) * 5)
+                    packet += struct.pack(">IIHH", 100 * (level + 1), level_price, level + 1, 0)
+        return packet
+
+
+class MockAPIHandler(BaseHTTPRequestHandler):
+    """Routes Kite Connect REST calls onto the shared MockExchange."""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "MockKite/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # ---------------------------------------------
+    def _send(self, status, payload, content_type="application/json"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, error_type, message):
+        self._send(status, {"status": "error", "error_type": error_type, "message": message, "data": None})
+
+    def _params(self):
+        url = urlparse(self.path)
+        params = {k: v if len(v) > 1 else v[0] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            raw = self.rfile.read(length)
+            if "json" in (self.headers.get("Content-Type") or ""):
+                params["__json__"] = json.loads(raw.decode() or "null")
+            else:
+                params.update({k: v[0] for k, v in parse_qs(raw.decode()).items()})
+        return url.path.rstrip("/"), params
+
+    @staticmethod
+    def _group(method, parts):
+        if parts[:1] == ["orders"] and method != "GET":
+            return "order"
+        if parts[:1] == ["quote"]:
+            return "quote"
+        if parts[:2] == ["instruments", "historical"]:
+            return "historical"
+        return "default"
+
+    def _handle(self, method):
+        start = time.time()
+        path, params = self._params()
+        parts = [p for p in path.split("/") if p]
+        exchange = self.server.exchange
+        endpoint = "{} /{}".format(method, "/".join(parts[:2]))
+        exchange.stats.count(endpoint)
+
+        if parts[:1] == ["_mock"]:
+            return self._send(200, exchange.stats.snapshot())
+
+        group = self._group(method, parts)
+        if not self.server.limiters[group].try_acquire():
+            exchange.stats.count("rate_limited:" + group)
+            return self._error(429, "NetworkException", "Too many requests")
+
+        delay = self.server.latency + random.uniform(0, self.server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if random.random() < self.server.error_rate:
+            exchange.stats.count("injected_error:" + group)
+            return self._error(503, "NetworkException", "Injected failure")
+
+        try:
+            self._route(method, parts, params)
+        except KeyError as e:
+            self._error(400, "InputException", "Invalid input: {}".format(e))
+        except ValueError as e:
+            self._error(400, "InputException", str(e))
+        exchange.stats.add(endpoint, time.time() - start)
+
+    def _route(self, method, parts, params):
+        exchange = self.server.exchange
+        ok = lambda data: self._send(200, {"status": "success", "data": data})
+
+        if parts == ["session", "token"] and method == "POST":
+            return ok({"user_id": "MOCK01", "user_name": "Mock User", "access_token": "mock_access_token",
+                       "public_token": "mock_public_token", "refresh_token": "",
+                       "login_time": dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+        if parts == ["user", "profile"]:
+            return ok({"user_id": "MOCK01", "user_name": "Mock User", "email": "mock@example.com",
+                       "exchanges": ["NSE", "NFO"], "products": ["MIS", "NRML", "CNC"]})
+        if parts[:2] == ["user", "margins"]:
+            margins = exchange.margins()
+            return ok(margins[parts[2]] if len(parts) > 2 else margins)
+        if parts == ["margins", "basket"]:
+            return ok(exchange.basket_margins(params.get("__json__") or []))
+        if parts[:1] == ["instruments"] and len(parts) <= 2:
+            return self._send(200, exchange.instruments_csv(parts[1] if len(parts) == 2 else None),
+                              content_type="text/csv")
+        if parts[:2] == ["instruments", "historical"]:
+            parse = lambda s: dt.datetime.fromisoformat(s) if len(s) > 10 else dt.datetime.fromisoformat(s + " 00:00:00")
+            to_date = parse(params["to"])
+            if len(params["to"]) <= 10:
+                to_date = to_date.replace(hour=23, minute=59)
+            return ok(exchange.historical(int(parts[2]), parts[3], parse(params["from"]), to_date))
+        if parts[:1] == ["quote"]:
+            keys = params.get("i", [])
+            keys = [keys] if isinstance(keys, str) else keys
+            data = {}
+            for key in keys:
+                row = exchange.by_key.get(key)
+                if row is not None:
+                    data[key] = {"instrument_token": row["instrument_token"],
+                                 "last_price": exchange.prices[row["instrument_token"]]}
+            return ok(data)
+        if parts == ["portfolio", "positions"]:
+            return ok(exchange.positions_view())
+        if parts == ["orders"] and method == "GET":
+            with exchange.lock:
+                return ok([dict(o) for o in exchange.orders.values()])
+        if parts[:1] == ["orders"] and method == "GET" and len(parts) == 2:
+            order = exchange.orders.get(parts[1])
+            if order is None:
+                raise ValueError("Order not found.")
+            return ok([dict(order)])
+        if parts[:1] == ["orders"] and method == "POST" and len(parts) == 2:
+            return ok({"order_id": exchange.place_order(parts[1], params)})
+        if parts[:1] == ["orders"] and method == "PUT" and len(parts) == 3:
+            return ok({"order_id": exchange.modify_order(parts[2], params)})
+        if parts[:1] == ["orders"] and method == "DELETE" and len(parts) == 3:
+            return ok({"order_id": exchange.cancel_order(parts[2])})
+        if parts == ["trades"]:
+            return ok([])
+        self._error(404, "GeneralException", "Route not found")
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+class MockTickerHandler(socketserver.BaseRequestHandler):
+    """Minimal RFC 6455 server speaking the KiteTicker subscribe/mode protocol."""
+
+    def setup(self):
+        self.send_lock = threading.Lock()
+        self.modes = {}
+        self.alive = True
+
+    def _handshake(self):
+        data = b""
+        while b"\r\n\r\n" not in data:
+            chunk = self.request.recv(4096)
+            if not chunk:
+                return False
+            data += chunk
+        headers = {}
+        for line in data.decode("latin-1").split("\r\n")[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        key = headers.get("sec-websocket-key")
+        if not key:
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        self.request.sendall(("HTTP/1.1 101 Switching Protocols\r\n"
+                              "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                              "Sec-WebSocket-Accept: {}\r\n\r\n".format(accept)).encode())
+        return True
+
+    def send_frame(self, payload, opcode=0x2):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        n = len(payload)
+        if n < 126:
+            header = struct.pack(">BB", 0x80 | opcode, n)
+        elif n < 65536:
+            header = struct.pack(">BBH", 0x80 | opcode, 126, n)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 127, n)
+        with self.send_lock:
+            try:
+                self.request.sendall(header + payload)
+            except OSError:
+                self.alive = False
+
+    def _recv_exact(self, n):
+        buf = b""
+        while len(buf) < n:
+            chunk = self.request.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("closed")
+            buf += chunk
+        return buf
+
+    def _recv_frame(self):
+        b1, b2 = self._recv_exact(2)
+        opcode = b1 & 0x0f
+        length = b2 & 0x7f
+        if length == 126:
+            length = struct.unpack(">H", self._recv_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", self._recv_exact(8))[0]
+        mask = self._recv_exact(4) if b2 & 0x80 else None
+        payload = bytearray(self._recv_exact(length))
+        if mask:
+            for i in range(length):
+                payload[i] ^= mask[i % 4]
+        return opcode, bytes(payload)
+
+    def _on_text(self, payload):
+        try:
+            msg = json.loads(payload.decode())
+        except ValueError:
+            return
+        action, value = msg.get("a"), msg.get("v")
+        if action == "subscribe":
+            for token in value:
+                self.modes.setdefault(int(token), "quote")
+        elif action == "unsubscribe":
+            for token in value:
+                self.modes.pop(int(token), None)
+        elif action == "mode":
+            mode, tokens = value
+            for token in tokens:
+                self.modes[int(token)] = mode
+
+    def handle(self):
+        if not self._handshake():
+            return
+        server = self.server
+        with server.clients_lock:
+            server.clients.append(self)
+        server.exchange.order_listeners.append(self._order_update)
+        try:
+            while self.alive:
+                opcode, payload = self._recv_frame()
+                if opcode == 0x8:
+                    self.send_frame(payload[:2], opcode=0x8)
+                    break
+                if opcode == 0x9:
+                    self.send_frame(payload, opcode=0xA)
+                elif opcode == 0x1:
+                    self._on_text(payload)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.alive = False
+            with server.clients_lock:
+                if self in server.clients:
+                    server.clients.remove(self)
+            if self._order_update in server.exchange.order_listeners:
+                server.exchange.order_listeners.remove(self._order_update)
+
+    def _order_update(self, message):
+        self.send_frame(message, opcode=0x1)
+
+    def broadcast_ticks(self, exchange):
+        """Send one binary message with a packet per subscribed instrument."""
+        modes = dict(self.modes)
+        if not modes:
+            self.send_frame(b"\x00")  # heartbeat
+            return
+        packets = []
+        with exchange.lock:
+            for token, mode in modes.items():
+                if token in exchange.prices:
+                    packets.append(exchange.tick_packet(token, mode))
+        body = struct.pack(">H", len(packets))
+        for packet in packets:
+            body += struct.pack(">H", len(packet)) + packet
+        now = time.time()
+        for token in modes:
+            exchange.last_tick_sent[token] = now
+        self.send_frame(body)
+
+
+class MockTickerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, exchange):
+        super().__init__(address, MockTickerHandler)
+        self.exchange = exchange
+        self.clients = []
+        self.clients_lock = threading.Lock()
+
+
+def tick_loop(exchange, ticker_server, interval, stop_event):
+    """Advance prices and stream them to every connected client."""
+    while not stop_event.is_set():
+        start = time.time()
+        exchange.step(interval)
+        with ticker_server.clients_lock:
+            clients = list(ticker_server.clients)
+        for client in clients:
+            client.broadcast_ticks(exchange)
+        stop_event.wait(max(0, interval - (time.time() - start)))
+
+
+def serve(host="127.0.0.1", port=8765, ws_port=8766, latency=0.0, jitter=0.0, error_rate=0.0,
+          rate_limits=None, tick_interval=1.0, symbols=None, seed=42, volatility=0.3, verbose=False):
+    """
+    Start the REST and websocket servers in background threads.
+
+    :Returns:
+        (exchange, stop) : the MockExchange state and a callable that shuts everything down
+    """
+    exchange = MockExchange(symbols=symbols, seed=seed, volatility=volatility)
+    limits = dict(DEFAULT_RATE_LIMITS)
+    limits.update(rate_limits or {})
+
+    api = ThreadingHTTPServer((host, port), MockAPIHandler)
+    api.daemon_threads = True
+    api.exchange = exchange
+    api.latency = latency
+    api.jitter = jitter
+    api.error_rate = error_rate
+    api.verbose = verbose
+    api.limiters = {k: TokenBucket(v) for k, v in limits.items()}
+
+    ticker = MockTickerServer((host, ws_port), exchange)
+    stop_event = threading.Event()
+
+    threads = [threading.Thread(target=api.serve_forever, daemon=True),
+               threading.Thread(target=ticker.serve_forever, daemon=True),
+               threading.Thread(target=tick_loop, args=(exchange, ticker, tick_interval, stop_event), daemon=True)]
+    for t in threads:
+        t.start()
+
+    def stop():
+        stop_event.set()
+        api.shutdown()
+        ticker.shutdown()
+        with ticker.clients_lock:
+            for client in ticker.clients:
+                try:
+                    client.request.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        api.server_close()
+        ticker.server_close()
+
+    return exchange, stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the Kite Connect REST API and ticker.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="REST port. Default is 8765.")
+    parser.add_argument("--ws-port", type=int, default=8766, help="Ticker websocket port. Default is 8766.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fixed REST latency in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra uniform random latency in seconds.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 503 per call.")
+    parser.add_argument("--order-rate", type=float, default=DEFAULT_RATE_LIMITS["order"])
+    parser.add_argument("--quote-rate", type=float, default=DEFAULT_RATE_LIMITS["quote"])
+    parser.add_argument("--historical-rate", type=float, default=DEFAULT_RATE_LIMITS["historical"])
+    parser.add_argument("--default-rate", type=float, default=DEFAULT_RATE_LIMITS["default"])
+    parser.add_argument("--tick-interval", type=float, default=1.0, help="Seconds between ticks. Default is 1.")
+    parser.add_argument("--volatility", type=float, default=0.3, help="Annualised volatility of the price paths.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--symbols", nargs="*", default=None, help="NSE symbols to list.")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    exchange, stop = serve(host=args.host, port=args.port, ws_port=args.ws_port, latency=args.latency,
+                           jitter=args.jitter, error_rate=args.error_rate,
+                           rate_limits={"order": args.order_rate, "quote": args.quote_rate,
+                                        "historical": args.historical_rate, "default": args.default_rate},
+                           tick_interval=args.tick_interval, symbols=args.symbols, seed=args.seed,
+                           volatility=args.volatility, verbose=args.verbose)
+    print(f"Mock Kite REST on http://{args.host}:{args.port}, ticker on ws://{args.host}:{args.ws_port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(json.dumps(exchange.stats.snapshot(), indent=2))
+        stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Central order gateway.
+
+Every place/modify/cancel call from the strategies goes through one
+OrderGateway per process: a token bucket keeps the process under the
+order rate limit, a priority queue serves exits before stop loss work
+before new entries, the kite session's keep-alive HTTP pool is sized for
+the workers plus the process's other callers (which never wait for a
+connection), and retries are idempotent (entries are tagged and looked
+up before being resent). Each request leaves a latency trace.
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+
+import requests
+
+import latency
+from tools import TokenBucket
+
+# priority lanes, lower is served first
+PRIORITY_EXIT = 0
+PRIORITY_SL = 1
+PRIORITY_ENTRY = 2
+LANES = {PRIORITY_EXIT: "exit", PRIORITY_SL: "sl", PRIORITY_ENTRY: "entry"}
+
+# kept-alive connections for the kite session's other users: main loop, square-off, backfill, margins
+POOL_HEADROOM = 8
+
+# kiteconnect exceptions that will not succeed on retry
+NON_RETRYABLE = ("InputException", "TokenException", "PermissionException", "OrderException")
+
+
+class OrderGateway():
+    """
+    Rate limited, prioritised order submission.
+
+    :Parameters:
+        kite : KiteConnect
+            authenticated client; its HTTP session gets a pool of `workers` + POOL_HEADROOM
+        rate : float
+            order API calls per second (Kite allows 10)
+        workers : int
+            threads issuing API calls concurrently
+        max_attempts : int
+            tries per request on retryable errors
+        backoff : float
+            first retry delay in seconds, doubled on every retry
+        bucket : TokenBucket
+            shared limiter, overrides `rate` when given
+    """
+
+    def __init__(self, kite, rate=10, workers=4, max_attempts=3, backoff=0.2,
+                 bucket=None, logger=None, trace_size=10000):
+        self.kite = kite
+        self.bucket = bucket or TokenBucket(rate)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.log = logger or logging.getLogger(__name__)
+        self.traces = deque(maxlen=trace_size)
+
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._running = True
+        self._size_pool(workers)
+        self._workers = [threading.Thread(target=self._work, name=f"order-gateway-{i}", daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def _size_pool(self, workers):
+        session = getattr(self.kite, "reqsession", None)
+        if session is None:
+            return
+        # shared by every thread using kite, so it must not block: connections over the limit are
+        # opened and dropped after use instead of queueing behind the workers
+        current = session.get_adapter("https://")
+        size = max(workers + POOL_HEADROOM, getattr(current, "_pool_maxsize", 0))
+        adapter = requests.adapters.HTTPAdapter(pool_connections=size, pool_maxsize=size,
+                                                max_retries=0, pool_block=False)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    # ---------------------------------------------
+    def submit(self, method, priority=PRIORITY_ENTRY, **params):
+        """Queue kite.`method`(**params); returns a Future with its result."""
+        if method == "place_order" and not params.get("tag"):
+            params["tag"] = "GW" + uuid.uuid4().hex[:10]
+        future = Future()
+        trace = {"method": method, "lane": LANES.get(priority, str(priority)),
+                 "symbol": params.get("tradingsymbol"), "order_id": params.get("order_id"),
+                 "tag": params.get("tag"), "enqueued": time.monotonic(), "attempts": 0}
+        self._queue.put((priority, next(self._seq), method, params, future, trace))
+        return future
+
+    def place_order(self, priority=PRIORITY_ENTRY, **params):
+        return self.submit("place_order", priority, **params)
+
+    def modify_order(self, priority=PRIORITY_SL, **params):
+        return self.submit("modify_order", priority, **params)
+
+    def cancel_order(self, priority=PRIORITY_EXIT, **params):
+        return self.submit("cancel_order", priority, **params)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stop(self, wait=True):
+        """Stop the workers once the queue has drained."""
+        if wait:
+            self._queue.join()
+        self._running = False
+        for _ in self._workers:
+            self._queue.put((float("inf"), next(self._seq), None, None, None, None))
+
+    # ---------------------------------------------
+    def _work(self):
+        while self._running:
+            priority, _, method, params, future, trace = self._queue.get()
+            try:
+                if method is None:
+                    return
+                if future.set_running_or_notify_cancel():
+                    self._execute(method, params, future, trace)
+            finally:
+                self._queue.task_done()
+
+    def _execute(self, method, params, future, trace):
+        trace["started"] = time.monotonic()
+        delay = self.backoff
+        for attempt in range(1, self.max_attempts + 1):
+            self.bucket.acquire()
+            trace["attempts"] = attempt
+            sent = time.monotonic()
+            try:
+                result = getattr(self.kite, method)(**params)
+                trace["rtt"] = time.monotonic() - sent
+                return self._finish(future, trace, result=result)
+            except Exception as e:
+                trace["rtt"] = time.monotonic() - sent
+                if type(e).__name__ in NON_RETRYABLE or attempt == self.max_attempts:
+                    recovered = self._recover(method, params)
+                    if recovered is not None:
+                        return self._finish(future, trace, result=recovered)
+                    return self._finish(future, trace, error=e)
+                self.log.warning(f"[GATEWAY] {method} {params.get('tradingsymbol') or params.get('order_id')} "
+                                 f"failed ({e}), retry {attempt} in {delay:.2f}s")
+                time.sleep(delay)
+                delay *= 2
+                recovered = self._recover(method, params)
+                if recovered is not None:
+                    return self._finish(future, trace, result=recovered)
+
+    def _recover(self, method, params):
+        """After a failure, check whether the request actually went through."""
+        try:
+            if method == "place_order":
+                for order in self.kite.orders():
+                    if order.get("tag") == params["tag"]:
+                        return order["order_id"]
+            elif method == "cancel_order":
+                history = self.kite.order_history(params["order_id"])
+                if history and history[-1]["status"] == "CANCELLED":
+                    return params["order_id"]
+        except Exception:
+            pass
+        return None
+
+    def _finish(self, future, trace, result=None, error=None):
+        trace["finished"] = time.monotonic()
+        trace["queue_wait"] = trace["started"] - trace["enqueued"]
+        trace["total"] = trace["finished"] - trace["enqueued"]
+        trace["status"] = "error" if error is not None else "ok"
+        if trace["method"] == "place_order" and error is None:
+            trace["order_id"] = result
+        self.traces.append(trace)
+        if latency.enabled():
+            latency.record("gateway.queue_wait." + trace["lane"], trace["queue_wait"])
+            latency.record("gateway.total." + trace["method"], trace["total"])
+        self.log.debug(f"[GATEWAY] {trace['method']} {trace['lane']} {trace['symbol'] or trace['order_id']} "
+                       f"{trace['status']} wait {trace['queue_wait'] * 1000:.1f}ms "
+                       f"rtt {trace.get('rtt', 0) * 1000:.1f}ms attempts {trace['attempts']}")
+        if error is not None:
+            self.log.error(f"[GATEWAY] {trace['method']} failed: {error}")
+            future.set_exception(error)
+        else:
+            future.set_result(result)
@@ -0,0 +1,336 @@
+"""
+Streaming mark-to-market P&L and exposure.
+
+Portfolio keeps one row per (strategy, instrument) in flat numpy arrays:
+quantity, average price, realised P&L and the last price it was marked
+at. Order updates (KiteTicker.on_order_update) apply the newly filled
+quantity of each order; ticks re-mark the rows of their instrument and
+move running totals by the change, so the portfolio-wide and per-strategy
+figures are O(1) per tick and queries never touch the REST API:
+
+    pnl()            realised + unrealised, total or for one strategy
+    gross(), net()   exposure at the last marks
+    drawdown()       from the day's P&L peak
+    frame()          per row snapshot for reporting
+
+KillSwitch checks those figures after every tick and fires once (square
+off, stop entries) when a daily loss, drawdown or gross exposure limit
+is breached.
+
+    KITETRADE_MAX_LOSS=5000     daily loss limit renko_atr and the host arm the kill switch with
+                                (buy_options: --max_loss or KITE_MAX_LOSS)
+"""
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_STRATEGY = "default"
+
+
+class Portfolio():
+    """
+    Positions and P&L by strategy and instrument.
+
+    :Parameters:
+        strategy_of : callable
+            order update -> strategy name for attribution; defaults to
+            DEFAULT_STRATEGY for every order
+        capacity : int
+            rows allocated up front, grown by doubling
+    """
+
+    def __init__(self, strategy_of=None, capacity=64, logger=None):
+        self.strategy_of = strategy_of or (lambda order: DEFAULT_STRATEGY)
+        self.log = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._rows = {}        # (strategy, token) -> row
+        self._by_token = {}    # token -> [rows]
+        self._strategies = {}  # name -> index
+        self._filled = {}      # order id -> (filled quantity, average price) applied so far
+        self.symbols = []
+        self.size = 0
+        self.qty = np.zeros(capacity, dtype=np.int64)
+        self.avg = np.zeros(capacity)
+        self.last = np.full(capacity, np.nan)
+        self.booked = np.zeros(capacity)  # realised P&L per row
+        self.multiplier = np.ones(capacity)
+        self.owner = np.zeros(capacity, dtype=np.int32)
+        self.token = np.zeros(capacity, dtype=np.int64)
+        # running totals, kept in step with the rows
+        self._strategy_unrealised = np.zeros(8)
+        self._strategy_realised = np.zeros(8)
+        self._unrealised = 0.0
+        self._realised = 0.0
+        self._gross = 0.0
+        self._net = 0.0
+        self.peak = 0.0
+
+    # ---------------------------------------------
+    def _strategy(self, name):
+        index = self._strategies.get(name)
+        if index is None:
+            index = self._strategies[name] = len(self._strategies)
+            if index >= len(self._strategy_realised):
+                self._strategy_realised = np.resize(self._strategy_realised, 2 * index)
+                self._strategy_unrealised = np.resize(self._strategy_unrealised, 2 * index)
+                self._strategy_realised[index:] = 0
+                self._strategy_unrealised[index:] = 0
+        return index
+
+    def _row(self, strategy, token, symbol):
+        row = self._rows.get((strategy, token))
+        if row is not None:
+            return row
+        row = self.size
+        if row == len(self.qty):
+            for name in ("qty", "avg", "last", "booked", "multiplier", "owner", "token"):
+                old = getattr(self, name)
+                new = np.resize(old, 2 * len(old))
+                new[len(old):] = {"last": np.nan, "multiplier": 1}.get(name, 0)
+                setattr(self, name, new)
+        self.size += 1
+        self.owner[row] = self._strategy(strategy)
+        self.token[row] = token
+        self.symbols.append(symbol)
+        self._rows[(strategy, token)] = row
+        self._by_token.setdefault(token, []).append(row)
+        return row
+
+    def _mark(self, row, price):
+        """Move the row's mark to `price` and the totals with it."""
+        last = self.last[row]
+        q = self.qty[row] * self.multiplier[row]
+        if last == last:  # marked before
+            move = q * (price - last)
+            self._unrealised += move
+            self._strategy_unrealised[self.owner[row]] += move
+            self._net += move
+            self._gross += abs(q) * (price - last)
+        else:
+            self._unrealised += q * (price - self.avg[row])
+            self._strategy_unrealised[self.owner[row]] += q * (price - self.avg[row])
+            self._net += q * price
+            self._gross += abs(q) * price
+        self.last[row] = price
+
+    def _unmark(self, row):
+        """Take the row out of the totals (before its quantity changes)."""
+        last = self.last[row]
+        if last != last:
+            return
+        q = self.qty[row] * self.multiplier[row]
+        self._unrealised -= q * (last - self.avg[row])
+        self._strategy_unrealised[self.owner[row]] -= q * (last - self.avg[row])
+        self._net -= q * last
+        self._gross -= abs(q) * last
+        self.last[row] = np.nan
+
+    def _apply_fill(self, row, quantity, price):
+        """Signed fill into the row: averages when adding, realises when reducing or flipping."""
+        mark = self.last[row] if self.last[row] == self.last[row] else price
+        self._unmark(row)
+        qty, avg, mult = int(self.qty[row]), self.avg[row], self.multiplier[row]
+        if qty == 0 or (qty > 0) == (quantity > 0):
+            self.avg[row] = (qty * avg + quantity * price) / (qty + quantity)
+            self.qty[row] = qty + quantity
+        else:
+            closed = min(abs(qty), abs(quantity)) * (1 if qty > 0 else -1)
+            realised = closed * (price - avg) * mult
+            self.booked[row] += realised
+            self._realised += realised
+            self._strategy_realised[self.owner[row]] += realised
+            self.qty[row] = qty + quantity
+            if self.qty[row] != 0 and (self.qty[row] > 0) != (qty > 0):
+                self.avg[row] = price  # flipped: the remainder opened at this fill
+            elif self.qty[row] == 0:
+                self.avg[row] = 0.0
+        self._mark(row, mark)
+
+    # ---------------------------------------------
+    def load_positions(self, positions, strategy=DEFAULT_STRATEGY):
+        """Seed from kite.positions()["day"], attributing every row to `strategy`."""
+        with self._lock:
+            for p in positions:
+                if not p.get("quantity") and not (p.get("buy_quantity") or p.get("sell_quantity")):
+                    continue
+                row = self._row(strategy, int(p["instrument_token"]), p["tradingsymbol"])
+                self._unmark(row)
+                mult = float(p.get("multiplier") or 1)
+                self.multiplier[row] = mult
+                self.qty[row] = int(p["quantity"])
+                self.avg[row] = float(p.get("average_price") or 0)
+                realised = (float(p.get("sell_value") or 0) - float(p.get("buy_value") or 0)
+                            + self.qty[row] * self.avg[row] * mult)
+                self.booked[row] += realised
+                self._realised += realised
+                self._strategy_realised[self.owner[row]] += realised
+                if p.get("last_price"):
+                    self._mark(row, float(p["last_price"]))
+            self.peak = max(self.peak, self._realised + self._unrealised)
+
+    def on_order_update(self, ws, order):
+        """KiteTicker.on_order_update callback: books whatever was filled since the last update of the order."""
+        self.apply_order(order)
+
+    def _new_fill(self, order):
+        """Called with the lock held: (signed quantity, price) filled since the order's last update, or None."""
+        filled = int(order.get("filled_quantity") or 0)
+        done, done_avg = self._filled.get(order["order_id"], (0, 0.0))
+        if filled <= done:
+            return None
+        average = float(order.get("average_price") or 0)
+        # price of the new part, from the change in the order's average fill price
+        price = (average * filled - done_avg * done) / (filled - done)
+        self._filled[order["order_id"]] = (filled, average)
+        quantity = filled - done
+        if order.get("transaction_type") == "SELL":
+            quantity = -quantity
+        return quantity, price
+
+    def apply_order(self, order, strategy=None):
+        if not order.get("filled_quantity"):
+            return
+        with self._lock:
+            fill = self._new_fill(order)
+            if fill is None:
+                return
+            row = self._row(strategy or self.strategy_of(order), int(order["instrument_token"]), order["tradingsymbol"])
+            self._apply_fill(row, *fill)
+            self.peak = max(self.peak, self._realised + self._unrealised)
+
+    def apply_exit(self, order, fallback=DEFAULT_STRATEGY):
+        """
+        Book the fills of an order no strategy placed (a square-off, broker
+        or manual exit): they close the instrument's open rows on the other
+        side, in row order, and whatever is left over goes to `fallback`.
+        """
+        if not order.get("filled_quantity"):
+            return
+        with self._lock:
+            fill = self._new_fill(order)
+            if fill is None:
+                return
+            quantity, price = fill
+            for row in self._by_token.get(int(order["instrument_token"]), ()):
+                held = int(self.qty[row])
+                if quantity == 0:
+                    break
+                if held == 0 or (held > 0) == (quantity > 0):
+                    continue
+                part = max(-abs(held), min(abs(held), quantity))
+                self._apply_fill(row, part, price)
+                quantity -= part
+            if quantity:
+                row = self._row(fallback, int(order["instrument_token"]), order["tradingsymbol"])
+                self._apply_fill(row, quantity, price)
+            self.peak = max(self.peak, self._realised + self._unrealised)
+
+    def on_ticks(self, ticks):
+        """Re-mark every row of the ticked instruments."""
+        with self._lock:
+            for tick in ticks:
+                rows = self._by_token.get(tick["instrument_token"])
+                if rows:
+                    for row in rows:
+                        self._mark(row, tick["last_price"])
+            total = self._realised + self._unrealised
+            if total > self.peak:
+                self.peak = total
+
+    # ---------------------------------------------
+    def pnl(self, strategy=None):
+        if strategy is None:
+            return self._realised + self._unrealised
+        index = self._strategies.get(strategy)
+        if index is None:
+            return 0.0
+        return self._strategy_realised[index] + self._strategy_unrealised[index]
+
+    def unrealised(self):
+        return self._unrealised
+
+    def realised(self):
+        return self._realised
+
+    def gross(self):
+        return self._gross
+
+    def net(self):
+        return self._net
+
+    def drawdown(self):
+        return self.peak - self.pnl()
+
+    def exposure(self):
+        """Net exposure per symbol across strategies, at the last marks."""
+        with self._lock:
+            n = self.size
+            value = self.qty[:n] * self.multiplier[:n] * np.nan_to_num(self.last[:n])
+            return pd.Series(value, index=self.symbols[:n]).groupby(level=0).sum()
+
+    def frame(self):
+        """One row per (strategy, instrument): quantity, average, last, realised, unrealised, exposure."""
+        with self._lock:
+            n = self.size
+            names = {index: name for name, index in self._strategies.items()}
+            q = self.qty[:n] * self.multiplier[:n]
+            return pd.DataFrame({"strategy": [names[i] for i in self.owner[:n]], "symbol": self.symbols[:n],
+                                 "quantity": self.qty[:n], "average": self.avg[:n], "last": self.last[:n],
+                                 "realised": self.booked[:n],
+                                 "unrealised": np.nan_to_num(q * (self.last[:n] - self.avg[:n])),
+                                 "exposure": np.nan_to_num(q * self.last[:n])})
+
+
+class KillSwitch():
+    """
+    Fires `on_trip(reason)` once when a portfolio limit is breached.
+
+    :Parameters:
+        portfolio : Portfolio
+            checked after every tick batch
+        max_loss : float
+            day P&L below -max_loss trips
+        max_drawdown : float
+            fall from the day's P&L peak that trips
+        max_gross : float
+            gross exposure that trips
+        on_trip : callable
+            run on a separate thread so the tick thread is not held up
+    """
+
+    def __init__(self, portfolio, on_trip, max_loss=None, max_drawdown=None, max_gross=None, logger=None):
+        self.portfolio = portfolio
+        self.on_trip = on_trip
+        self.max_loss = max_loss
+        self.max_drawdown = max_drawdown
+        self.max_gross = max_gross
+        self.log = logger or logging.getLogger(__name__)
+        self.tripped = None
+        self._lock = threading.Lock()
+
+    def breach(self):
+        """Reason the limits are breached, or None."""
+        p = self.portfolio
+        if self.max_loss is not None and p.pnl() < -self.max_loss:
+            return f"day loss {p.pnl():.2f} beyond {self.max_loss}"
+        if self.max_drawdown is not None and p.drawdown() > self.max_drawdown:
+            return f"drawdown {p.drawdown():.2f} beyond {self.max_drawdown}"
+        if self.max_gross is not None and p.gross() > self.max_gross:
+            return f"gross exposure {p.gross():.2f} beyond {self.max_gross}"
+        return None
+
+    def check(self):
+        if self.tripped:
+            return True
+        reason = self.breach()
+        if reason is None:
+            return False
+        with self._lock:
+            if self.tripped:
+                return True
+            self.tripped = reason
+        self.log.error(f"kill switch: {reason}")
+        threading.Thread(target=self.on_trip, args=(reason,), name="kill-switch", daemon=True).start()
+        return True
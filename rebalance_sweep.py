@@ -0,0 +1,238 @@
+"""
+Parameter grid and walk-forward optimizer for the weekly rebalance strategy.
+
+Evaluates weekly_rebalance.pflio over a grid of (m, x, rebalance frequency)
+on a process pool. The return matrix is placed in shared memory once and
+every worker maps it instead of receiving a pickled copy per task.
+
+With --train/--test the sample is split into rolling walk-forward windows:
+the grid is evaluated in-sample, the best configuration by --metric is
+re-run on the following out-of-sample window.
+
+    python rebalance_sweep.py                                  # 10y NIFTY 50, full-sample grid
+    python rebalance_sweep.py --m 5 10 15 20 --x 1 2 3 4 --freq 1 2 4
+    python rebalance_sweep.py --train 156 --test 52            # 3y in-sample, 1y out-of-sample
+    python rebalance_sweep.py --returns returns.csv            # any saved return matrix
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import kpi
+import weekly_rebalance
+
+# =============================================
+# check min, python version
+if sys.version_info < (3, 8):
+    raise SystemError("Python version >= 3.8")
+
+# =============================================
+
+RESULTS_FILE = "sweep_results.csv"
+HEATMAP_FILE = "sweep_heatmap.png"
+KPI_COLUMNS = kpi.METRICS
+
+# worker state, set by _attach()
+_shm = None
+_returns = None
+_blocks = {}
+
+
+# =============================================
+
+def compound(ret, freq):
+    """Compound a (periods, stocks) return array into non-overlapping blocks of `freq` periods."""
+    if freq == 1:
+        return ret
+    periods = (len(ret) // freq) * freq
+    growth = np.nanprod((1 + ret[:periods]).reshape(-1, freq, ret.shape[1]), axis=1)
+    missing = np.isnan(ret[:periods]).reshape(-1, freq, ret.shape[1]).all(axis=1)
+    return np.where(missing, np.nan, growth - 1)
+
+
+def _attach(name, shape, dtype):
+    """Pool initializer: map the shared return matrix."""
+    global _shm, _returns
+    _shm = shared_memory.SharedMemory(name=name)
+    _returns = np.ndarray(shape, dtype=dtype, buffer=_shm.buf)
+
+
+def _evaluate(task):
+    """Run one (m, x, freq) configuration on rows [start, stop) of the shared matrix."""
+    m, x, freq, start, stop, periods_per_year, rf = task
+    key = (freq, start, stop)
+    ret = _blocks.get(key)
+    if ret is None:
+        ret = _blocks[key] = compound(_returns[start:stop], freq)
+    series = weekly_rebalance.pflio_array(ret, m, x)
+    row = {"m": m, "x": x, "freq": freq, "start": start, "stop": stop}
+    row.update(kpi.summary(series, periods_per_year / freq, rf))
+    return row
+
+
+# =============================================
+
+def walk_forward_splits(periods, train, test):
+    """Rolling (train_start, train_stop, test_stop) windows stepping by `test`."""
+    splits = []
+    start = 0
+    while start + train + test <= periods:
+        splits.append((start, start + train, start + train + test))
+        start += test
+    return splits
+
+
+class Sweep():
+    """
+    Evaluates rebalance configurations on a process pool over a shared return matrix.
+
+    :Parameters:
+        return_df : DataFrame
+            (periods, stocks) returns, e.g. weekly_rebalance.weekly_returns()
+        workers : int
+            processes, defaults to the CPU count
+        periods_per_year : float
+            periodicity of return_df (52 for weekly data)
+        rf : float
+            risk free rate for the Sharpe ratio
+    """
+
+    def __init__(self, return_df, workers=None, periods_per_year=52, rf=0.07):
+        self.return_df = return_df
+        self.workers = workers or os.cpu_count()
+        self.periods_per_year = periods_per_year
+        self.rf = rf
+
+    def __enter__(self):
+        data = np.ascontiguousarray(self.return_df.to_numpy(dtype=float))
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, data.nbytes))
+        np.ndarray(data.shape, dtype=data.dtype, buffer=self._shm.buf)[:] = data
+        self._pool = ProcessPoolExecutor(self.workers, initializer=_attach,
+                                         initargs=(self._shm.name, data.shape, data.dtype))
+        return self
+
+    def __exit__(self, *exc):
+        self._pool.shutdown()
+        self._shm.close()
+        self._shm.unlink()
+        return False
+
+    def run(self, grid, start=0, stop=None):
+        """Evaluate every (m, x, freq) in `grid` on rows [start, stop); returns a DataFrame."""
+        stop = len(self.return_df) if stop is None else stop
+        tasks = [(m, x, freq, start, stop, self.periods_per_year, self.rf) for m, x, freq in grid]
+        chunksize = max(1, len(tasks) // (self.workers * 4))
+        return pd.DataFrame(list(self._pool.map(_evaluate, tasks, chunksize=chunksize)))
+
+    def walk_forward(self, grid, train, test, metric="sharpe"):
+        """
+        Pick the best configuration by `metric` on each training window and
+        evaluate it on the test window that follows.
+        """
+        rows = []
+        minimize = metric in ("max_dd", "volatility")
+        for split, (start, mid, stop) in enumerate(walk_forward_splits(len(self.return_df), train, test)):
+            insample = self.run(grid, start, mid).dropna(subset=[metric])
+            if insample.empty:
+                continue
+            best = insample.loc[insample[metric].idxmin() if minimize else insample[metric].idxmax()]
+            oos = self.run([(int(best["m"]), int(best["x"]), int(best["freq"]))], mid, stop).iloc[0]
+            row = {"split": split, "train_start": self.return_df.index[start],
+                   "test_start": self.return_df.index[mid], "test_end": self.return_df.index[stop - 1],
+                   "m": int(best["m"]), "x": int(best["x"]), "freq": int(best["freq"])}
+            row.update({"is_" + k: best[k] for k in KPI_COLUMNS})
+            row.update({"oos_" + k: oos[k] for k in KPI_COLUMNS})
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+def make_grid(ms, xs, freqs):
+    """All (m, x, freq) with x < m."""
+    return [(m, x, f) for m, x, f in itertools.product(ms, xs, freqs) if x < m]
+
+
+def plot_heatmap(results, metric, path):
+    """One m x x heatmap of `metric` per rebalance frequency."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    freqs = sorted(results["freq"].unique())
+    fig, axes = plt.subplots(1, len(freqs), figsize=(5 * len(freqs), 4), squeeze=False)
+    for ax, freq in zip(axes[0], freqs):
+        table = results[results["freq"] == freq].pivot(index="m", columns="x", values=metric)
+        image = ax.imshow(table.values, origin="lower", aspect="auto", cmap="viridis")
+        ax.set_xticks(range(len(table.columns)), table.columns)
+        ax.set_yticks(range(len(table.index)), table.index)
+        ax.set_xlabel("x (stocks replaced)")
+        ax.set_ylabel("m (stocks held)")
+        ax.set_title(f"{metric}, rebalance every {freq} period(s)")
+        fig.colorbar(image, ax=ax)
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def load_returns(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, index_col=0, parse_dates=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Grid search and walk-forward for the weekly rebalance strategy.')
+    parser.add_argument('--m', nargs='*', type=int, default=list(range(4, 25, 2)), help='Portfolio sizes.')
+    parser.add_argument('--x', nargs='*', type=int, default=list(range(1, 9)), help='Stocks replaced per rebalance.')
+    parser.add_argument('--freq', nargs='*', type=int, default=[1, 2, 4], help='Rebalance every n periods.')
+    parser.add_argument('--returns', default=None, help='CSV/parquet return matrix instead of downloading NIFTY 50.')
+    parser.add_argument('--offline', action='store_true', help='Use cached market data only.')
+    parser.add_argument('--years', type=float, default=10, help='Years of weekly data to download. Default is 10.')
+    parser.add_argument('--periods-per-year', type=float, default=52, help='Periodicity of the returns. Default is 52.')
+    parser.add_argument('--rf', type=float, default=0.07, help='Risk free rate. Default is 0.07.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes. Default is the CPU count.')
+    parser.add_argument('--metric', default="sharpe", choices=KPI_COLUMNS, help='Selection metric. Default is sharpe.')
+    parser.add_argument('--train', type=int, default=None, help='Walk-forward in-sample periods. The table goes next to --output, suffixed _walk_forward.')
+    parser.add_argument('--test', type=int, default=None, help='Walk-forward out-of-sample periods.')
+    parser.add_argument('--output', default=RESULTS_FILE, help=f'Results table. Default is {RESULTS_FILE}.')
+    parser.add_argument('--heatmap', default=HEATMAP_FILE, help=f'Heatmap image. Default is {HEATMAP_FILE}.')
+    args = parser.parse_args()
+
+    if args.returns:
+        return_df = load_returns(args.returns)
+    else:
+        end = dt.datetime.today()
+        return_df = weekly_rebalance.weekly_returns(weekly_rebalance.tickers, end - dt.timedelta(365 * args.years), end,
+                                                    offline=args.offline or None)
+
+    grid = make_grid(args.m, args.x, args.freq)
+    print(f"{len(grid)} configurations on {return_df.shape[0]} periods x {return_df.shape[1]} stocks")
+    started = time.perf_counter()
+    with Sweep(return_df, args.workers, args.periods_per_year, args.rf) as sweep:
+        results = sweep.run(grid)
+        results = results.sort_values(args.metric, ascending=args.metric in ("max_dd", "volatility"))
+        results.to_csv(args.output, index=False)
+        print(f"results written to {args.output}")
+        print(results.head(10).to_string(index=False))
+        plot_heatmap(results, args.metric, args.heatmap)
+        print(f"heatmap written to {args.heatmap}")
+
+        if args.train and args.test:
+            wf = sweep.walk_forward(grid, args.train, args.test, args.metric)
+            root, ext = os.path.splitext(args.output)
+            wf_file = f"{root}_walk_forward{ext or '.csv'}"
+            wf.to_csv(wf_file, index=False)
+            print(wf.to_string(index=False))
+            print(f"walk-forward written to {wf_file}")
+    print(f"done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
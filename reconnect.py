@@ -0,0 +1,203 @@
+"""
+Websocket reconnect handling with backfill of the missed minutes.
+
+KiteTicker reconnects by itself with exponential backoff (2s doubling up to
+`reconnect_max_delay`) unless on_close stops the reactor. ReconnectManager
+takes over the ticker callbacks, leaves that loop running and, when the
+connection comes back, works out per instrument which whole minutes were
+missed: from the minute after its last delivered tick up to the minute of
+the reconnect. Those 1-minute bars are fetched through the historical API
+(rate limited, only for the instruments that have a gap) and replayed into
+the strategy's tick handler as synthetic ticks (open, low/high, close of
+each bar, in time order) before the live ticks that arrived meanwhile,
+which are held back until the backfill is done.
+
+The same backfill runs on the first connect when the manager is given the
+last tick times of a previous run (e.g. Checkpoint.last_tick).
+"""
+import datetime as dt
+import logging
+import threading
+
+import pandas as pd
+
+import clock
+import tools
+
+HISTORICAL_RATE = 3  # historical API requests per second
+
+
+def minute_floor(ts):
+    return ts.replace(second=0, microsecond=0)
+
+
+def bar_ticks(token, bars):
+    """1-minute bars -> synthetic kite ticks: open, the nearer extreme, the other extreme, close."""
+    ticks = []
+    for stamp, o, h, l, c in zip(bars.index, bars["open"], bars["high"], bars["low"], bars["close"]):
+        path = (o, l, h, c) if c >= o else (o, h, l, c)
+        for price in path:
+            ticks.append({"instrument_token": token, "last_price": float(price),
+                          "exchange_timestamp": stamp, "backfill": True})
+    return ticks
+
+
+class ReconnectManager():
+    """
+    Owns the KiteTicker callbacks and fills websocket gaps from the historical API.
+
+    :Parameters:
+        kws : KiteTicker
+            ticker created with reconnect enabled
+        kite : KiteConnect
+            for historical_data
+        on_ticks : callable
+            the strategy's on_ticks(ws, ticks)
+        on_connect : callable
+            the strategy's on_connect(ws, response), subscribes the tokens
+        tokens : list
+            instrument tokens to backfill
+        since : dict
+            {token: epoch seconds} of the last tick processed before this run
+        backfill : bool
+            fetch and replay missed bars on reconnect; off for strategies that
+            only use the latest quote
+        bucket : tools.TokenBucket
+            historical API rate limit, shared with other historical callers
+    """
+
+    def __init__(self, kws, kite, on_ticks, on_connect, tokens, since=None, backfill=True,
+                 bucket=None, attempts=3, logger=None):
+        self.kws = kws
+        self.kite = kite
+        self.handler = on_ticks
+        self.connect_handler = on_connect
+        self.tokens = list(tokens)
+        self.backfill = backfill
+        self.bucket = bucket or tools.TokenBucket(HISTORICAL_RATE)
+        self.attempts = attempts
+        self.log = logger or logging.getLogger(__name__)
+        self.last_tick = {int(t): ts for t, ts in (since or {}).items()}
+        self.disconnected_at = None
+        self.gaps = []  # (reconnected_at, tokens filled, bars replayed)
+        self._lock = threading.Lock()
+        self._filling = False
+        self._held = []
+
+        kws.on_ticks = self._on_ticks
+        kws.on_connect = self._on_connect
+        kws.on_close = self._on_close
+        kws.on_error = self._on_error
+        kws.on_reconnect = self._on_reconnect
+        kws.on_noreconnect = self._on_noreconnect
+
+    # ---------------------------------------------
+    def _deliver(self, ws, ticks):
+        now = clock.time()
+        for tick in ticks:
+            if not tick.get("backfill"):
+                self.last_tick[tick["instrument_token"]] = now
+        self.handler(ws, ticks)
+
+    def _on_ticks(self, ws, ticks):
+        with self._lock:
+            if self._filling:
+                self._held.extend(ticks)
+                return
+        self._deliver(ws, ticks)
+
+    def _on_connect(self, ws, response):
+        self.connect_handler(ws, response)
+        disconnected_at, self.disconnected_at = self.disconnected_at, None
+        if not self.backfill or not (disconnected_at or self.last_tick):
+            return
+        with self._lock:
+            if self._filling:
+                return
+            self._filling = True
+        threading.Thread(target=self._fill, args=(ws, clock.now(), disconnected_at), name="gap-backfill", daemon=True).start()
+
+    def _on_close(self, ws, code, reason):
+        if self.disconnected_at is None:
+            self.disconnected_at = clock.time()
+        self.log.warning(f"websocket closed ({code} {reason}), reconnecting")
+
+    def _on_error(self, ws, code, reason):
+        self.log.error(f"websocket error {code} {reason}")
+
+    def _on_reconnect(self, ws, attempts):
+        self.log.warning(f"websocket reconnect attempt {attempts}")
+
+    def _on_noreconnect(self, ws):
+        self.log.error("websocket reconnect attempts exhausted, giving up")
+
+    # ---------------------------------------------
+    def missing_windows(self, reconnected_at, disconnected_at=None):
+        """
+        {token: (first missed minute, last missed minute)} for tokens with whole minutes missing;
+        tokens that never ticked count from `disconnected_at`.
+        """
+        end = minute_floor(reconnected_at) - dt.timedelta(minutes=1)
+        windows = {}
+        for token in self.tokens:
+            last = self.last_tick.get(token, disconnected_at)
+            if last is None:
+                continue
+            start = minute_floor(dt.datetime.fromtimestamp(last)) + dt.timedelta(minutes=1)
+            if start <= end:
+                windows[token] = (start, end)
+        return windows
+
+    def _fetch(self, token, start, end):
+        for attempt in range(1, self.attempts + 1):
+            self.bucket.acquire()
+            try:
+                bars = pd.DataFrame(self.kite.historical_data(token, start, end + dt.timedelta(seconds=59), "minute"))
+                if bars.empty:
+                    return bars
+                bars = bars.set_index("date")
+                bars.index = pd.DatetimeIndex(bars.index).tz_localize(None)
+                return bars[(bars.index >= start) & (bars.index <= end)]
+            except Exception as e:
+                self.log.warning(f"backfill {token} {start:%H:%M}-{end:%H:%M} attempt {attempt} failed: {e}")
+                clock.sleep(attempt)
+        return None
+
+    def _fill(self, ws, reconnected_at, disconnected_at):
+        ticks, filled = [], 0
+        try:
+            for token, (start, end) in self.missing_windows(reconnected_at, disconnected_at).items():
+                bars = self._fetch(token, start, end)
+                if bars is not None and len(bars):
+                    ticks.extend(bar_ticks(token, bars))
+                    filled += 1
+                if bars is not None:
+                    # the window is covered now, a later gap starts after it
+                    covered = (end + dt.timedelta(seconds=59)).timestamp()
+                    self.last_tick[token] = max(covered, self.last_tick.get(token, covered))
+            ticks.sort(key=lambda t: t["exchange_timestamp"])
+        finally:
+            # the handler runs outside the lock so live ticks are only held, not blocked, meanwhile;
+            # whatever arrived during a delivery goes next, until nothing is held
+            released, batch = 0, ticks
+            try:
+                while True:
+                    if batch:
+                        self._deliver(ws, batch)
+                    with self._lock:
+                        batch, self._held = self._held, []
+                        if not batch:
+                            self._filling = False
+                            break
+                    released += len(batch)
+            finally:
+                with self._lock:
+                    if self._filling:  # the handler raised: back to live delivery, the held ticks are lost
+                        self._held, self._filling = [], False
+        self.gaps.append((reconnected_at, filled, len(ticks) // 4))
+        self.log.info(f"backfilled {len(ticks) // 4} missed bars for {filled} instruments, "
+                      f"then {released} held live ticks")
+
+    # ---------------------------------------------
+    def connect(self, threaded=False):
+        self.kws.connect(threaded=threaded)
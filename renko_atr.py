@@ -6,41 +6,44 @@ import numpy as np
 import time
 import logging
 from kiteconnect import KiteConnect, KiteTicker
+import indicators
+from bars import BarStore
+from indicators import MACD, renkoUpdate
+import clock
+from checkpoint import Checkpoint
+from reconnect import ReconnectManager
+from scheduler import SessionScheduler
+from squareoff import SquareOff
+from portfolio import Portfolio, KillSwitch
+from sharding import ShardedUniverse, RenkoMacdShard
+import auth
+import latency
+import signals
+import tools
+import watchlists
+from order_gateway import OrderGateway, PRIORITY_SL
+from trailing import TrailingStopManager
 from dotenv import load_dotenv
 
 load_dotenv()
 
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-
-formatter = logging.Formatter("%(asctime)s %(levelname)s :: %(message)s")
-
-stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(formatter)
-stream_handler.setLevel(logging.INFO)
-
-file_handler = logging.FileHandler("three_sup_trend.log")
-file_handler.setFormatter(formatter)
-file_handler.setLevel(logging.DEBUG)
-
-logger.addHandler(stream_handler)
-logger.addHandler(file_handler)
+logger = tools.createLogger(logfile="renko_atr.log", json_lines=bool(os.getenv('KITETRADE_LOG_JSON')))
+tick_logger = tools.createTickLogger("renko_atr.ticks", sample_every=10, max_per_sec=100)
 
 api_key = os.getenv('KITETRADE_API_KEY')
 api_secret = os.getenv('KITETRADE_API_SECRET')
 access_token = os.getenv('KITETRADE_ACCESS_TOKEN')
+kite_root = os.getenv('KITETRADE_ROOT') # set to point at a mock/proxy server
+kite_ws_root = os.getenv('KITETRADE_WS_ROOT')
 logger.info(f"API KEY: {api_key}")
-kite = KiteConnect(api_key=api_key)
-session = None
-
-if not access_token:
-    print(kite.login_url())
-    request_token = input("Enter request token: ")
-    session = kite.generate_session(request_token, api_secret)
-    access_token = session["access_token"]
-    
-kite.set_access_token(access_token)
+kite = KiteConnect(api_key=api_key, root=kite_root)
+# the day's token is cached on disk, the request token prompt only comes up once a day
+access_token = auth.authenticate(kite, auth.prompt_login(api_secret), access_token, logger=logger)
+latency.instrument(kite)
+gateway = OrderGateway(kite, logger=logger)
+trailing = TrailingStopManager(gateway, logger=logger)
 logger.info(f"Authentication complete! {access_token}")
+bar_store = BarStore(kite, logger=logger)
 
 #get dump of all NSE instruments
 logger.info("Getting instruments dump")
@@ -54,9 +57,13 @@ def tokenLookup(instrument_df,symbol_list):
         token_list.append(int(instrument_df[instrument_df.tradingsymbol==symbol].instrument_token.values[0]))
     return token_list
 
+ticker_by_token = {}
 def tickerLookup(token):
     global instrument_df
-    return instrument_df[instrument_df.instrument_token==token].tradingsymbol.values[0] 
+    ticker = ticker_by_token.get(token)
+    if ticker is None:
+        ticker = ticker_by_token[token] = instrument_df[instrument_df.instrument_token==token].tradingsymbol.values[0]
+    return ticker
 
 def instrumentLookup(instrument_df,symbol):
     """Looks up instrument token for a given script from instrument dump"""
@@ -66,34 +73,13 @@ def instrumentLookup(instrument_df,symbol):
         return -1
         
 def fetchOHLC(ticker,interval,duration):
-    """extracts historical data and outputs in the form of dataframe"""
+    """candles of the last `duration` days, derived from the ticker's 1-minute bar store (only new minutes are downloaded)"""
     instrument = instrumentLookup(instrument_df,ticker)
-    data = pd.DataFrame(kite.historical_data(instrument,dt.date.today()-dt.timedelta(duration), dt.date.today(),interval))
-    data.set_index("date",inplace=True)
-    return data
+    return bar_store.history(instrument,interval,duration)
 
 def atr(DF,n):
-    "function to calculate True Range and Average True Range"
-    df = DF.copy()
-    df['H-L']=abs(df['high']-df['low'])
-    df['H-PC']=abs(df['high']-df['close'].shift(1))
-    df['L-PC']=abs(df['low']-df['close'].shift(1))
-    df['TR']=df[['H-L','H-PC','L-PC']].max(axis=1,skipna=False)
-    df['ATR'] = df['TR'].ewm(com=n,min_periods=n).mean()
-    return df['ATR'][-1]
-
-def MACD(DF,a,b,c):
-    """function to calculate MACD
-       typical values a(fast moving average) = 12; 
-                      b(slow moving average) =26; 
-                      c(signal line ma window) =9"""
-    df = DF.copy()
-    df["MA_Fast"]=df["close"].ewm(span=a,min_periods=a).mean()
-    df["MA_Slow"]=df["close"].ewm(span=b,min_periods=b).mean()
-    df["MACD"]=df["MA_Fast"]-df["MA_Slow"]
-    df["Signal"]=df["MACD"].ewm(span=c,min_periods=c).mean()
-    df.dropna(inplace=True)
-    return df
+    "function to calculate the latest Average True Range"
+    return indicators.atr(DF,n)[-1]
 
 def macd_xover_refresh(macd,ticker):
     global macd_xover
@@ -108,42 +94,32 @@ def renkoBrickSize(ticker):
 def renkoOperation(ticks):
     for tick in ticks:
         try:
-            ticker = tickerLookup(int(tick['instrument_token']))
-            if renko_param[ticker]["upper_limit"] == None:
-                renko_param[ticker]["upper_limit"] = float(tick['last_price']) + renko_param[ticker]["brick_size"]
-                renko_param[ticker]["lower_limit"] = float(tick['last_price']) - renko_param[ticker]["brick_size"]
-            if float(tick['last_price']) > renko_param[ticker]["upper_limit"]:
-                gap = (float(tick['last_price'] - renko_param[ticker]["upper_limit"]))//renko_param[ticker]["brick_size"]
-                renko_param[ticker]["lower_limit"] = renko_param[ticker]["upper_limit"] + (gap*renko_param[ticker]["brick_size"]) - renko_param[ticker]["brick_size"]
-                renko_param[ticker]["upper_limit"] = renko_param[ticker]["upper_limit"] + ((1+gap)*renko_param[ticker]["brick_size"])
-                renko_param[ticker]["brick"] = max(1,renko_param[ticker]["brick"]+(1+gap))
-            if float(tick['last_price']) < renko_param[ticker]["lower_limit"]:
-                gap = (renko_param[ticker]["lower_limit"] - float(tick['last_price']))//renko_param[ticker]["brick_size"]
-                renko_param[ticker]["upper_limit"] = renko_param[ticker]["lower_limit"] - (gap*renko_param[ticker]["brick_size"]) + renko_param[ticker]["brick_size"]
-                renko_param[ticker]["lower_limit"] = renko_param[ticker]["lower_limit"] - ((1+gap)*renko_param[ticker]["brick_size"])
-                renko_param[ticker]["brick"] = min(-1,renko_param[ticker]["brick"]-(1+gap))
-            print("{}: size = {} brick number = {},last price ={}, upper bound ={}, lower bound ={}"\
-                  .format(ticker,renko_param[ticker]["brick_size"], renko_param[ticker]["brick"],tick['last_price'],renko_param[ticker]["upper_limit"],renko_param[ticker]["lower_limit"]))
+            with latency.span("ticker_lookup"):
+                ticker = tickerLookup(int(tick['instrument_token']))
+            renkoUpdate(renko_param[ticker],float(tick['last_price']))
+            tick_logger.debug("%s: size = %s brick number = %s,last price =%s, upper bound =%s, lower bound =%s",
+                              ticker,renko_param[ticker]["brick_size"], renko_param[ticker]["brick"],tick['last_price'],renko_param[ticker]["upper_limit"],renko_param[ticker]["lower_limit"])
         except Exception as e:
-            print(e)
-            pass   
+            tick_logger.error("renko update failed: %s", e)
 
 def placeSLOrder(symbol,buy_sell,quantity,sl_price):    
     # Place an intraday stop loss order on NSE
+    global trade_count
     if buy_sell == "buy":
         t_type=kite.TRANSACTION_TYPE_BUY
         t_type_sl=kite.TRANSACTION_TYPE_SELL
     elif buy_sell == "sell":
         t_type=kite.TRANSACTION_TYPE_SELL
         t_type_sl=kite.TRANSACTION_TYPE_BUY
-    kite.place_order(tradingsymbol=symbol,
+    gateway.place_order(tradingsymbol=symbol,
                     exchange=kite.EXCHANGE_NSE,
                     transaction_type=t_type,
                     quantity=quantity,
                     order_type=kite.ORDER_TYPE_MARKET,
                     product=kite.PRODUCT_MIS,
-                    variety=kite.VARIETY_REGULAR)
-    kite.place_order(tradingsymbol=symbol,
+                    variety=kite.VARIETY_REGULAR).result()
+    gateway.place_order(priority=PRIORITY_SL,
+                    tradingsymbol=symbol,
                     exchange=kite.EXCHANGE_NSE,
                     transaction_type=t_type_sl,
                     quantity=quantity,
@@ -155,99 +131,196 @@ def placeSLOrder(symbol,buy_sell,quantity,sl_price):
     trade_count = trade_count + 1
 
 def ModifyOrder(order_id,price):    
-    # Modify order given order id
-    kite.modify_order(order_id=order_id,
-                    price=round(price,1),
-                    trigger_price=price,
-                    order_type=kite.ORDER_TYPE_SL,
-                    variety=kite.VARIETY_REGULAR) 
+    # Trail the stop of order id; only sent when it moved by at least a tick
+    return trailing.update(order_id,price)
     
+def indicatorState():
+    """per ticker signal state (signals.STATE_COLUMNS), computed in this process"""
+    rows = {}
+    for ticker in tickers:
+        logger.debug(f"starting passthrough for {ticker} {macd_xover[ticker]}")
+        try:
+            ohlc = fetchOHLC(ticker,"5minute",4)
+            macd = MACD(ohlc,12,26,9)
+            macd_xover_refresh(macd,ticker)
+            rows[ticker] = {"close":ohlc["close"][-1], "brick":renko_param[ticker]["brick"],
+                            "long_stop":renko_param[ticker]["lower_limit"], "short_stop":renko_param[ticker]["upper_limit"]}
+        except Exception as e:
+            logger.error(f"API error for ticker : {ticker} {e}")
+    if not rows:
+        return pd.DataFrame(columns=signals.STATE_COLUMNS)
+    state = pd.DataFrame.from_dict(rows, orient="index")
+    xover = pd.Series(macd_xover).reindex(state.index)
+    state["long_ok"] = (xover == "bullish") & (state["brick"] >= 2)
+    state["short_ok"] = (xover == "bearish") & (state["brick"] <= -2)
+    return state
+
 def main(capital):
-    global renko_param
     a,b = 0,0
     while a < 10:
         try:
             pos_df = pd.DataFrame(kite.positions()["day"])
             break
         except:
-            print("can't extract position data..retrying")
+            logger.error("can't extract position data..retrying")
             a+=1
     while b < 10:
         try:
             ord_df = pd.DataFrame(kite.orders())
             break
         except:
-            print("can't extract order data..retrying")
+            logger.error("can't extract order data..retrying")
             b+=1
+    trailing.sync(ord_df)
     
-    for ticker in tickers:
-        print(f"starting passthrough for {ticker} {macd_xover[ticker]}")
-        try:
-            ohlc = fetchOHLC(ticker,"5minute",4)
-            macd = MACD(ohlc,12,26,9)
-            macd_xover_refresh(macd,ticker)
-            quantity = int(capital/ohlc["close"][-1])
-            if len(pos_df.columns)==0:
-                if macd_xover[ticker] == "bullish" and renko_param[ticker]["brick"] >=2:
-                    placeSLOrder(ticker,"buy",quantity,renko_param[ticker]["lower_limit"])
-                if macd_xover[ticker] == "bearish" and renko_param[ticker]["brick"] <=-2:
-                    placeSLOrder(ticker,"sell",quantity,renko_param[ticker]["upper_limit"])
-            if len(pos_df.columns)!=0 and ticker not in pos_df["tradingsymbol"].tolist():
-                if macd_xover[ticker] == "bullish" and renko_param[ticker]["brick"] >=2:
-                    placeSLOrder(ticker,"buy",quantity,renko_param[ticker]["lower_limit"])
-                if macd_xover[ticker] == "bearish" and renko_param[ticker]["brick"] <=-2:
-                    placeSLOrder(ticker,"sell",quantity,renko_param[ticker]["upper_limit"])
-            if len(pos_df.columns)!=0 and ticker in pos_df["tradingsymbol"].tolist():
-                if pos_df[pos_df["tradingsymbol"]==ticker]["quantity"].values[0] == 0:
-                    if macd_xover[ticker] == "bullish" and renko_param[ticker]["brick"] >=2:
-                        placeSLOrder(ticker,"buy",quantity,renko_param[ticker]["lower_limit"])
-                    if macd_xover[ticker] == "bearish" and renko_param[ticker]["brick"] <=-2:
-                        placeSLOrder(ticker,"sell",quantity,renko_param[ticker]["upper_limit"])
-                if pos_df[pos_df["tradingsymbol"]==ticker]["quantity"].values[0] > 0:
-                    order_id = ord_df.loc[(ord_df['tradingsymbol'] == ticker) & (ord_df['status'].isin(["TRIGGER PENDING","OPEN"]))]["order_id"].values[0]
-                    ModifyOrder(order_id,renko_param[ticker]["lower_limit"])
-                if pos_df[pos_df["tradingsymbol"]==ticker]["quantity"].values[0] < 0:
-                    order_id = ord_df.loc[(ord_df['tradingsymbol'] == ticker) & (ord_df['status'].isin(["TRIGGER PENDING","OPEN"]))]["order_id"].values[0]
-                    ModifyOrder(order_id,renko_param[ticker]["upper_limit"])
-        except Exception as e:
-            print("API error for ticker :",ticker)
-            print(e)
+    with latency.span("indicator_refresh"):
+        state = universe.cycle() if universe else indicatorState()
+    if state.empty:
+        return
+    
+    with latency.span("signal_eval"):
+        actions = signals.evaluate(signals.build_table(state, pos_df, ord_df, capital))
+    signals.dispatch(actions, placeSLOrder, ModifyOrder, logger, entries=schedule.entries_allowed() and not kill_switch.tripped)
     
 
 #####################update ticker list######################################
-tickers = ["ABB","ADANIENSOL","ADANIENT","ADANIGREEN","ADANIPORTS","ATGL","AWL","AMBUJACEM","APOLLOHOSP","ASIANPAINT","DMART","AXISBANK","BAJAJ-AUTO","BAJFINANCE","BAJAJFINSV","BAJAJHLDNG","BANKBARODA","BERGEPAINT","BEL","BPCL","BHARTIARTL","BOSCHLTD","BRITANNIA","CANBK","CHOLAFIN","CIPLA","COALINDIA","COLPAL","DLF","DABUR","DIVISLAB","DRREDDY","EICHERMOT","GAIL","GODREJCP","GRASIM","HCLTECH","HDFCBANK","HDFCLIFE","HAVELLS","HEROMOTOCO","HINDALCO","HAL","HINDUNILVR","ICICIBANK","ICICIGI","ICICIPRULI","ITC","IOC","IRCTC","INDUSINDBK","NAUKRI","INFY","INDIGO","JSWSTEEL","JINDALSTEL","KOTAKBANK","LTIM","LT","LICI","M&M","MARICO","MARUTI","MUTHOOTFIN","NTPC","NESTLEIND","ONGC","PIIND","PIDILITIND","POWERGRID","PGHH","PNB","RELIANCE","SBICARD","SBILIFE","SRF","MOTHERSON","SHREECEM","SHRIRAMFIN","SIEMENS","SBIN","SUNPHARMA","TVSMOTOR","TCS","TATACONSUM","TATAMTRDVR","TATAMOTORS","TATAPOWER","TATASTEEL","TECHM","TITAN","TORNTPHARM","TRENT","UPL","ULTRACEMCO","MCDOWELL-N","VBL","VEDL","WIPRO","ZOMATO","ZYDUSLIFE"] 
+tickers = watchlists.RENKO_ATR # edit the list in watchlists.py
 
 #############################################################################
 capital = 6000 #position size
-trade_count = 0
+checkpoint = Checkpoint("renko_atr", logger=logger)
+saved = checkpoint.load() or {}
+trade_count = saved.get("trade_count", 0)
 macd_xover = {}
 renko_param = {}
-for ticker in tickers:
-    renko_param[ticker] = {"brick_size":renkoBrickSize(ticker),"upper_limit":None, "lower_limit":None,"brick":0}
-    macd_xover[ticker] = None
-    
-#create KiteTicker object
-kws = KiteTicker(api_key,kite.access_token)
 tokens = tokenLookup(instrument_df,tickers)
 
-start_minute = dt.datetime.now().minute
+# KITETRADE_SHARDS=n runs the Renko/MACD state in n worker processes (see sharding.py);
+# this process keeps the websocket, the order book view and the order gateway
+shards = int(os.getenv("KITETRADE_SHARDS", "0"))
+universe = None
+schedule = SessionScheduler(logger=logger)
+
+def strategyState():
+    if universe:
+        return {"shards":universe.state(), "trade_count":trade_count}
+    return {"renko_param":renko_param, "macd_xover":macd_xover, "trade_count":trade_count}
+
+def tickOperation(ticks, block=False):
+    if universe:
+        universe.on_ticks(ticks, block=block)
+    else:
+        renkoOperation(ticks)
+
+last_candle = None
 def on_ticks(ws,ticks):
-    global start_minute
-    renkoOperation(ticks)
-    now_minute = dt.datetime.now().minute
-    if abs(now_minute - start_minute) >= 5:
-        start_minute = now_minute
-        main(capital)
+    global last_candle
+    latency.mark("tick")
+    with latency.span("tick_handler"):
+        # replayed minute closes move the Renko state but not the P&L marks or the journal
+        live = [tick for tick in ticks if not tick.get("backfill")]
+        checkpoint.record(live)
+        with latency.span("renko_update"):
+            tickOperation(ticks)
+        if live:
+            portfolio.on_ticks(live)
+            kill_switch.check()
+        candle = clock.candle_start(clock.now(),5)
+        if candle != last_candle and schedule.phase() in ("open","entry_cutoff"):
+            last_candle = candle
+            with latency.span("strategy_cycle"):
+                main(capital)
+            checkpoint.save(strategyState())
+        elif checkpoint.due() and not universe:
+            # sharded state is only collected per cycle, a snapshot in between would skip journal ticks
+            checkpoint.save(strategyState())
 
 def on_connect(ws,response):
     ws.subscribe(tokens)
     ws.set_mode(ws.MODE_LTP,tokens)
 
-while True:
-    now = dt.datetime.now()
-    if (now.hour >= 9):
-        kws.on_ticks=on_ticks
-        kws.on_connect=on_connect
-        kws.connect()
-    if (now.hour >= 14 and now.minute >= 30):
-        sys.exit()
\ No newline at end of file
+square_off = None  # the SquareOff in progress, confirms its exits from the order updates
+
+def on_order_update(ws,order):
+    if square_off:
+        square_off.on_order_update(ws,order)
+    if order["tradingsymbol"] in portfolio_symbols:
+        portfolio.apply_order(order)
+
+#create KiteTicker object
+kws = KiteTicker(api_key,kite.access_token,root=kite_ws_root,reconnect_max_tries=300,reconnect_max_delay=30)
+reconnect = None
+
+def warmUp():
+    """pre-open: size the bricks (or start the shards), replay the journal and connect the feed"""
+    global universe, reconnect, last_candle
+    if shards:
+        universe = ShardedUniverse(RenkoMacdShard, tickers, tokens, shards, kite_args=(api_key, access_token, kite_root),
+                                   saved=saved.get("shards"), logger=logger)
+        universe.start()
+    else:
+        for ticker in tickers:
+            if ticker in saved.get("renko_param", {}):
+                renko_param[ticker] = saved["renko_param"][ticker]
+                macd_xover[ticker] = saved["macd_xover"].get(ticker)
+            else:
+                renko_param[ticker] = {"brick_size":renkoBrickSize(ticker),"upper_limit":None, "lower_limit":None,"brick":0}
+                macd_xover[ticker] = None
+
+    portfolio.load_positions([p for p in kite.positions()["day"] if p["tradingsymbol"] in portfolio_symbols])
+
+    # warm restart: bring the Renko state up to the last tick recorded before the restart
+    replayed = checkpoint.replay()
+    if len(replayed):
+        tickOperation([{"instrument_token":t, "last_price":p} for t,p in zip(replayed["token"].tolist(), replayed["price"].tolist())], block=True)
+        logger.info(f"replayed {len(replayed)} ticks from the checkpoint journal")
+    if not universe:
+        checkpoint.save(strategyState())
+
+    # KiteTicker reconnects on its own; the manager backfills the minutes missed while it was down
+    # (and since the last tick in the checkpoint journal on a restart)
+    last_candle = clock.candle_start(clock.now(),5)
+    reconnect = ReconnectManager(kws, kite, on_ticks, on_connect, tokens, since=checkpoint.last_tick, logger=logger)
+    kws.on_order_update = on_order_update
+    reconnect.connect(threaded=True)
+
+def squareOff():
+    # only this strategy's instruments, other positions in the account are left alone
+    global square_off
+    mine = set(tickers)
+    positions = [p for p in kite.positions()["day"] if p["tradingsymbol"] in mine]
+    orders = [o for o in kite.orders() if o["tradingsymbol"] in mine]
+    square_off = SquareOff(kite, gateway=gateway, logger=logger)
+    try:
+        report = square_off.run(positions, orders)
+    finally:
+        square_off = None
+    logger.info(f"square off complete in {report['time_to_flat']:.3f}s - exits: {report['exits']}")
+    if report["failed"] or report["unconfirmed"]:
+        logger.error(f"square off failed: {report['failed']} unconfirmed: {report['unconfirmed']}")
+
+def killSwitch(reason):
+    logger.error(f"kill switch: {reason}, squaring off and stopping new entries")
+    squareOff()
+
+# live P&L of this strategy's instruments; KITETRADE_MAX_LOSS arms a day loss limit
+portfolio_symbols = set(tickers)
+portfolio = Portfolio(logger=logger)
+max_loss = os.getenv("KITETRADE_MAX_LOSS")
+kill_switch = KillSwitch(portfolio, killSwitch, max_loss=float(max_loss) if max_loss else None, logger=logger)
+
+def shutDown():
+    if reconnect:
+        kws.close()
+    checkpoint.save(strategyState())
+    gateway.stop()
+    logger.info(f"session done, {trade_count} trades, P&L {portfolio.pnl():.2f} (realised {portfolio.realised():.2f})")
+
+schedule.on("warmup", warmUp)
+schedule.on("square_off", squareOff)
+schedule.on("shutdown", shutDown)
+try:
+    schedule.run()
+finally:
+    if universe:
+        universe.stop()
@@ -0,0 +1,193 @@
+"""
+Exchange calendar and trading day lifecycle for the strategy scripts.
+
+SessionCalendar knows which days the exchange trades (weekdays minus the
+published NSE holidays, plus any listed in KITETRADE_HOLIDAYS). The table
+has to be extended every year; past its last year a warning is logged and
+every weekday counts as a trading day.
+SessionScheduler walks one trading day through its phases, sleeping on
+the process clock until each one instead of polling:
+
+    warmup       pre-open: load state, size bricks, connect the feed
+    open         session open: strategy cycles start
+    entry_cutoff no new entries from here, open positions keep trailing
+    square_off   flatten what is still open
+    shutdown     stop the feed and exit
+
+Callbacks are registered per phase with on(); run() fires them in order
+and can also drive a periodic task (the strategy cycle) between open and
+square_off, aligned to the session open. A script started late fires the
+phases it missed at once, except that after square_off only square_off and
+shutdown are fired, and after shutdown nothing is.
+
+    KITETRADE_HOLIDAYS=holidays.txt   extra exchange holidays, one YYYY-MM-DD per line
+"""
+import datetime as dt
+import logging
+import os
+import threading
+
+import clock
+
+PHASES = ("warmup", "open", "entry_cutoff", "square_off", "shutdown")
+
+# NSE trading holidays (equity and F&O segments) falling on weekdays
+NSE_HOLIDAYS = {
+    # 2024
+    "2024-01-22", "2024-01-26", "2024-03-08", "2024-03-25", "2024-03-29", "2024-04-11", "2024-04-17",
+    "2024-05-01", "2024-05-20", "2024-06-17", "2024-07-17", "2024-08-15", "2024-10-02", "2024-11-01",
+    "2024-11-15", "2024-11-20", "2024-12-25",
+    # 2025
+    "2025-02-26", "2025-03-14", "2025-03-31", "2025-04-10", "2025-04-14", "2025-04-18", "2025-05-01",
+    "2025-08-15", "2025-08-27", "2025-10-02", "2025-10-21", "2025-10-22", "2025-11-05", "2025-12-25",
+    # 2026 (01-15: Maharashtra municipal elections, declared after the annual list)
+    "2026-01-15", "2026-01-26", "2026-03-03", "2026-03-26", "2026-03-31", "2026-04-03", "2026-04-14",
+    "2026-05-01", "2026-05-28", "2026-06-26", "2026-09-14", "2026-10-02", "2026-10-20", "2026-11-10",
+    "2026-11-24", "2026-12-25",
+}
+
+
+def _time(value):
+    return value if isinstance(value, dt.time) else dt.datetime.strptime(value, "%H:%M").time()
+
+
+class SessionCalendar():
+    """
+    Trading days of the exchange.
+
+    :Parameters:
+        holidays : iterable
+            dates (date or "YYYY-MM-DD") the exchange is closed on, defaults to
+            NSE_HOLIDAYS plus the file named by KITETRADE_HOLIDAYS
+    """
+
+    def __init__(self, holidays=None, logger=None):
+        if holidays is None:
+            holidays = set(NSE_HOLIDAYS)
+            path = os.getenv("KITETRADE_HOLIDAYS")
+            if path:
+                with open(path) as f:
+                    holidays |= {line.strip() for line in f if line.strip() and not line.startswith("#")}
+        self.holidays = {d if isinstance(d, dt.date) else dt.date.fromisoformat(d) for d in holidays}
+        self.last_year = max((d.year for d in self.holidays), default=None)
+        today = clock.today()
+        if self.last_year is None or today.year > self.last_year:
+            (logger or logging.getLogger(__name__)).warning(
+                f"no exchange holidays listed for {today.year} (last year covered: {self.last_year}), "
+                f"every weekday counts as a trading day; update NSE_HOLIDAYS or KITETRADE_HOLIDAYS")
+
+    def is_trading_day(self, day):
+        return day.weekday() < 5 and day not in self.holidays
+
+    def next_trading_day(self, day):
+        """First trading day after `day`."""
+        day += dt.timedelta(days=1)
+        while not self.is_trading_day(day):
+            day += dt.timedelta(days=1)
+        return day
+
+
+class SessionScheduler():
+    """
+    Phases of one trading day on the process clock.
+
+    :Parameters:
+        calendar : SessionCalendar
+            defaults to the NSE calendar
+        warmup, open, entry_cutoff, square_off, shutdown : str or time
+            phase times ("HH:MM"); square_off before the broker's own MIS
+            square-off at 15:20
+    """
+
+    def __init__(self, calendar=None, warmup="09:00", open="09:15", entry_cutoff="15:00",
+                 square_off="15:15", shutdown="15:30", logger=None):
+        self.calendar = calendar or SessionCalendar(logger=logger)
+        self.times = dict(zip(PHASES, map(_time, (warmup, open, entry_cutoff, square_off, shutdown))))
+        if list(self.times.values()) != sorted(self.times.values()):
+            raise ValueError(f"session phases out of order: {self.times}")
+        self.log = logger or logging.getLogger(__name__)
+        self.callbacks = {phase: [] for phase in PHASES}
+        self._stopped = threading.Event()
+
+    def on(self, phase, callback):
+        """Call `callback()` when `phase` begins."""
+        self.callbacks[phase].append(callback)
+        return callback
+
+    def at(self, phase, day=None):
+        return dt.datetime.combine(day or clock.today(), self.times[phase])
+
+    def phase(self, now=None):
+        """Phase in effect at `now`, None before warmup or on a closed day."""
+        now = now or clock.now()
+        if not self.calendar.is_trading_day(now.date()):
+            return None
+        current = None
+        for phase in PHASES:
+            if now.time() >= self.times[phase]:
+                current = phase
+        return current
+
+    def entries_allowed(self, now=None):
+        """True between the open and the entry cut-off of a trading day."""
+        return self.phase(now) == "open"
+
+    def stop(self):
+        """Make run() return at its next wake-up."""
+        self._stopped.set()
+
+    # ---------------------------------------------
+    def _sleep_until(self, when):
+        # in slices so stop() is noticed; the last slice lands on `when`
+        while not self._stopped.is_set():
+            left = (when - clock.now()).total_seconds()
+            if left <= 0:
+                return
+            clock.sleep(min(left, 5))
+
+    def _fire(self, phase):
+        self.log.info(f"session phase: {phase}")
+        for callback in self.callbacks[phase]:
+            try:
+                callback()
+            except Exception as e:
+                self.log.exception(f"{phase} callback failed: {e}")
+
+    def run(self, task=None, interval=None):
+        """
+        Run today's session: fire the phase callbacks and, between open and
+        square_off, call `task()` on entering the session and then every
+        `interval` seconds counted from the open. Returns False when today is
+        not a trading day or its session is already over.
+        """
+        now = clock.now()
+        today = now.date()
+        if not self.calendar.is_trading_day(today):
+            self.log.warning(f"{today} is not a trading day, next is {self.calendar.next_trading_day(today)}")
+            return False
+        if now >= self.at("shutdown", today):
+            self.log.warning(f"the {today} session is over")
+            return False
+        if task and not interval:
+            raise ValueError("a task needs an interval")
+        # started after square_off: only flatten and stop
+        pending = list(PHASES) if now < self.at("square_off", today) else ["square_off", "shutdown"]
+        opened, close = self.at("open", today), self.at("square_off", today)
+        step = dt.timedelta(seconds=interval) if interval else None
+        next_task = None
+        for phase in pending:
+            due = max(self.at(phase, today), clock.now())
+            while task and next_task is not None and next_task < min(due, close):
+                self._sleep_until(next_task)
+                if self._stopped.is_set():
+                    return True
+                task()
+                now = clock.now()
+                next_task = opened + ((now - opened) // step + 1) * step
+            self._sleep_until(due)
+            if self._stopped.is_set():
+                return True
+            self._fire(phase)
+            if phase == "open":
+                next_task = clock.now()
+        return True
@@ -0,0 +1,409 @@
+"""
+Multi-process sharding of a strategy's instrument universe.
+
+The instrument list is partitioned across worker processes by a hash of
+the instrument token. Each worker owns the indicator state of its shard
+(a ShardStrategy) and talks to the parent through:
+
+    TickRing     a single-producer/single-consumer ring of (slot, price,
+                 time) records in shared memory; the parent writes every
+                 websocket tick for the shard, the worker drains it
+    commands     a queue the parent uses to start a cycle (or stop)
+    results      one queue back to the parent: per-ticker signal rows in
+                 signals.STATE_COLUMNS plus the shard's state snapshot
+
+The parent stays the single gateway process: it keeps the position/order
+view, evaluates the rows with signals and sends orders through its
+OrderGateway. Historical API calls from all workers share one
+tools.SharedTokenBucket, so the universe as a whole stays inside the
+historical rate limit however many shards run.
+
+    KITETRADE_SHARDS=4      run renko_atr / three_sup_trend with 4 worker processes
+"""
+import logging
+import multiprocessing as mp
+import os
+import queue
+import time
+
+import numpy as np
+import pandas as pd
+
+import indicators
+from bars import BarStore
+import signals
+import tools
+
+RECORD = np.dtype([("slot", "<i4"), ("price", "<f8"), ("time", "<f8")])
+HISTORICAL_RATE = 3  # historical API requests per second, for the whole universe
+
+
+def shard_of(token, shards):
+    """Shard of an instrument token (multiplicative hash, high bits, so neighbouring tokens spread out)."""
+    return (((int(token) * 2654435761) & 0xFFFFFFFF) * shards) >> 32
+
+
+class TickRing():
+    """
+    Tick records in a shared memory ring with one writer and one reader.
+
+    The writer publishes by bumping the head counter after the records are
+    in place and the reader publishes how far it has read; a reader that
+    falls more than `capacity` records behind loses the oldest ones and
+    counts them in `dropped`, unless the writer pushes with `block`.
+    """
+
+    def __init__(self, capacity=65536, name=None):
+        from multiprocessing import shared_memory
+        size = 16 + capacity * RECORD.itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.capacity = capacity
+        self._head = np.ndarray((1,), dtype="<i8", buffer=self.shm.buf[:8])
+        self._read = np.ndarray((1,), dtype="<i8", buffer=self.shm.buf[8:16])
+        self._records = np.ndarray((capacity,), dtype=RECORD, buffer=self.shm.buf[16:size])
+        self._tail = int(self._head[0])
+        self.dropped = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def push(self, slots, prices, now, block=False):
+        """Append records; with `block` wait for the reader instead of overwriting unread ones."""
+        if block and len(slots) > self.capacity // 2:
+            for i in range(0, len(slots), self.capacity // 2):
+                self.push(slots[i:i + self.capacity // 2], prices[i:i + self.capacity // 2], now, block)
+            return
+        while block and int(self._head[0]) + len(slots) - int(self._read[0]) > self.capacity:
+            time.sleep(0.001)
+        head = int(self._head[0])
+        idx = (head + np.arange(len(slots))) % self.capacity
+        self._records["slot"][idx] = slots
+        self._records["price"][idx] = prices
+        self._records["time"][idx] = now
+        self._head[0] = head + len(slots)
+
+    def pop(self):
+        """Records written since the last pop, oldest first."""
+        head = int(self._head[0])
+        start = max(self._tail, head - self.capacity)
+        out = self._records[np.arange(start, head) % self.capacity].copy()
+        overwritten = int(self._head[0]) - self.capacity - start  # lapped while copying
+        if overwritten > 0:
+            out = out[overwritten:]
+            start += overwritten
+        self.dropped += start - self._tail
+        self._tail = head
+        self._read[0] = head
+        return out
+
+    def close(self, unlink=False):
+        del self._head, self._read, self._records
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+# =============================================
+# worker side
+
+class ShardStrategy():
+    """
+    Indicator state for one shard. Subclasses implement cycle() and, for
+    tick driven state, on_ticks().
+
+    :Parameters:
+        kite : KiteConnect
+            the worker's own session
+        tickers, tokens : list
+            instruments of this shard; tick slots index these lists
+        bucket : tools.SharedTokenBucket
+            historical API limit shared by every shard
+        saved : dict
+            {ticker: state} from a previous state() to resume from
+        store : bars.BarStore
+            1-minute bars the candles are derived from, defaults to one of the shard's own
+    """
+
+    def __init__(self, kite, tickers, tokens, bucket, saved=None, logger=None, store=None):
+        self.kite = kite
+        self.tickers = list(tickers)
+        self.tokens = list(tokens)
+        self.bucket = bucket
+        self.saved = saved or {}
+        self.log = logger or logging.getLogger(__name__)
+        self.store = store or BarStore(kite, bucket, logger=self.log)
+
+    def fetchOHLC(self, token, interval, duration):
+        return self.store.history(token, interval, duration)
+
+    def on_ticks(self, slots, prices):
+        pass
+
+    def cycle(self):
+        """{ticker: row with signals.STATE_COLUMNS} for the shard."""
+        raise NotImplementedError
+
+    def state(self):
+        """{ticker: JSON serializable state} to checkpoint."""
+        return {}
+
+
+class RenkoMacdShard(ShardStrategy):
+    """renko_atr: Renko bricks from ticks, MACD(12,26,9) crossover on 5-minute candles."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.params, self.xover = [], []
+        for ticker, token in zip(self.tickers, self.tokens):
+            saved = self.saved.get(ticker)
+            if saved:
+                self.params.append(saved["renko_param"])
+                self.xover.append(saved["macd_xover"])
+                continue
+            try:
+                size = min(10, max(1, round(1.5 * indicators.atr(self.fetchOHLC(token, "60minute", 60), 200).iloc[-1], 0)))
+            except Exception as e:
+                self.log.error(f"brick size for {ticker} failed: {e}")
+                size = np.nan
+            self.params.append({"brick_size": size, "upper_limit": None, "lower_limit": None, "brick": 0})
+            self.xover.append(None)
+
+    def on_ticks(self, slots, prices):
+        for slot, price in zip(slots.tolist(), prices.tolist()):
+            indicators.renkoUpdate(self.params[slot], price)
+
+    def cycle(self):
+        rows = {}
+        for i, (ticker, token) in enumerate(zip(self.tickers, self.tokens)):
+            try:
+                ohlc = self.fetchOHLC(token, "5minute", 4)
+                macd = indicators.MACD(ohlc, 12, 26, 9)
+                if macd["MACD"].iloc[-1] > macd["Signal"].iloc[-1]:
+                    self.xover[i] = "bullish"
+                elif macd["MACD"].iloc[-1] < macd["Signal"].iloc[-1]:
+                    self.xover[i] = "bearish"
+                param = self.params[i]
+                rows[ticker] = {"close": ohlc["close"].iloc[-1],
+                                "long_ok": self.xover[i] == "bullish" and param["brick"] >= 2,
+                                "short_ok": self.xover[i] == "bearish" and param["brick"] <= -2,
+                                "long_stop": param["lower_limit"], "short_stop": param["upper_limit"]}
+            except Exception as e:
+                self.log.error(f"API error for ticker : {ticker} {e}")
+        return rows
+
+    def state(self):
+        return {t: {"renko_param": p, "macd_xover": x} for t, p, x in zip(self.tickers, self.params, self.xover)}
+
+
+class SupertrendShard(ShardStrategy):
+    """three_sup_trend: Supertrend (7,3), (10,3), (11,2) directions and sl_price on 5-minute candles."""
+
+    LINES = ((7, 3), (10, 3), (11, 2))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.st_dir = [self.saved.get(t, {}).get("st_dir", ["None", "None", "None"]) for t in self.tickers]
+
+    def cycle(self):
+        rows = {}
+        for i, (ticker, token) in enumerate(zip(self.tickers, self.tokens)):
+            try:
+                ohlc = self.fetchOHLC(token, "5minute", 4)
+                for k, (n, m) in enumerate(self.LINES):
+                    ohlc[f"st{k + 1}"] = indicators.supertrend(ohlc, n, m)
+                st = ohlc[["st1", "st2", "st3"]].to_numpy()[-2:]
+                close = ohlc["close"].to_numpy()[-2:]
+                for k in range(3):
+                    if st[1, k] > close[1] and st[0, k] < close[0]:
+                        self.st_dir[i][k] = "red"
+                    if st[1, k] < close[1] and st[0, k] > close[0]:
+                        self.st_dir[i][k] = "green"
+                stop = indicators.sl_price(ohlc)
+                rows[ticker] = {"close": close[1], "long_ok": all(d == "green" for d in self.st_dir[i]),
+                                "short_ok": all(d == "red" for d in self.st_dir[i]),
+                                "long_stop": stop, "short_stop": stop}
+            except Exception as e:
+                self.log.error(f"API error for ticker : {ticker} {e}")
+        return rows
+
+    def state(self):
+        return {t: {"st_dir": d} for t, d in zip(self.tickers, self.st_dir)}
+
+
+def _worker(shard, strategy_cls, tickers, tokens, saved, ring_name, capacity, commands, results, bucket, kite_args):
+    from kiteconnect import KiteConnect
+    # a forked worker inherits the parent's queue handlers but not their listener thread
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(f"%(asctime)s shard{shard} %(levelname)s :: %(message)s"))
+    logging.getLogger().handlers = [handler]
+    log = logging.getLogger(f"shard{shard}")
+    log.setLevel(logging.INFO)
+    api_key, access_token, root = kite_args
+    kite = KiteConnect(api_key=api_key, root=root)
+    kite.set_access_token(access_token)
+    ring = TickRing(capacity, name=ring_name)
+    strategy = strategy_cls(kite, tickers, tokens, bucket, saved, logger=log)
+    results.put((shard, 0, {}, strategy.state(), 0.0, 0, None))  # ready
+    try:
+        while True:
+            records = ring.pop()
+            if len(records):
+                strategy.on_ticks(records["slot"], records["price"])
+            try:
+                command, seq = commands.get(timeout=0.02)
+            except queue.Empty:
+                continue
+            if command == "stop":
+                break
+            records = ring.pop()
+            if len(records):
+                strategy.on_ticks(records["slot"], records["price"])
+            started = time.perf_counter()
+            try:
+                rows, error = strategy.cycle(), None
+            except Exception as e:
+                rows, error = {}, repr(e)
+            results.put((shard, seq, rows, strategy.state(), time.perf_counter() - started, ring.dropped, error))
+    finally:
+        ring.close()
+
+
+# =============================================
+# parent side
+
+class ShardedUniverse():
+    """
+    Runs a ShardStrategy over `tickers` in `shards` worker processes.
+
+    :Parameters:
+        strategy_cls : type
+            ShardStrategy subclass, importable by the workers
+        tickers, tokens : list
+            instruments and their tokens
+        kite_args : tuple
+            (api_key, access_token, root) for the workers' sessions
+        saved : dict
+            {ticker: state} from a previous state()
+        capacity : int
+            tick records buffered per shard
+        context : str
+            multiprocessing start method; "fork" by default since the strategy
+            scripts run their module level code and cannot be re-imported by a
+            spawned worker
+    """
+
+    def __init__(self, strategy_cls, tickers, tokens, shards=None, kite_args=None, saved=None,
+                 capacity=65536, historical_rate=HISTORICAL_RATE, context="fork", logger=None):
+        self.strategy_cls = strategy_cls
+        self.shards = shards or os.cpu_count()
+        self.kite_args = kite_args
+        self.saved = saved or {}
+        self.capacity = capacity
+        self.historical_rate = historical_rate
+        self.context = context
+        self.log = logger or logging.getLogger(__name__)
+        self.members = [([], []) for _ in range(self.shards)]
+        self.route = {}  # token -> (shard, slot)
+        for ticker, token in zip(tickers, tokens):
+            shard = shard_of(token, self.shards)
+            self.route[int(token)] = (shard, len(self.members[shard][0]))
+            self.members[shard][0].append(ticker)
+            self.members[shard][1].append(int(token))
+        self.stats = {}
+        self._state = {}
+        self._seq = 0
+        self._started = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def start(self, timeout=None):
+        """Start the workers and wait until every shard has built its initial state."""
+        ctx = mp.get_context(self.context)
+        bucket = tools.SharedTokenBucket(self.historical_rate, ctx=ctx)
+        self.results = ctx.Queue()
+        self.rings, self.commands, self.processes = [], [], []
+        for shard, (tickers, tokens) in enumerate(self.members):
+            ring = TickRing(self.capacity)
+            commands = ctx.Queue()
+            saved = {t: self.saved[t] for t in tickers if t in self.saved}
+            proc = ctx.Process(target=_worker, name=f"shard{shard}", daemon=True,
+                               args=(shard, self.strategy_cls, tickers, tokens, saved, ring.name, self.capacity,
+                                     commands, self.results, bucket, self.kite_args))
+            proc.start()
+            self.rings.append(ring)
+            self.commands.append(commands)
+            self.processes.append(proc)
+        self._started = True
+        self._collect(0, timeout)
+        sizes = [len(m[0]) for m in self.members]
+        self.log.info(f"{self.strategy_cls.__name__}: {sum(sizes)} instruments on {self.shards} shards {sizes}")
+
+    def stop(self):
+        if not self._started:
+            return
+        for commands in self.commands:
+            commands.put(("stop", 0))
+        for proc in self.processes:
+            proc.join(5)
+            if proc.is_alive():
+                proc.terminate()
+        for ring in self.rings:
+            ring.close(unlink=True)
+        self._started = False
+
+    # ---------------------------------------------
+    def on_ticks(self, ticks, now=None, block=False):
+        """Route kite ticks into the shards' rings; `block` waits for slow shards instead of dropping (replays)."""
+        now = time.time() if now is None else now
+        batches = {}
+        for tick in ticks:
+            route = self.route.get(tick["instrument_token"])
+            if route is not None:
+                slots, prices = batches.setdefault(route[0], ([], []))
+                slots.append(route[1])
+                prices.append(tick["last_price"])
+        for shard, (slots, prices) in batches.items():
+            self.rings[shard].push(slots, prices, now, block)
+
+    def _collect(self, seq, timeout):
+        rows, pending = {}, set(range(self.shards))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while pending:
+            wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                shard, got, shard_rows, state, seconds, dropped, error = self.results.get(timeout=wait)
+            except queue.Empty:
+                break
+            if got != seq:
+                continue  # a late answer to an earlier cycle
+            pending.discard(shard)
+            rows.update(shard_rows)
+            self._state.update(state)
+            self.stats[shard] = {"seconds": seconds, "rows": len(shard_rows), "dropped_ticks": dropped}
+            if error:
+                self.log.error(f"shard {shard} cycle failed: {error}")
+        if pending:
+            self.log.warning(f"shards {sorted(pending)} missed the cycle deadline")
+        return rows
+
+    def cycle(self, timeout=240):
+        """
+        One strategy cycle on every shard in parallel; returns the signal rows
+        as a DataFrame indexed by ticker (shards that miss `timeout` are left out).
+        """
+        self._seq += 1
+        for commands in self.commands:
+            commands.put(("cycle", self._seq))
+        rows = self._collect(self._seq, timeout)
+        return pd.DataFrame.from_dict(rows, orient="index", columns=signals.STATE_COLUMNS)
+
+    def state(self):
+        """{ticker: state} as of the last cycle, for checkpointing."""
+        return dict(self._state)
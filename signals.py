@@ -0,0 +1,104 @@
+"""
+Vectorized signal stage for the strategy loops.
+
+Each cycle the strategy collects one row of indicator state per ticker
+(last close, whether the long/short entry rule holds and the stop for
+each side). build_table() joins that with the position book and pending
+stop loss orders in one pass, evaluate() applies the entry and trail
+rules as boolean masks over the whole universe and returns the order
+actions, and dispatch() hands them to the order functions.
+"""
+import numpy as np
+import pandas as pd
+
+PENDING_STATUSES = ["TRIGGER PENDING", "OPEN"]
+STATE_COLUMNS = ["close", "long_ok", "short_ok", "long_stop", "short_stop"]
+
+
+def positions_by_symbol(pos_df):
+    """Net quantity per tradingsymbol (first row per symbol, as the scripts always read it)."""
+    if pos_df is None or len(pos_df.columns) == 0:
+        return pd.Series(dtype="float64", name="quantity")
+    return pos_df.drop_duplicates("tradingsymbol").set_index("tradingsymbol")["quantity"]
+
+
+def pending_by_symbol(ord_df):
+    """First pending (stop loss) order id per tradingsymbol."""
+    if ord_df is None or len(ord_df.columns) == 0:
+        return pd.Series(dtype="object", name="sl_order_id")
+    pending = ord_df[ord_df["status"].isin(PENDING_STATUSES)]
+    return pending.drop_duplicates("tradingsymbol").set_index("tradingsymbol")["order_id"].rename("sl_order_id")
+
+
+def build_table(state, pos_df, ord_df, capital):
+    """
+    Join per-ticker indicator state with positions and pending orders.
+
+    :Parameters:
+        state : DataFrame
+            indexed by tradingsymbol with STATE_COLUMNS
+        pos_df, ord_df : DataFrame
+            kite.positions()["day"] and kite.orders() as frames
+        capital : float
+            position size per entry
+    """
+    table = state.join(positions_by_symbol(pos_df).rename("quantity")).join(pending_by_symbol(ord_df))
+    table["quantity"] = table["quantity"].fillna(0)
+    table["size"] = (capital / table["close"]).fillna(0).astype(int)
+    return table
+
+
+def evaluate(table):
+    """
+    Entry and trail rules over the whole table; returns a list of actions:
+        {"action": "trail", "symbol", "order_id", "price"}
+        {"action": "entry", "symbol", "side", "quantity", "price"}
+        {"action": "unprotected", "symbol", "quantity"}  open position without a pending stop
+    Trails come first so existing positions are protected before new risk is added.
+    """
+    qty = table["quantity"].to_numpy()
+    flat = qty == 0
+    has_sl = table["sl_order_id"].notna().to_numpy()
+    long_stop = table["long_stop"].to_numpy(dtype=float)
+    short_stop = table["short_stop"].to_numpy(dtype=float)
+    sized = table["size"].to_numpy() > 0
+
+    trail_long = (qty > 0) & has_sl & ~np.isnan(long_stop)
+    trail_short = (qty < 0) & has_sl & ~np.isnan(short_stop)
+    buy = flat & sized & table["long_ok"].to_numpy(dtype=bool) & ~np.isnan(long_stop)
+    sell = flat & sized & table["short_ok"].to_numpy(dtype=bool) & ~np.isnan(short_stop)
+    unprotected = ~flat & ~has_sl
+
+    symbols = table.index.to_numpy()
+    order_ids = table["sl_order_id"].to_numpy()
+    sizes = table["size"].to_numpy()
+    actions = []
+    for mask, stops in ((trail_long, long_stop), (trail_short, short_stop)):
+        for symbol, order_id, price in zip(symbols[mask], order_ids[mask], stops[mask]):
+            actions.append({"action": "trail", "symbol": symbol, "order_id": order_id, "price": float(price)})
+    for mask, side, stops in ((buy, "buy", long_stop), (sell, "sell", short_stop)):
+        for symbol, size, price in zip(symbols[mask], sizes[mask], stops[mask]):
+            actions.append({"action": "entry", "symbol": symbol, "side": side,
+                            "quantity": int(size), "price": float(price)})
+    for symbol, quantity in zip(symbols[unprotected], qty[unprotected]):
+        actions.append({"action": "unprotected", "symbol": symbol, "quantity": int(quantity)})
+    return actions
+
+
+def dispatch(actions, enter, trail, logger, entries=True):
+    """
+    Send actions to enter(symbol, side, quantity, stop) and trail(order_id, price);
+    entries=False drops new entries (after the entry cut-off) but still trails.
+    """
+    for act in actions:
+        try:
+            if act["action"] == "trail":
+                trail(act["order_id"], act["price"])
+            elif act["action"] == "entry":
+                if not entries:
+                    continue
+                enter(act["symbol"], act["side"], act["quantity"], act["price"])
+            else:
+                logger.warning(f"{act['symbol']}: position {act['quantity']} has no pending stop loss order")
+        except Exception as e:
+            logger.error(f"API error for ticker : {act['symbol']} {e}")
@@ -0,0 +1,182 @@
+"""
+Parallel, rate-limited square-off.
+
+Cancels pending orders and exits open positions concurrently, staying
+inside the order API rate limit, largest exposure first. For every symbol
+its pending orders are cancelled before the exit is sent so a stop loss
+cannot fill on top of the exit. Exits are confirmed through order updates
+(KiteTicker.on_order_update) or, failing that, by polling the order book.
+Cancels and exits go through the exit lane of an OrderGateway, which does
+the rate limiting and the idempotent retries.
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from order_gateway import OrderGateway, PRIORITY_EXIT
+
+PENDING_STATUSES = ["TRIGGER PENDING", "OPEN"]
+FINAL_STATUSES = ("COMPLETE", "CANCELLED", "REJECTED")
+
+
+class SquareOff():
+    """
+    Flattens every open position and cancels every pending order.
+
+    :Parameters:
+        kite : KiteConnect
+            authenticated client
+        rate : float
+            order API calls per second (Kite allows 10)
+        workers : int
+            concurrent API calls
+        max_attempts : int
+            tries per cancel/exit before giving up
+        backoff : float
+            first retry delay in seconds, doubled on every retry
+        confirm_timeout : float
+            seconds to wait for exits to report COMPLETE
+        bucket : TokenBucket
+            shared limiter, overrides `rate` when given
+        gateway : OrderGateway
+            the process order gateway; one is created from the settings above when None
+    """
+
+    def __init__(self, kite, rate=10, workers=8, max_attempts=5, backoff=0.2,
+                 confirm_timeout=10, poll_interval=0.5, bucket=None, gateway=None, logger=None):
+        self.kite = kite
+        self.log = logger or logging.getLogger(__name__)
+        self.gateway = gateway or OrderGateway(kite, rate=rate, workers=workers, max_attempts=max_attempts,
+                                               backoff=backoff, bucket=bucket, logger=self.log)
+        self.workers = workers
+        self.backoff = backoff
+        self.confirm_timeout = confirm_timeout
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._status = {}
+        self._updated = threading.Condition(self._lock)
+        self._cancelled = []
+        self._failed = []
+
+    # ---------------------------------------------
+    def on_order_update(self, ws, data):
+        """KiteTicker.on_order_update callback; records the latest status per order."""
+        with self._updated:
+            self._status[data.get("order_id")] = data.get("status")
+            self._updated.notify_all()
+
+    def _fetch(self, name, func):
+        for attempt in range(10):
+            try:
+                return func()
+            except Exception as e:
+                self.log.error(f"can't extract {name}..retrying ({e})")
+                time.sleep(self.backoff)
+        return None
+
+    # ---------------------------------------------
+    def _cancel(self, order):
+        try:
+            self.gateway.cancel_order(priority=PRIORITY_EXIT, order_id=order["order_id"],
+                                      variety=order.get("variety") or self.kite.VARIETY_REGULAR).result()
+            self.log.debug(f"[CANCEL ORDER] {order['order_id']}")
+            with self._lock:
+                self._cancelled.append(order["order_id"])
+            return True
+        except Exception as e:
+            self.log.error(f"unable to cancel order id : {order['order_id']} ({e})")
+            with self._lock:
+                self._failed.append(order["order_id"])
+            return False
+
+    def _place_exit(self, position, quantity):
+        """Market exit, tagged so a retry after a timeout cannot double the order."""
+        tag = "SQ" + uuid.uuid4().hex[:10]
+        params = dict(tradingsymbol=position["tradingsymbol"],
+                      exchange=position["exchange"],
+                      transaction_type=self.kite.TRANSACTION_TYPE_SELL if quantity > 0 else self.kite.TRANSACTION_TYPE_BUY,
+                      quantity=abs(int(quantity)),
+                      order_type=self.kite.ORDER_TYPE_MARKET,
+                      product=position["product"],
+                      variety=self.kite.VARIETY_REGULAR,
+                      tag=tag)
+        return self.gateway.place_order(priority=PRIORITY_EXIT, **params).result()
+
+    def _flatten(self, position, pending):
+        """Cancel the symbol's pending orders, then exit what is left of the position."""
+        cancelled = [self._cancel(order) for order in pending]
+        quantity = position["quantity"]
+        if not all(cancelled):
+            # a stop may have filled instead of cancelling; re-read the position
+            positions = self._fetch("position data", self.kite.positions) or {"day": []}
+            current = [p for p in positions["day"]
+                       if p["tradingsymbol"] == position["tradingsymbol"] and p["product"] == position["product"]]
+            quantity = current[0]["quantity"] if current else 0
+        if quantity == 0:
+            return None
+        self.log.debug(f"[MARKET ORDER] {position['tradingsymbol']}, {quantity}")
+        return self._place_exit(position, quantity)
+
+    def _confirm(self, order_ids, deadline):
+        """Wait until every exit is final; order updates first, order book polling as fallback."""
+        remaining = set(order_ids)
+        while remaining and time.monotonic() < deadline:
+            with self._updated:
+                done = {o for o in remaining if self._status.get(o) in FINAL_STATUSES}
+                remaining -= done
+                if remaining:
+                    self._updated.wait(self.poll_interval)
+            if remaining:
+                for order in self._fetch("order data", self.kite.orders) or []:
+                    if order["order_id"] in remaining and order["status"] in FINAL_STATUSES:
+                        with self._lock:
+                            self._status[order["order_id"]] = order["status"]
+                        remaining.discard(order["order_id"])
+        return remaining
+
+    # ---------------------------------------------
+    def run(self, positions=None, orders=None):
+        """
+        Square off everything and return a report:
+        exits, cancelled, failed, unconfirmed and time_to_flat (seconds).
+        """
+        start = time.monotonic()
+        with ThreadPoolExecutor(2) as pool:
+            pos_job = pool.submit(self._fetch, "position data", self.kite.positions) if positions is None else None
+            ord_job = pool.submit(self._fetch, "order data", self.kite.orders) if orders is None else None
+            positions = positions if positions is not None else ((pos_job.result() or {}).get("day") or [])
+            orders = orders if orders is not None else (ord_job.result() or [])
+
+        pending = [o for o in orders if o.get("status") in PENDING_STATUSES]
+        open_positions = [p for p in positions if p.get("quantity")]
+        open_positions.sort(key=lambda p: abs(p["quantity"] * (p.get("last_price") or 0)), reverse=True)
+        held = {p["tradingsymbol"] for p in open_positions}
+
+        self._cancelled, self._failed = [], []
+        with ThreadPoolExecutor(self.workers) as pool:
+            exit_jobs = {pool.submit(self._flatten, p, [o for o in pending if o["tradingsymbol"] == p["tradingsymbol"]]):
+                         p["tradingsymbol"] for p in open_positions}
+            cancel_jobs = [pool.submit(self._cancel, o) for o in pending if o["tradingsymbol"] not in held]
+            wait(list(exit_jobs) + cancel_jobs)
+
+        report = {"exits": {}, "cancelled": list(self._cancelled), "failed": list(self._failed), "unconfirmed": []}
+
+        for job, symbol in exit_jobs.items():
+            try:
+                order_id = job.result()
+                if order_id is not None:
+                    report["exits"][symbol] = order_id
+            except Exception as e:
+                self.log.error(f"unable to exit {symbol} ({e})")
+                report["failed"].append(symbol)
+
+        unconfirmed = self._confirm(report["exits"].values(), time.monotonic() + self.confirm_timeout)
+        report["unconfirmed"] = sorted(unconfirmed)
+        report["time_to_flat"] = time.monotonic() - start
+        self.log.info(f"square off: {len(report['exits'])} exits, {len(report['cancelled'])} cancels, "
+                      f"{len(report['failed'])} failed, {len(unconfirmed)} unconfirmed, "
+                      f"time to flat {report['time_to_flat']:.3f}s")
+        return report
@@ -5,41 +5,38 @@ import numpy as np
 import time
 import logging
 from kiteconnect import KiteConnect
+from indicators import supertrend, sl_price
+from bars import BarStore
+from checkpoint import Checkpoint
+from scheduler import SessionScheduler
+from squareoff import SquareOff
+import auth
+import latency
+from sharding import ShardedUniverse, SupertrendShard
+import signals
+import tools
+import watchlists
+from order_gateway import OrderGateway, PRIORITY_EXIT, PRIORITY_SL
+from trailing import TrailingStopManager
 from dotenv import load_dotenv
 
 load_dotenv()
 
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-
-formatter = logging.Formatter("%(asctime)s %(levelname)s :: %(message)s")
-
-stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(formatter)
-stream_handler.setLevel(logging.INFO)
-
-file_handler = logging.FileHandler("three_sup_trend.log")
-file_handler.setFormatter(formatter)
-file_handler.setLevel(logging.DEBUG)
-
-logger.addHandler(stream_handler)
-logger.addHandler(file_handler)
+logger = tools.createLogger(logfile="three_sup_trend.log", json_lines=bool(os.getenv('KITETRADE_LOG_JSON')))
 
 api_key = os.getenv('KITETRADE_API_KEY')
 api_secret = os.getenv('KITETRADE_API_SECRET')
 access_token = os.getenv('KITETRADE_ACCESS_TOKEN')
+kite_root = os.getenv('KITETRADE_ROOT') # set to point at a mock/proxy server
 logger.info(f"API KEY: {api_key}")
-kite = KiteConnect(api_key=api_key)
-session = None
-
-if not access_token:
-    print(kite.login_url())
-    request_token = input("Enter request token: ")
-    session = kite.generate_session(request_token, api_secret)
-    access_token = session["access_token"]
-    
-kite.set_access_token(access_token)
+kite = KiteConnect(api_key=api_key, root=kite_root)
+# the day's token is cached on disk, the request token prompt only comes up once a day
+access_token = auth.authenticate(kite, auth.prompt_login(api_secret), access_token, logger=logger)
+latency.instrument(kite)
+gateway = OrderGateway(kite, logger=logger)
+trailing = TrailingStopManager(gateway, logger=logger)
 logger.info("Authentication complete!")
+bar_store = BarStore(kite, logger=logger)
 
 #get dump of all NSE instruments
 logger.info("Getting instruments dump")
@@ -56,63 +53,10 @@ def instrumentLookup(instrument_df,symbol):
 
 
 def fetchOHLC(ticker,interval,duration):
-    """extracts historical data and outputs in the form of dataframe"""
+    """candles of the last `duration` days, derived from the ticker's 1-minute bar store (only new minutes are downloaded)"""
     # logger.info(f"fetch OHLC data for: {ticker}")
     instrument = instrumentLookup(instrument_df,ticker)
-    data = pd.DataFrame(kite.historical_data(instrument,dt.date.today()-dt.timedelta(duration), dt.date.today(),interval))
-    data.set_index("date",inplace=True)
-    return data
-
-def atr(DF,n):
-    "function to calculate True Range and Average True Range"
-    df = DF.copy()
-    df['H-L']=abs(df['high']-df['low'])
-    df['H-PC']=abs(df['high']-df['close'].shift(1))
-    df['L-PC']=abs(df['low']-df['close'].shift(1))
-    df['TR']=df[['H-L','H-PC','L-PC']].max(axis=1,skipna=False)
-    df['ATR'] = df['TR'].ewm(com=n,min_periods=n).mean()
-    return df['ATR']
-
-def supertrend(DF,n,m):
-    """function to calculate Supertrend given historical candle data
-        n = n day ATR - usually 7 day ATR is used
-        m = multiplier - usually 2 or 3 is used"""
-    df = DF.copy()
-    df['ATR'] = atr(df,n)
-    df["B-U"]=((df['high']+df['low'])/2) + m*df['ATR'] 
-    df["B-L"]=((df['high']+df['low'])/2) - m*df['ATR']
-    df["U-B"]=df["B-U"]
-    df["L-B"]=df["B-L"]
-    ind = df.index
-    for i in range(n,len(df)):
-        if df['close'][i-1]<=df['U-B'][i-1]:
-            df.loc[ind[i],'U-B']=min(df['B-U'][i],df['U-B'][i-1])
-        else:
-            df.loc[ind[i],'U-B']=df['B-U'][i]    
-    for i in range(n,len(df)):
-        if df['close'][i-1]>=df['L-B'][i-1]:
-            df.loc[ind[i],'L-B']=max(df['B-L'][i],df['L-B'][i-1])
-        else:
-            df.loc[ind[i],'L-B']=df['B-L'][i]  
-    df['Strend']=np.nan
-    for test in range(n,len(df)):
-        if df['close'][test-1]<=df['U-B'][test-1] and df['close'][test]>df['U-B'][test]:
-            df.loc[ind[test],'Strend']=df['L-B'][test]
-            break
-        if df['close'][test-1]>=df['L-B'][test-1] and df['close'][test]<df['L-B'][test]:
-            df.loc[ind[test],'Strend']=df['U-B'][test]
-            break
-    for i in range(test+1,len(df)):
-        if df['Strend'][i-1]==df['U-B'][i-1] and df['close'][i]<=df['U-B'][i]:
-            df.loc[ind[i],'Strend']=df['U-B'][i]
-        elif  df['Strend'][i-1]==df['U-B'][i-1] and df['close'][i]>=df['U-B'][i]:
-            df.loc[ind[i],'Strend']=df['L-B'][i]
-        elif df['Strend'][i-1]==df['L-B'][i-1] and df['close'][i]>=df['L-B'][i]:
-            df.loc[ind[i],'Strend']=df['L-B'][i]
-        elif df['Strend'][i-1]==df['L-B'][i-1] and df['close'][i]<=df['L-B'][i]:
-            df.loc[ind[i],'Strend']=df['U-B'][i]
-    return df['Strend']
-
+    return bar_store.history(instrument,interval,duration)
 
 def st_dir_refresh(ohlc,ticker):
     """function to check for supertrend reversal"""
@@ -130,17 +74,6 @@ def st_dir_refresh(ohlc,ticker):
     if ohlc["st3"][-1] < ohlc["close"][-1] and ohlc["st3"][-2] > ohlc["close"][-2]:
         st_dir[ticker][2] = "green"
 
-def sl_price(ohlc):
-    """function to calculate stop loss based on supertrends"""
-    st = ohlc.iloc[-1,[-3,-2,-1]]
-    if st.min() > ohlc["close"][-1]:
-        sl = (0.6*st.sort_values(ascending = True)[0]) + (0.4*st.sort_values(ascending = True)[1])
-    elif st.max() < ohlc["close"][-1]:
-        sl = (0.6*st.sort_values(ascending = False)[0]) + (0.4*st.sort_values(ascending = False)[1])
-    else:
-        sl = st.mean()
-    return round(sl,1)
-
 def placeSLOrder(symbol,buy_sell,quantity,sl_price):    
     logger.debug(f"[SL ORDER] {symbol}, {buy_sell}, {quantity}, {sl_price}")
     # Place an intraday stop loss order on NSE - handles market orders converted to limit orders
@@ -150,25 +83,26 @@ def placeSLOrder(symbol,buy_sell,quantity,sl_price):
     elif buy_sell == "sell":
         t_type=kite.TRANSACTION_TYPE_SELL
         t_type_sl=kite.TRANSACTION_TYPE_BUY
-    market_order = kite.place_order(tradingsymbol=symbol,
+    market_order = gateway.place_order(tradingsymbol=symbol,
                     exchange=kite.EXCHANGE_NSE,
                     transaction_type=t_type,
                     quantity=quantity,
                     order_type=kite.ORDER_TYPE_MARKET,
                     product=kite.PRODUCT_MIS,
-                    variety=kite.VARIETY_REGULAR)
+                    variety=kite.VARIETY_REGULAR).result()
     a = 0
     while a < 10:
         try:
             order_list = kite.orders()
             break
         except:
-            print("can't get orders..retrying")
+            logger.error("can't get orders..retrying")
             a+=1
     for order in order_list:
         if order["order_id"]==market_order:
             if order["status"]=="COMPLETE":
-                kite.place_order(tradingsymbol=symbol,
+                gateway.place_order(priority=PRIORITY_SL,
+                                tradingsymbol=symbol,
                                 exchange=kite.EXCHANGE_NSE,
                                 transaction_type=t_type_sl,
                                 quantity=quantity,
@@ -178,17 +112,13 @@ def placeSLOrder(symbol,buy_sell,quantity,sl_price):
                                 product=kite.PRODUCT_MIS,
                                 variety=kite.VARIETY_REGULAR)
             else:
-                kite.cancel_order(order_id=market_order,variety=kite.VARIETY_REGULAR)
+                gateway.cancel_order(priority=PRIORITY_EXIT,order_id=market_order,variety=kite.VARIETY_REGULAR)
 
 
 def ModifyOrder(order_id,price):    
-    # Modify order given order id
+    # Trail the stop of order id; only sent when it moved by at least a tick
     logger.debug(f"[MODIFY ORDER] {order_id}, {price}")
-    kite.modify_order(order_id=order_id,
-                    price=price,
-                    trigger_price=price,
-                    order_type=kite.ORDER_TYPE_SL,
-                    variety=kite.VARIETY_REGULAR)      
+    return trailing.update(order_id,price)
 
 
 def main(capital):
@@ -207,59 +137,93 @@ def main(capital):
         except:
             logger.error("can't extract order data..retrying")
             b+=1
+    trailing.sync(ord_df)
     
+    with latency.span("indicator_refresh"):
+        state = universe.cycle() if universe else indicatorState()
+    if state.empty:
+        return
+
+    with latency.span("signal_eval"):
+        actions = signals.evaluate(signals.build_table(state, pos_df, ord_df, capital))
+    signals.dispatch(actions, placeSLOrder, ModifyOrder, logger, entries=schedule.entries_allowed())
+
+
+def indicatorState():
+    """per ticker signal state (signals.STATE_COLUMNS), computed in this process"""
+    rows = {}
     for ticker in tickers:
-        print("starting passthrough for.....",ticker)
+        logger.debug(f"starting passthrough for..... {ticker}")
         try:
             ohlc = fetchOHLC(ticker,"5minute",4)
-            print(ohlc)
+            logger.debug(ohlc)
             ohlc["st1"] = supertrend(ohlc,7,3)
             ohlc["st2"] = supertrend(ohlc,10,3)
             ohlc["st3"] = supertrend(ohlc,11,2)
             
             st_dir_refresh(ohlc,ticker)
-            quantity = int(capital/ohlc["close"][-1])
-            if len(pos_df.columns)==0:
-                if st_dir[ticker] == ["green","green","green"]:
-                    placeSLOrder(ticker,"buy",quantity,sl_price(ohlc))
-                if st_dir[ticker] == ["red","red","red"]:
-                    placeSLOrder(ticker,"sell",quantity,sl_price(ohlc))
-            if len(pos_df.columns)!=0 and ticker not in pos_df["tradingsymbol"].tolist():
-                if st_dir[ticker] == ["green","green","green"]:
-                    placeSLOrder(ticker,"buy",quantity,sl_price(ohlc))
-                if st_dir[ticker] == ["red","red","red"]:
-                    placeSLOrder(ticker,"sell",quantity,sl_price(ohlc))
-            if len(pos_df.columns)!=0 and ticker in pos_df["tradingsymbol"].tolist():
-                if pos_df[pos_df["tradingsymbol"]==ticker]["quantity"].values[0] == 0:
-                    if st_dir[ticker] == ["green","green","green"]:
-                        placeSLOrder(ticker,"buy",quantity,sl_price(ohlc))
-                    if st_dir[ticker] == ["red","red","red"]:
-                        placeSLOrder(ticker,"sell",quantity,sl_price(ohlc))
-                if pos_df[pos_df["tradingsymbol"]==ticker]["quantity"].values[0] != 0:
-                    order_id = ord_df.loc[(ord_df['tradingsymbol'] == ticker) & (ord_df['status'].isin(["TRIGGER PENDING","OPEN"]))]["order_id"].values[0]
-                    ModifyOrder(order_id,sl_price(ohlc))
-        except:
-            logger.error("API error for ticker :",ticker)
+            stop = sl_price(ohlc)
+            rows[ticker] = {"close":ohlc["close"][-1], "long_stop":stop, "short_stop":stop}
+        except Exception as e:
+            logger.error(f"API error for ticker : {ticker} {e}")
+    if not rows:
+        return pd.DataFrame(columns=signals.STATE_COLUMNS)
+    state = pd.DataFrame.from_dict(rows, orient="index")
+    dirs = pd.DataFrame.from_dict(st_dir, orient="index").reindex(state.index)
+    state["long_ok"] = (dirs == "green").all(axis=1)
+    state["short_ok"] = (dirs == "red").all(axis=1)
+    return state
 
 
 #############################################################################################################
 
-tickers = ["IRFC","RVNL","HUDCO","SUZLON","IREDA",
-           "NBCC","IRCON","PNB","ZOMATO","BHEL","HDFCBANK"] 
+tickers = watchlists.THREE_SUP_TREND # edit the list in watchlists.py
 
 #tickers to track - recommended to use max movers from previous day
 capital = 5000 #position size
+checkpoint = Checkpoint("three_sup_trend", logger=logger)
+saved = checkpoint.load() or {}
 st_dir = {} #directory to store super trend status for each ticker
 for ticker in tickers:
-    st_dir[ticker] = ["None","None","None"]    
+    st_dir[ticker] = saved.get("st_dir", {}).get(ticker, ["None","None","None"])
+
+# KITETRADE_SHARDS=n runs the supertrend state in n worker processes (see sharding.py)
+shards = int(os.getenv("KITETRADE_SHARDS", "0"))
+universe = None
+schedule = SessionScheduler(logger=logger)
+if shards:
+    tokens = [int(instrumentLookup(instrument_df,ticker)) for ticker in tickers]
+    universe = ShardedUniverse(SupertrendShard, tickers, tokens, shards, kite_args=(api_key, access_token, kite_root),
+                               saved={ticker:{"st_dir":st_dir[ticker]} for ticker in tickers}, logger=logger)
+    universe.start()
+
+def strategyState():
+    if universe:
+        return {"st_dir":{ticker:state["st_dir"] for ticker,state in universe.state().items()}}
+    return {"st_dir":st_dir}
     
-starttime=time.time()
-timeout = time.time() + 60*60*1  # 60 seconds times 360 meaning 6 hrs
-while time.time() <= timeout:
-    try:
+def cycle():
+    with latency.span("strategy_cycle"):
         main(capital)
-        time.sleep(300 - ((time.time() - starttime) % 300.0))
-    except KeyboardInterrupt:
-        logger.error('\n\nKeyboard exception received. Exiting.')
-        exit()        
-
+    checkpoint.save(strategyState())
+
+def squareOff():
+    # only this strategy's instruments, other positions in the account are left alone
+    mine = set(tickers)
+    positions = [p for p in kite.positions()["day"] if p["tradingsymbol"] in mine]
+    orders = [o for o in kite.orders() if o["tradingsymbol"] in mine]
+    report = SquareOff(kite, gateway=gateway, logger=logger).run(positions, orders)
+    logger.info(f"square off complete in {report['time_to_flat']:.3f}s - exits: {report['exits']}")
+    if report["failed"] or report["unconfirmed"]:
+        logger.error(f"square off failed: {report['failed']} unconfirmed: {report['unconfirmed']}")
+
+# cycles every 5 minutes from the open, no new entries after the cut-off, flat before the broker's square-off
+schedule.on("square_off", squareOff)
+schedule.on("shutdown", gateway.stop)
+try:
+    schedule.run(task=cycle, interval=300)
+except KeyboardInterrupt:
+    logger.error('\n\nKeyboard exception received. Exiting.')
+finally:
+    if universe:
+        universe.stop()
@@ -0,0 +1,291 @@
+"""
+Shared helpers for the strategy scripts: argv parsing, rate limiting and logging setup.
+
+createLogger() puts a QueueHandler on the logger and runs the real
+console/file handlers on a background QueueListener thread, so the thread
+servicing the websocket never waits on terminal or disk I/O. Tick-level
+loggers add sampling and per-logger rate limits on top.
+"""
+import atexit
+import copy
+import json
+import logging
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = "%(asctime)s %(levelname)s :: %(message)s"
+QUEUE_SIZE = 10000
+
+_listeners = {}
+
+
+# =============================================
+
+def is_number(string):
+    """Checks if a string is a number"""
+    try:
+        float(string)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def read_single_argv(param, default=None):
+    """Reads the value following `param` from sys.argv"""
+    args = " ".join(sys.argv).strip().split(param)
+    if len(args) > 1:
+        default = args[1].strip().split(" ")[0]
+    return default
+
+
+# =============================================
+
+class TokenBucket():
+    """
+    Thread-safe token bucket.
+
+    :Parameters:
+        rate : float
+            tokens added per second
+        capacity : float
+            maximum burst, defaults to `rate`
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self, tokens=1):
+        """Take `tokens` if available right now."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None):
+        """Block until `tokens` are available; False if `timeout` runs out first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None:
+                if time.monotonic() + wait > deadline:
+                    return False
+            time.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket whose state lives in shared memory, for a limit shared by
+    worker processes (hand it to them as a Process argument).
+
+    :Parameters:
+        ctx : multiprocessing context
+            the context the workers are started with
+    """
+
+    def __init__(self, rate, capacity=None, ctx=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._state = (ctx or multiprocessing).Array("d", [self.capacity, time.monotonic()])
+        self._lock = self._state.get_lock()
+
+    @property
+    def _tokens(self):
+        return self._state[0]
+
+    @_tokens.setter
+    def _tokens(self, value):
+        self._state[0] = value
+
+    @property
+    def _last(self):
+        return self._state[1]
+
+    @_last.setter
+    def _last(self, value):
+        self._state[1] = value
+
+
+# =============================================
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {"ts": record.created, "level": record.levelname,
+                 "logger": record.name, "thread": record.threadName,
+                 "msg": record.getMessage()}
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks the caller.
+
+    Records are enqueued with their message merged with its args (the args
+    may be mutable objects the caller changes afterwards); the rest of the
+    formatting happens on the listener thread. Records are dropped, with a
+    count, when the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # a copy, so other handlers of the logger still see the original msg and args
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per logger: lets through `rate` records per second with
+    bursts up to `burst`, and reports how many were suppressed.
+    """
+
+    def __init__(self, rate, burst=None):
+        super().__init__()
+        self.bucket = TokenBucket(rate, burst)
+        self._suppressed = 0
+
+    def filter(self, record):
+        if not self.bucket.try_acquire():
+            self._suppressed += 1
+            return False
+        if self._suppressed:
+            record.msg = "{} (suppressed {} messages)".format(record.msg, self._suppressed)
+            self._suppressed = 0
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Passes one record in every `every` (warnings and above always pass)."""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, int(every))
+        self._seen = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        self._seen += 1
+        return self._seen % self.every == 1 or self.every == 1
+
+
+# =============================================
+
+def createLogger(name=None, level=logging.DEBUG, logfile=None, console_level=logging.INFO,
+                 json_lines=False, queued=True):
+    """
+    Configure logger `name` (the root logger when None) and return it.
+
+    :Parameters:
+        name : str
+            logger name, None for the root logger
+        level : int
+            level of the logger and of the file handler
+        logfile : str
+            file to write to; one per strategy script
+        console_level : int
+            level of the terminal handler
+        json_lines : bool
+            write the file as JSON lines instead of formatted text
+        queued : bool
+            run handlers on a background thread behind a non-blocking queue
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    stopLogger(name)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    stream_handler.setLevel(console_level)
+    handlers.append(stream_handler)
+
+    if logfile:
+        file_handler = logging.FileHandler(logfile)
+        file_handler.setFormatter(JsonFormatter() if json_lines else formatter)
+        file_handler.setLevel(level)
+        handlers.append(file_handler)
+
+    if not queued:
+        for handler in handlers:
+            logger.addHandler(handler)
+        return logger
+
+    log_queue = queue.Queue(QUEUE_SIZE)
+    logger.addHandler(NonBlockingQueueHandler(log_queue))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners[name] = listener
+    return logger
+
+
+def createTickLogger(name, sample_every=1, max_per_sec=None, level=logging.DEBUG):
+    """
+    Child logger for per-tick messages with sampling and a rate limit.
+
+    Records propagate to the queued handlers of its parent, so it costs
+    the tick thread a filter check and a queue put at most.
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    for f in list(logger.filters):
+        logger.removeFilter(f)
+    if sample_every > 1:
+        logger.addFilter(SampleFilter(sample_every))
+    if max_per_sec:
+        logger.addFilter(RateLimitFilter(max_per_sec))
+    return logger
+
+
+def stopLogger(name=None):
+    """Flush and stop the background listener of logger `name`."""
+    listener = _listeners.pop(name, None)
+    if listener is not None:
+        listener.stop()
+
+
+@atexit.register
+def _stop_all():
+    for name in list(_listeners):
+        stopLogger(name)
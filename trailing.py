@@ -0,0 +1,136 @@
+"""
+Trailing stop modification queue.
+
+Remembers the trigger last sent for every stop loss order and only sends
+a modify_order when the new stop moves by at least `threshold`. While a
+modification for an order is in flight further updates are coalesced so
+only the latest is sent when it completes. Modifications go out through
+the stop loss lane of the OrderGateway, so a cycle with many positions
+queues them behind the shared rate limit instead of blocking on each.
+"""
+import logging
+import threading
+import time
+from functools import partial
+
+from order_gateway import PRIORITY_SL
+
+PENDING_STATUSES = ("TRIGGER PENDING", "OPEN")
+
+
+def round_tick(price, tick_size=0.05):
+    """Round `price` to the exchange tick size."""
+    return round(round(price / tick_size) * tick_size, 2)
+
+
+class TrailingStopManager():
+    """
+    Coalescing, diff-based stop loss modifier.
+
+    :Parameters:
+        gateway : OrderGateway
+            gateway the modifications are submitted through
+        tick_size : float
+            exchange tick size the stops are rounded to
+        threshold : float
+            minimum change in trigger worth a modification, defaults to one tick
+    """
+
+    def __init__(self, gateway, tick_size=0.05, threshold=None, order_type="SL",
+                 variety="regular", logger=None):
+        self.gateway = gateway
+        self.tick_size = tick_size
+        self.threshold = threshold if threshold is not None else tick_size
+        self.order_type = order_type
+        self.variety = variety
+        self.log = logger or logging.getLogger(__name__)
+        self.stats = {"sent": 0, "skipped": 0, "coalesced": 0, "failed": 0}
+
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._last = {}      # order_id -> trigger on the order
+        self._inflight = {}  # order_id -> trigger being sent
+        self._latest = {}    # order_id -> newest trigger waiting for the in-flight one
+
+    # ---------------------------------------------
+    def sync(self, ord_df):
+        """Learn the triggers of pending orders from the order book and forget finished ones."""
+        if ord_df is None or len(ord_df.columns) == 0:
+            return
+        pending = ord_df[ord_df["status"].isin(PENDING_STATUSES)]
+        with self._lock:
+            live = set(pending["order_id"])
+            for order_id in list(self._last):
+                if order_id not in live and order_id not in self._inflight:
+                    del self._last[order_id]
+            if "trigger_price" in pending.columns:
+                for order_id, trigger in zip(pending["order_id"], pending["trigger_price"]):
+                    if order_id not in self._inflight and trigger:
+                        self._last[order_id] = float(trigger)
+
+    def _changed(self, order_id, price):
+        last = self._last.get(order_id)
+        return last is None or abs(price - last) >= self.threshold - 1e-9
+
+    def update(self, order_id, price):
+        """Request the stop of `order_id` to move to `price`; returns True if a modification was queued."""
+        price = round_tick(price, self.tick_size)
+        with self._lock:
+            if order_id in self._inflight:
+                if order_id in self._latest:
+                    self.stats["coalesced"] += 1
+                self._latest[order_id] = price
+                return False
+            if not self._changed(order_id, price):
+                self.stats["skipped"] += 1
+                return False
+            self._reserve(order_id, price)
+        self._submit(order_id, price)
+        return True
+
+    def forget(self, order_id):
+        with self._lock:
+            self._last.pop(order_id, None)
+            self._latest.pop(order_id, None)
+
+    def flush(self, timeout=None):
+        """Wait until no modification is in flight; False if `timeout` runs out first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    # ---------------------------------------------
+    def _reserve(self, order_id, price):
+        """Called with the lock held: marks the modification in flight before it is sent."""
+        self._inflight[order_id] = price
+        self.stats["sent"] += 1
+
+    def _submit(self, order_id, price):
+        """Called without the lock: the callback runs on this thread when the future is already done."""
+        future = self.gateway.modify_order(priority=PRIORITY_SL, order_id=order_id, price=price,
+                                           trigger_price=price, order_type=self.order_type,
+                                           variety=self.variety)
+        future.add_done_callback(partial(self._done, order_id, price))
+
+    def _done(self, order_id, price, future):
+        error = future.exception()
+        resend = None
+        with self._lock:
+            self._inflight.pop(order_id, None)
+            if error is None:
+                self._last[order_id] = price
+            else:
+                self.stats["failed"] += 1
+                self.log.error(f"[TRAIL] modify {order_id} -> {price} failed: {error}")
+            latest = self._latest.pop(order_id, None)
+            if latest is not None and self._changed(order_id, latest):
+                self._reserve(order_id, latest)
+                resend = latest
+            self._idle.notify_all()
+        if resend is not None:
+            self._submit(order_id, resend)
@@ -0,0 +1,12 @@
+"""
+Instrument lists traded by the strategies, shared by the standalone
+scripts and the strategy host.
+"""
+
+#####################update ticker list######################################
+RENKO_ATR = ["ABB","ADANIENSOL","ADANIENT","ADANIGREEN","ADANIPORTS","ATGL","AWL","AMBUJACEM","APOLLOHOSP","ASIANPAINT","DMART","AXISBANK","BAJAJ-AUTO","BAJFINANCE","BAJAJFINSV","BAJAJHLDNG","BANKBARODA","BERGEPAINT","BEL","BPCL","BHARTIARTL","BOSCHLTD","BRITANNIA","CANBK","CHOLAFIN","CIPLA","COALINDIA","COLPAL","DLF","DABUR","DIVISLAB","DRREDDY","EICHERMOT","GAIL","GODREJCP","GRASIM","HCLTECH","HDFCBANK","HDFCLIFE","HAVELLS","HEROMOTOCO","HINDALCO","HAL","HINDUNILVR","ICICIBANK","ICICIGI","ICICIPRULI","ITC","IOC","IRCTC","INDUSINDBK","NAUKRI","INFY","INDIGO","JSWSTEEL","JINDALSTEL","KOTAKBANK","LTIM","LT","LICI","M&M","MARICO","MARUTI","MUTHOOTFIN","NTPC","NESTLEIND","ONGC","PIIND","PIDILITIND","POWERGRID","PGHH","PNB","RELIANCE","SBICARD","SBILIFE","SRF","MOTHERSON","SHREECEM","SHRIRAMFIN","SIEMENS","SBIN","SUNPHARMA","TVSMOTOR","TCS","TATACONSUM","TATAMTRDVR","TATAMOTORS","TATAPOWER","TATASTEEL","TECHM","TITAN","TORNTPHARM","TRENT","UPL","ULTRACEMCO","MCDOWELL-N","VBL","VEDL","WIPRO","ZOMATO","ZYDUSLIFE"]
+
+#tickers to track - recommended to use max movers from previous day
+THREE_SUP_TREND = ["IRFC","RVNL","HUDCO","SUZLON","IREDA",
+                   "NBCC","IRCON","PNB","ZOMATO","BHEL","HDFCBANK"]
+#############################################################################
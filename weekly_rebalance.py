@@ -1,102 +1,109 @@
 import numpy as np
 import pandas as pd
-import yfinance as yf
 import datetime as dt
-import copy
+import hashlib
 import matplotlib
 import matplotlib.pyplot as plt
-
-# Adjust matplotlib backend if necessary
-matplotlib.use("QtAgg")
+import kpi
+from market_data import MarketData
 
 
+# KPIs of a weekly return frame ("mon_ret" column); see kpi.py for other periodicities
 def CAGR(DF):
-    df = DF.copy()
-    df["cum_return"] = (1 + df["mon_ret"]).cumprod()
-    n = len(df) / 52  # Adjusted for weekly returns
-    CAGR = (df["cum_return"].tolist()[-1]) ** (1 / n) - 1
-    return CAGR
+    return kpi.cagr(DF["mon_ret"], "weekly")
 
 def volatility(DF):
-    df = DF.copy()
-    vol = df["mon_ret"].std() * np.sqrt(52)  # Adjusted for weekly returns
-    return vol
+    return kpi.volatility(DF["mon_ret"], "weekly")
 
 def sharpe(DF, rf):
-    df = DF.copy()
-    sr = (CAGR(df) - rf) / volatility(df)
-    return sr
+    return kpi.sharpe(DF["mon_ret"], rf, "weekly")
 
 def max_dd(DF):
-    df = DF.copy()
-    df["cum_return"] = (1 + df["mon_ret"]).cumprod()
-    df["cum_roll_max"] = df["cum_return"].cummax()
-    df["drawdown"] = df["cum_roll_max"] - df["cum_return"]
-    df["drawdown_pct"] = df["drawdown"] / df["cum_roll_max"]
-    max_dd = df["drawdown_pct"].max()
-    return max_dd
-
-# Download historical data (weekly) for NIFTY 50 stocks
+    return kpi.max_drawdown(DF["mon_ret"])
 
+# NIFTY 50 constituents
 tickers = ["ADANIENT","ADANIPORTS","APOLLOHOSP","ASIANPAINT","AXISBANK","BAJAJ-AUTO","BAJFINANCE","BAJAJFINSV","BPCL","BHARTIARTL","BRITANNIA","CIPLA","COALINDIA","DIVISLAB","DRREDDY","EICHERMOT","GRASIM","HCLTECH","HDFCBANK","HEROMOTOCO","HINDALCO","HINDUNILVR","ICICIBANK","ITC","INDUSINDBK","INFY","JSWSTEEL","KOTAKBANK","LT","M&M","MARUTI","NTPC","NESTLEIND","ONGC","POWERGRID","RELIANCE","SBIN","SUNPHARMA","TCS","TATACONSUM","TATAMOTORS","TATASTEEL","TECHM","TITAN","UPL","ULTRACEMCO","WIPRO"]
 
-ohlc_week = {}  # directory with ohlc value for each stock            
-start = dt.datetime.today() - dt.timedelta(3650)  # 10 years of data
-end = dt.datetime.today()
-
-for ticker in tickers:
-    ohlc_week[ticker] = yf.download(f"{ticker}.NS", start, end, interval='1wk')
-    ohlc_week[ticker].dropna(inplace=True, how="all")
-
-tickers = ohlc_week.keys()  # redefine tickers variable after removing any tickers with corrupted data
-
-# converting monthly return calculation to weekly
-ohlc_dict = copy.deepcopy(ohlc_week)
-return_df = pd.DataFrame()
-for ticker in tickers:
-    print("calculating weekly return for ", ticker)
-    ohlc_dict[ticker]["mon_ret"] = ohlc_dict[ticker]["Adj Close"].pct_change()  # "mon_ret" now holds weekly returns
-    return_df[ticker] = ohlc_dict[ticker]["mon_ret"]
-return_df.dropna(inplace=True)
+def weekly_returns(tickers, start, end, offline=None):
+    """Aligned weekly return matrix for NSE `tickers`, from the local market data cache"""
+    return MarketData(interval="1wk", offline=offline).returns(tickers, start, end)
 
-# function to calculate portfolio return iteratively with weekly rebalance
+# function to calculate portfolio return with weekly rebalance
 def pflio(DF, m, x):
-    df = DF.copy()
-    portfolio = []
-    weekly_ret = [0]
-    for i in range(len(df)):
-        if len(portfolio) > 0:
-            weekly_ret.append(df[portfolio].iloc[i, :].mean())
-            bad_stocks = df[portfolio].iloc[i, :].sort_values(ascending=True)[:x].index.values.tolist()
-            portfolio = [t for t in portfolio if t not in bad_stocks]
-        fill = m - len(portfolio)
-        new_picks = df.iloc[i, :].sort_values(ascending=False)[:fill].index.values.tolist()
-        portfolio = portfolio + new_picks
-    weekly_ret_df = pd.DataFrame(np.array(weekly_ret), columns=["mon_ret"])  # Consider renaming "mon_ret" to "weekly_ret" for clarity
-    return weekly_ret_df
-
-
-#calculating overall strategy's KPIs
-strategy_cagr = CAGR(pflio(return_df,15,3))
-strategy_sharpe = sharpe(pflio(return_df,15,3),0.07)
-strategy_max_dd = max_dd(pflio(return_df,15,3)) 
-
-print(f"CAGR: {round(strategy_cagr * 100, 1)}% Sharpe: {round(strategy_sharpe,1)} Max Drawdown: {round(strategy_max_dd * 100,1)}%")
-
-#calculating KPIs for Index buy and hold strategy over the same period
-Nifty = yf.download("^NSEI",dt.date.today()-dt.timedelta(3650),dt.date.today(),interval='1wk')
-Nifty["mon_ret"] = Nifty["Adj Close"].pct_change().fillna(0)
-nifty_cagr = CAGR(Nifty)
-nifty_sharpe = sharpe(Nifty,0.07)
-nifty_max_dd = max_dd(Nifty)
-print(f"NIFTY CAGR: {round(nifty_cagr * 100, 1)}% Sharpe: {round(nifty_sharpe,1)} Max Drawdown: {round(nifty_max_dd * 100,1)}%")
-
-#visualization
-fig, ax = plt.subplots()
-plt.plot((1+pflio(return_df,6,4)).cumprod())
-plt.plot((1+Nifty["mon_ret"].reset_index(drop=True)).cumprod())
-plt.title("Index Return vs Strategy Return")
-plt.ylabel("cumulative return")
-plt.xlabel("months")
-ax.legend(["Strategy Return","Index Return"])
-plt.show()
+    """
+    Hold m stocks; every period drop the x worst performers of the portfolio
+    and refill from the best performers of the whole universe.
+    Results are memoized on (data, m, x) for the last PFLIO_CACHE_SIZE calls.
+    """
+    key = (_returns_key(DF), m, x)
+    weekly_ret = _pflio_cache.pop(key, None)
+    if weekly_ret is None:
+        weekly_ret = pflio_array(DF.to_numpy(dtype=float), m, x)
+        if len(_pflio_cache) >= PFLIO_CACHE_SIZE:
+            _pflio_cache.pop(next(iter(_pflio_cache)))  # least recently used
+    _pflio_cache[key] = weekly_ret
+    return pd.DataFrame(weekly_ret.copy(), columns=["mon_ret"])
+
+PFLIO_CACHE_SIZE = 32
+_pflio_cache = {}  # insertion ordered: re-inserted on every hit, oldest first
+
+def _returns_key(df):
+    digest = hashlib.sha1(np.ascontiguousarray(df.to_numpy(dtype=float)).tobytes())
+    digest.update(repr(df.shape).encode())
+    digest.update(repr(list(df.columns)).encode())
+    return digest.hexdigest()
+
+def pflio_array(ret, m, x):
+    """
+    pflio on a (periods, stocks) return array. The portfolio is a list of
+    stocks in holding order, since a refill can pick a stock that is already
+    held; such a stock weighs double in the mean and is dropped entirely when
+    one copy is among the x worst. Sorts are stable with missing returns last,
+    so ties (NaN returns in particular) go by holding order for the drops and
+    by column order for the picks, as pandas sort_values does.
+    """
+    periods, n = ret.shape
+    missing = np.isnan(ret)
+    pick_key = np.where(missing, np.inf, -ret)
+    drop_key = np.where(missing, np.inf, ret)
+    held = np.empty(0, dtype=np.int64)
+    weekly_ret = np.zeros(periods)
+    for i in range(periods):
+        if held.size:
+            valid = ~missing[i, held]
+            weekly_ret[i] = ret[i, held[valid]].mean() if valid.any() else np.nan
+            bad = held[np.argsort(drop_key[i, held], kind="stable")[:x]]
+            held = held[~np.isin(held, bad)]
+        fill = m - held.size
+        if fill > 0:
+            held = np.concatenate((held, np.argsort(pick_key[i], kind="stable")[:fill]))
+    return weekly_ret
+
+if __name__ == "__main__":
+    # Adjust matplotlib backend if necessary
+    matplotlib.use("QtAgg")
+
+    start = dt.datetime.today() - dt.timedelta(3650)  # 10 years of data
+    end = dt.datetime.today()
+    return_df = weekly_returns(tickers, start, end)
+
+    #calculating overall strategy's KPIs
+    strategy = kpi.summary(pflio(return_df,15,3)["mon_ret"], "weekly", rf=0.07)
+
+    print(f"CAGR: {round(strategy['cagr'] * 100, 1)}% Sharpe: {round(strategy['sharpe'],1)} Max Drawdown: {round(strategy['max_dd'] * 100,1)}%")
+
+    #calculating KPIs for Index buy and hold strategy over the same period
+    Nifty = MarketData(interval="1wk").history(["^NSEI"],dt.date.today()-dt.timedelta(3650),dt.date.today())["^NSEI"].copy()
+    Nifty["mon_ret"] = Nifty["Adj Close"].pct_change().fillna(0)
+    nifty = kpi.summary(Nifty["mon_ret"], "weekly", rf=0.07)
+    print(f"NIFTY CAGR: {round(nifty['cagr'] * 100, 1)}% Sharpe: {round(nifty['sharpe'],1)} Max Drawdown: {round(nifty['max_dd'] * 100,1)}%")
+
+    #visualization
+    fig, ax = plt.subplots()
+    plt.plot((1+pflio(return_df,6,4)).cumprod())
+    plt.plot((1+Nifty["mon_ret"].reset_index(drop=True)).cumprod())
+    plt.title("Index Return vs Strategy Return")
+    plt.ylabel("cumulative return")
+    plt.xlabel("months")
+    ax.legend(["Strategy Return","Index Return"])
+    plt.show()